@@ -2,84 +2,183 @@
 # eesti keele ühendkorpusest Sketch Engine'i API kaudu.
 # Autorid: Esta Prangel, Eleri Aedmaa
 
-import requests
+import json
 import pandas as pd
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+# Ühine Sketch Engine'i HTTP-kiht asub katse3 kaustas
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'katse3'))
+from local_corpus import LocalCorpusTransport
+from ske_cache import ResponseCache
+from ske_transport import SkeTransport
+
 
 load_dotenv(".env")
 
 username = os.getenv("USER")
 api_key = os.getenv("KEY")
 
+CORPUS = 'preloaded/estonian_nc23'
+# Mitu lemmat küsitakse ühe wordlist-päringuga (wlpat regulaaravaldise alternatsioon)
+WORDLIST_BATCH_SIZE = 50
+# Mitu žanrijaotuse päringut korraga
+GENRE_WORKERS = 4
+# Iga valmis lemma tulemus lisatakse kohe sellesse faili; katkestuse järel jätkatakse sealt
+PARTIAL_PATH = 'sagedused_se_osaline.jsonl'
+# Sketch Engine'i regulaaravaldiste erimärgid (re.escape paomärgistaks ka nt '-' ja tühiku)
+SKE_REGEX_SPECIAL = set('\\.^$*+?()[]{}|')
+
+# Kohaliku korpuse indeks (.idx) või VRT-fail; kui määratud, ei pöörduta Sketch Engine'i poole
+LOCAL_CORPUS = os.getenv("LOCAL_CORPUS")
+
+if LOCAL_CORPUS:
+    transport = LocalCorpusTransport.from_file(LOCAL_CORPUS)
+else:
+    transport = SkeTransport(auth=(username, api_key),
+                             cache=ResponseCache("ske_cache.sqlite"),
+                             max_in_flight=GENRE_WORKERS)
+
+
+def ske_escape(word):
+    """Escape the characters that are special in Sketch Engine regular expressions"""
+    return ''.join('\\' + c if c in SKE_REGEX_SPECIAL else c for c in word)
+
+
+def get_word_stats(words):
+    """Fetch frequencies of many lemmas with one wordlist request"""
+    params = {
+        'corpname': CORPUS,
+        'wlattr': 'lemma',
+        'wltype': 'simple',
+        'wlpat': '(' + '|'.join(ske_escape(w) for w in words) + ')',
+        'wlmaxitems': 2 * len(words),
+        'format': 'json'
+    }
+    return transport.get_json('wordlist', params)
+
 
-def get_word_stats(word):
-    url = 'https://api.sketchengine.eu/bonito/run.cgi/wordlist'
+def get_single_word_stats(word):
+    """Fetch the frequency of one lemma (for lemmas a batch request did not return); None if not found"""
     params = {
-        'corpname': 'preloaded/estonian_nc23',
+        'corpname': CORPUS,
         'wlattr': 'lemma',
         'wltype': 'simple',
-        'wlpat': word,
+        'wlpat': ske_escape(word),
         'format': 'json'
     }
-    response = requests.get(url, params=params, auth=(username, api_key))
-    return response.json()
+    word_data = transport.get_json('wordlist', params)
+    return next((item for item in word_data.get('Items', []) if item['str'] == word), None)
 
 
 def get_genre_distribution(word):
     q = 'q[lemma="' + word + '"]'
-    url = 'https://api.sketchengine.eu/bonito/run.cgi/freqs'
     params = {
-        'corpname': 'preloaded/estonian_nc23',
+        'corpname': CORPUS,
         'fcrit': 'doc.genre 0',
         'q': q,
         'format': 'json'
     }
-    response = requests.get(url, params=params, auth=(username, api_key))
-    return response.json()
+    return transport.get_json('freqs', params)
+
+
+def parse_genres(genre_data):
+    genres = {}
+    if 'Blocks' in genre_data:
+        for block in genre_data['Blocks']:
+            if 'Items' in block:
+                for item in block['Items']:
+                    genre_list = item.get('Word', 'tundmatu')
+                    if isinstance(genre_list, list) and genre_list:
+                        genre_name = genre_list[0].get("n", "tundmatu")
+                    else:
+                        genre_name = "unknown"
+                    genres[genre_name + '_abs'] = item.get('frq', 0)
+                    genres[genre_name + '_rel'] = item.get('rel', 0)
+    return genres
+
+
+def load_partial(path):
+    """Read lemma results written by earlier (possibly interrupted) runs"""
+    results = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[entry['märksõna']] = entry
+    return results
 
 
 df = pd.read_excel('katse2_sisend.xlsx', usecols=[0, 1], names=['märksõna', 'tähendus'])
+df = df.dropna(subset=['märksõna'])
+df['märksõna'] = df['märksõna'].astype(str).str.strip()
+
+# Korduvad märksõnad (eri tähendused) küsitakse ainult üks kord
+lemmas = list(dict.fromkeys(df['märksõna']))
+results = load_partial(PARTIAL_PATH)
+todo = [w for w in lemmas if w not in results]
+print(f"Märksõnu: {len(df)}, erinevaid lemmasid: {len(lemmas)}, "
+      f"varem valmis: {len(lemmas) - len(todo)}")
+
+frequencies = {}
+for i in range(0, len(todo), WORDLIST_BATCH_SIZE):
+    batch = todo[i:i + WORDLIST_BATCH_SIZE]
+    try:
+        word_data = get_word_stats(batch)
+    except Exception as e:
+        print(f"Viga sagedusloendi päringus ({batch[0]}...{batch[-1]}): {str(e)}")
+        continue
+    # Ainult täpne vaste: teise suurtähestusega lemma (nt 'Eesti' sõna 'eesti' asemel) ei ole sama lemma
+    found = {item['str']: item for item in word_data.get('Items', [])}
+    for w in batch:
+        item = found.get(w)
+        if item is None:
+            # Partiist puudunud lemma küsitakse eraldi, mitte ei kirjutata sageduseks 0
+            try:
+                item = get_single_word_stats(w)
+            except Exception as e:
+                print(f"Viga sagedusloendi päringus ({w}): {str(e)}")
+                continue
+            if item is None:
+                print(f"Lemmat '{w}' korpusest ei leitud")
+        frequencies[w] = {
+            'kogusagedus': item['frq'] if item else 0,
+            'suhteline sagedus': item['relfreq'] if item else 0,
+        }
+
+with open(PARTIAL_PATH, 'a', encoding='utf-8') as partial, \
+        ThreadPoolExecutor(max_workers=GENRE_WORKERS) as executor:
+    futures = {executor.submit(get_genre_distribution, w): w for w in todo if w in frequencies}
+    for future in as_completed(futures):
+        w = futures[future]
+        try:
+            word_row = {'märksõna': w, **frequencies[w], **parse_genres(future.result())}
+        except Exception as e:
+            print(f"Viga sõnaga '{w}': {str(e)}")
+            continue
+        print(word_row)
+        results[w] = word_row
+        partial.write(json.dumps(word_row, ensure_ascii=False) + '\n')
+        partial.flush()
 
-data = []
+transport.stats.print_summary()
 
-for _, row in df.iterrows():
-    w = row['märksõna']
-    col_b = row['tähendus']
+missing = [w for w in lemmas if w not in results]
+if missing:
+    print(f"Puuduvad tulemused ({len(missing)}), käivita skript uuesti: {', '.join(missing)}")
 
-    try:
-        word_row = {'märksõna': w, 'tähendus': col_b}
-        word_data = get_word_stats(w)
-        if 'Items' in word_data and word_data['Items']:
-            item = word_data['Items'][0]
-            word_row['kogusagedus'] = item['frq']
-            word_row['suhteline sagedus'] = item['relfreq']
-        else:
-            word_row['kogusagedus'] = 0
-            word_row['suhteline sagedus'] = 0
-
-        genre_data = get_genre_distribution(w)
-
-        if 'Blocks' in genre_data:
-            for block in genre_data['Blocks']:
-                if 'Items' in block:
-                    for item in block['Items']:
-                        genre_list = item.get('Word', 'tundmatu')
-                        if isinstance(genre_list, list) and genre_list:
-                            genre_name = genre_list[0].get("n", "tundmatu")
-                        else:
-                            genre_name = "unknown"
-                        genre_frq = item.get('frq', 0)
-                        genre_rel = item.get('rel', 0)
-                        word_row[genre_name + '_abs'] = genre_frq
-                        word_row[genre_name + '_rel'] = genre_rel
-        print(word_row)
+data = []
+for _, row in df.iterrows():
+    if row['märksõna'] in results:
+        word_row = {'märksõna': row['märksõna'], 'tähendus': row['tähendus']}
+        word_row.update({k: v for k, v in results[row['märksõna']].items() if k != 'märksõna'})
         data.append(word_row)
 
-    except Exception as e:
-        print(f"Viga sõnaga '{w}': {str(e)}")
-
 output_df = pd.DataFrame(data)
 
 output_df.columns = output_df.columns.str.replace('===NONE===', 'none', regex=False)
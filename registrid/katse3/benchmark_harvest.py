@@ -0,0 +1,114 @@
+#Konkordantside kogumise jõudlustest kohaliku Sketch Engine'i asendaja (mock_ske_server.py) vastu.
+#Iga stsenaarium käivitatakse eraldi protsessis, et tipp-RSS oleks stsenaariumipõhine, ja mõõdetakse
+#sõnu minutis, lehekülgi sekundis, korduskatseid ja 429-vastuseid. Tulemused: benchmark_results.json
+#
+#Käivitamine: python benchmark_harvest.py
+
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List
+
+from harvest_journal import HarvestJournal
+from kwic_ske_api import SketchEngineAPI
+from mock_ske_server import MockSkeServer
+from ske_transport import SkeTransport
+
+
+def run_scenario(scenario: Dict, base_url: str, words: List[str]) -> Dict:
+    """Harvest the words against the mock server in this process and return the measurements"""
+    transport = SkeTransport(base_url, pool_size=max(10, scenario['max_in_flight']),
+                             max_in_flight=scenario['max_in_flight'],
+                             backoff_factor=0.05, max_backoff=1.0)
+    api = SketchEngineAPI("", "", max_workers=scenario['max_workers'], transport=transport,
+                          sample_size=scenario.get('sample_size'),
+                          merge_contexts=scenario.get('merge_contexts', False),
+                          dedup_threshold=scenario.get('dedup_threshold'))
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        journal = HarvestJournal(os.path.join(output_dir, "harvest_journal.jsonl"))
+        # Sõnade edenemise väljatrükk ei ole mõõtmise osa
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            started = time.perf_counter()
+            results = api.harvest_words(words, "mock", journal,
+                                        max_concurrent_words=scenario['max_concurrent_words'],
+                                        output_dir=output_dir)
+            elapsed = time.perf_counter() - started
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    stats = transport.stats.summary()
+    transport.close()
+    done = sum(1 for entry in results.values() if entry['status'] == 'done')
+    pages = stats['requests'] - stats['retries']
+    return {
+        'name': scenario['name'],
+        'words': len(words),
+        'words_done': done,
+        'lines': sum(entry['written'] for entry in results.values()),
+        'seconds': round(elapsed, 2),
+        'words_per_min': round(60 * len(words) / elapsed, 1),
+        'pages_per_sec': round(pages / elapsed, 2),
+        # Linuxis on ru_maxrss kilobaitides
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'retries': stats['retries'],
+        'rate_limited': stats['rate_limited'],
+        'failures': stats['failures'],
+        'latency_p50': stats.get('latency_p50'),
+        'latency_p95': stats.get('latency_p95'),
+    }
+
+
+def print_table(results: List[Dict]):
+    header = f"{'scenario':<28}{'words/min':>10}{'pages/s':>9}{'RSS MB':>8}{'retries':>9}{'429':>6}{'done':>7}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['name']:<28}{r['words_per_min']:>10}{r['pages_per_sec']:>9}{r['peak_rss_mb']:>8}"
+              f"{r['retries']:>9}{r['rate_limited']:>6}{r['words_done']:>4}/{r['words']}")
+
+
+def main():
+    # Konfiguratsioon
+    WORDS = [f"sõna{i}" for i in range(8)]
+    HITS_PER_WORD = 5000  # 5 lehekülge sõna kohta (pagesize 1000)
+    LATENCY = 0.05  # sekundit päringu kohta
+    RATE_LIMIT_EVERY = 0  # nt 10, et iga kümnes päring saaks 429
+    SCENARIOS = [
+        {'name': 'sequential', 'max_workers': 1, 'max_concurrent_words': 1, 'max_in_flight': 1},
+        {'name': '4 pages', 'max_workers': 4, 'max_concurrent_words': 1, 'max_in_flight': 4},
+        {'name': '4 pages x 2 words', 'max_workers': 4, 'max_concurrent_words': 2, 'max_in_flight': 6},
+        {'name': '4 pages x 2 words, 429/10', 'max_workers': 4, 'max_concurrent_words': 2, 'max_in_flight': 6,
+         'rate_limit_every': 10},
+    ]
+
+    results = []
+    for scenario in SCENARIOS:
+        with MockSkeServer(fullsize=HITS_PER_WORD, latency=LATENCY,
+                           rate_limit_every=scenario.get('rate_limit_every', RATE_LIMIT_EVERY)) as server:
+            # Leheküljed tehakse valmis enne mõõtmist, et aeg ei kuluks serveri JSON-i kokkupanekule
+            server.prerender(WORDS, pagesize=1000)
+            # Uus protsess igale stsenaariumile, et RSS ja ühenduste kogum ei jääks eelmisest
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_scenario, scenario, server.url, WORDS).result()
+            result['server_requests'] = dict(server.requests)
+        results.append(result)
+        print(f"✅ {scenario['name']}: {result['words_per_min']} words/min, {result['pages_per_sec']} pages/s")
+
+    print()
+    print_table(results)
+
+    with open('benchmark_results.json', 'w', encoding='utf-8') as f:
+        json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f,
+                  ensure_ascii=False, indent=2)
+    print(f"\n📁 benchmark_results.json")
+
+if __name__ == "__main__":
+    main()
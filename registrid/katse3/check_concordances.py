@@ -20,6 +20,20 @@ def find_matching_file(keyword, directory="."):
     return None
 
 
+def normalize_content(content):
+    """
+    Normalize concordance text for sentence matching
+    """
+    # Remove HTML tags and normalize spaces
+    content = content.replace('<p>', '').replace('</p>', '').replace('<s>', '').replace('</s>', '').replace(
+        ' ,', ',').replace("' ", "'").replace(' .', '.')
+    # Replace multiple spaces with single space
+    content = ' '.join(content.split())
+    # Convert to lowercase for comparison
+    content = content.lower()
+    return content
+
+
 def read_file_content(file_path):
     """
     Read file content and return as string, handling potential encoding issues
@@ -29,15 +43,7 @@ def read_file_content(file_path):
     for encoding in encodings:
         try:
             with open(file_path, 'r', encoding=encoding) as f:
-                content = f.read()
-                # Remove HTML tags and normalize spaces
-                content = content.replace('<p>', '').replace('</p>', '').replace('<s>', '').replace('</s>', '').replace(
-                    ' ,', ',').replace("' ", "'").replace(' .', '.')
-                # Replace multiple spaces with single space
-                content = ' '.join(content.split())
-                # Convert to lowercase for comparison
-                content = content.lower()
-                return content
+                return normalize_content(f.read())
         except UnicodeDecodeError:
             continue
 
@@ -45,6 +51,19 @@ def read_file_content(file_path):
     return ""
 
 
+def read_store_content(keyword, store_root):
+    """
+    Read the contexts of a keyword from the columnar concordance store (kwic_ske_api.py STORE_ROOT)
+    Returns None if the keyword is not in the store
+    """
+    from concordance_store import load_context_lines
+
+    lines = load_context_lines(keyword, store_root)
+    if lines is None:
+        return None
+    return normalize_content('\n'.join(lines))
+
+
 def normalize_sentence(sentence):
     """
     Normalize a sentence for comparison:
@@ -88,9 +107,10 @@ def check_sentences_in_file(sentences, file_content):
     return results
 
 
-def process_sheet(df, sheet_name, file_directory="."):
+def process_sheet(df, sheet_name, file_directory=".", store_root=None):
     """
     Process a single sheet of data
+    If store_root is given, contexts are read from the concordance store instead of text files
     """
     print(f"\nProcessing sheet: {sheet_name}")
 
@@ -114,9 +134,15 @@ def process_sheet(df, sheet_name, file_directory="."):
 
         print(f"  Processing row {index + 1}: {keyword}")
 
-        file_path = find_matching_file(keyword, file_directory)
+        store_content = read_store_content(keyword, store_root) if store_root else None
+
+        file_path = None if store_content is not None else find_matching_file(keyword, file_directory)
 
-        if file_path:
+        if store_content is not None:
+            print(f"    Found in store: {store_root}")
+            file_content = store_content
+            df.at[index, 'file_status'] = f"FOUND: {store_root}/lemma={keyword}"
+        elif file_path:
             print(f"    Found file: {file_path}")
             file_content = read_file_content(file_path)
             df.at[index, 'file_status'] = f"FOUND: {os.path.basename(file_path)}"
@@ -151,7 +177,7 @@ def process_sheet(df, sheet_name, file_directory="."):
     return df
 
 
-def process_excel_file(input_file, output_file=None, file_directory="."):
+def process_excel_file(input_file, output_file=None, file_directory=".", store_root=None):
     """
     Main function to process the Excel file with multiple sheets
     """
@@ -181,7 +207,7 @@ def process_excel_file(input_file, output_file=None, file_directory="."):
         print(f"Processing sheet: {sheet_name}")
         print(f"{'=' * 50}")
 
-        processed_df = process_sheet(df.copy(), sheet_name, file_directory)
+        processed_df = process_sheet(df.copy(), sheet_name, file_directory, store_root)
         processed_sheets[sheet_name] = processed_df
 
         # Create filtered version (only rows with found sentences)
@@ -289,7 +315,8 @@ def process_excel_file(input_file, output_file=None, file_directory="."):
 if __name__ == "__main__":
     input_excel = "tabel.xlsx"
     text_files_directory = "contexts"
+    concordance_store = None  # nt "concordance_store", kui kontekstid on veerupõhises hoidlas
 
-    process_excel_file(input_excel, file_directory=text_files_directory)
+    process_excel_file(input_excel, file_directory=text_files_directory, store_root=concordance_store)
 
     print("\nProcessing complete!")
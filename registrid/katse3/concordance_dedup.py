@@ -0,0 +1,162 @@
+#Peaaegu korduvate konkordantsiridade eemaldamine MinHash-allkirjade ja LSH abil.
+#Veebi- ja uudisteosas on palju kordustrükke; need jäetakse kõrvale juba enne salvestamist,
+#aga iga klastri suurus ja liikmed kirjutatakse eraldi faili, et sageduse info ei kaoks.
+#Vajab paketti numpy.
+
+import json
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from concordance_export import concordance_texts, safe_filename
+
+try:
+    import numpy as np
+except ImportError:  # numpy on valikuline sõltuvus
+    np = None
+
+MERSENNE_PRIME = (1 << 31) - 1
+TOKEN_RE = re.compile(r'\w+')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Korduste eemaldamine vajab paketti numpy (pip install numpy)")
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Pick the LSH (bands, rows) split whose S-curve threshold (1/b)^(1/r) is closest to the target
+
+    Args:
+        num_perm: Signature length
+        threshold: Target Jaccard similarity
+
+    Returns:
+        (bands, rows) with bands * rows <= num_perm
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands == 0:
+            break
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateFilter:
+    def __init__(self,
+                 threshold: float = 0.8,
+                 num_perm: int = 128,
+                 shingle_size: int = 3,
+                 seed: int = 1):
+        """
+        Streaming near-duplicate filter for concordance lines
+
+        Every line gets a MinHash signature over word shingles. Signatures
+        are split into LSH bands; a line is a duplicate if a line with the
+        same band hash was kept before and their estimated Jaccard similarity
+        is at least the threshold. Only kept lines are stored and a new line
+        is compared only with the kept lines that share one of its bands.
+        With mostly distinct text the buckets stay small, but the cost per
+        line is not constant: many similar lines just under the threshold
+        end up in the same buckets and each of them is scanned.
+
+        Args:
+            threshold: Jaccard similarity above which lines count as duplicates
+            num_perm: Number of hash permutations in a signature
+            shingle_size: Words per shingle
+            seed: Seed of the hash permutations
+        """
+        _require_numpy()
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: List = []
+        self.clusters: List[Dict] = []
+        self.lines_in = 0
+
+    def _shingles(self, text: str):
+        tokens = TOKEN_RE.findall(text.lower())
+        if len(tokens) < self.shingle_size:
+            grams = [' '.join(tokens)]
+        else:
+            grams = [' '.join(tokens[i:i + self.shingle_size])
+                     for i in range(len(tokens) - self.shingle_size + 1)]
+        return np.fromiter((zlib.crc32(g.encode('utf-8')) % MERSENNE_PRIME for g in set(grams)),
+                           dtype=np.uint64)
+
+    def signature(self, text: str):
+        shingles = self._shingles(text)
+        hashed = (np.outer(shingles, self._a) + self._b) % MERSENNE_PRIME
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def add_line(self, line: Dict) -> bool:
+        """
+        Check a concordance line against the lines kept so far
+
+        Returns:
+            True if the line is new and should be kept, False if it is a duplicate
+        """
+        self.lines_in += 1
+        text = concordance_texts(line)[3]
+        sig = self.signature(text)
+        keys = [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        for cluster_id in sorted(candidates):
+            similarity = float(np.mean(self._signatures[cluster_id] == sig))
+            if similarity >= self.threshold:
+                cluster = self.clusters[cluster_id]
+                cluster['size'] += 1
+                cluster['members'].append(line.get('toknum'))
+                return False
+
+        cluster_id = len(self.clusters)
+        self._signatures.append(sig)
+        self.clusters.append({'hit_id': line.get('toknum'), 'size': 1, 'members': []})
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(cluster_id)
+        return True
+
+    def add_page(self, lines: List[Dict]) -> List[Dict]:
+        """Return the lines of a page that are not near-duplicates of earlier lines"""
+        return [line for line in lines if self.add_line(line)]
+
+    def report(self) -> Dict:
+        sizes = [c['size'] for c in self.clusters]
+        duplicated = [s for s in sizes if s > 1]
+        return {
+            'lines': self.lines_in,
+            'kept': len(self.clusters),
+            'removed': self.lines_in - len(self.clusters),
+            'duplicate_clusters': len(duplicated),
+            'largest_cluster': max(sizes) if sizes else 0,
+            'threshold': self.threshold,
+        }
+
+    def save_clusters(self, word: str, output_dir: str = ".") -> Optional[str]:
+        """
+        Write clusters with more than one member to {word}_duplicate_clusters.jsonl
+
+        Each row has the hit id of the kept line, the cluster size and the
+        hit ids of the dropped duplicates.
+        """
+        clusters = [c for c in self.clusters if c['size'] > 1]
+        if not clusters:
+            return None
+        path = os.path.join(output_dir, f"{safe_filename(word)}_duplicate_clusters.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for cluster in clusters:
+                f.write(json.dumps(cluster, ensure_ascii=False) + '\n')
+        return path
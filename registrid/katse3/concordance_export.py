@@ -0,0 +1,100 @@
+#Konkordantside voogkirjutaja: leheküljed kirjutatakse faili kohe, kui need API-st saabuvad.
+#Iga rea vasak kontekst, otsisõna ja parem kontekst ühendatakse tekstiks üks kord ning
+#samast läbimisest kirjutatakse JSON Lines, CSV ja täiskontekstide TXT-fail.
+
+import csv
+import json
+import os
+from typing import Dict, List, Tuple
+
+
+def join_tokens(tokens: List[Dict]) -> str:
+    """Join Sketch Engine token dictionaries into plain text (structure tags are skipped)"""
+    return ' '.join([token.get('str', '') for token in tokens]).strip()
+
+
+def concordance_texts(line: Dict) -> Tuple[str, str, str, str]:
+    """
+    Convert one concordance line to text
+
+    Args:
+        line: Concordance line from the /view response
+
+    Returns:
+        (left_text, kwic_text, right_text, full_text)
+    """
+    left_text = join_tokens(line.get('Left', []))
+    kwic_text = join_tokens(line.get('Kwic', []))
+    right_text = join_tokens(line.get('Right', []))
+    full_text = f"{left_text} {kwic_text} {right_text}".strip()
+    return left_text, kwic_text, right_text, full_text
+
+
+def safe_filename(word: str) -> str:
+    return word.replace('/', '_').replace('\\', '_')
+
+
+class ConcordanceSink:
+    def __init__(self, word: str, output_dir: str = ".", sample_size: int = 3):
+        """
+        Open the per-word export files for streaming writes
+
+        Files are written under a temporary '.part' name and renamed when the
+        sink is closed without errors, so an interrupted run never leaves a
+        truncated file that looks complete.
+
+        Args:
+            word: The word being exported (used for file names)
+            output_dir: Directory for the output files
+            sample_size: How many lines to keep in memory for printing samples
+        """
+        safe_word = safe_filename(word)
+        self.word = word
+        self.paths = {
+            'jsonl': os.path.join(output_dir, f"{safe_word}_concordances.jsonl"),
+            'csv': os.path.join(output_dir, f"{safe_word}_concordances.csv"),
+            'txt': os.path.join(output_dir, f"{safe_word}_full_context_only.txt"),
+        }
+        self.count = 0
+        self.sample: List[Dict] = []
+        self.sample_size = sample_size
+
+        self._jsonl = open(self.paths['jsonl'] + '.part', 'w', encoding='utf-8')
+        self._csv_file = open(self.paths['csv'] + '.part', 'w', newline='', encoding='utf-8')
+        self._txt = open(self.paths['txt'] + '.part', 'w', encoding='utf-8')
+        self._csv = csv.writer(self._csv_file)
+        self._csv.writerow(['ID', 'Left_Context', 'Keyword', 'Right_Context', 'Full_Context'])
+
+    def write_line(self, line: Dict):
+        """Write a single concordance line to all three outputs"""
+        left_text, kwic_text, right_text, full_text = concordance_texts(line)
+        self.count += 1
+
+        self._jsonl.write(json.dumps(line, ensure_ascii=False) + '\n')
+        self._csv.writerow([self.count, left_text, kwic_text, right_text, full_text])
+        self._txt.write(full_text + '\n')
+
+        if len(self.sample) < self.sample_size:
+            self.sample.append(line)
+
+    def write_page(self, lines: List[Dict]):
+        """Write one page of concordance lines"""
+        for line in lines:
+            self.write_line(line)
+
+    def close(self, success: bool = True):
+        """Close the files; rename them into place only if the export succeeded"""
+        for f in (self._jsonl, self._csv_file, self._txt):
+            f.close()
+        for path in self.paths.values():
+            if success:
+                os.replace(path + '.part', path)
+            else:
+                os.remove(path + '.part')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(success=exc_type is None)
+        return False
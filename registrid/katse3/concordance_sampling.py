@@ -0,0 +1,95 @@
+#Konkordantside valimi võtmine: kvootide jaotamine žanrite vahel ja kliendipoolne
+#seemnega (seed) kihistatud reservuaarvalim voona saabuvatest lehekülgedest.
+
+import random
+from typing import Dict, Iterable, List, Optional
+
+from concordance_store import parse_refs
+
+
+def allocate_quotas(counts: Dict[str, int], n: int) -> Dict[str, int]:
+    """
+    Split a sample of n hits between strata proportionally to their size
+
+    Uses the largest remainder method, so the quotas always add up to
+    min(n, total) and no stratum gets more than it has.
+
+    Args:
+        counts: Number of hits per stratum (e.g. per doc.genre)
+        n: Total sample size
+
+    Returns:
+        Quota per stratum
+    """
+    total = sum(counts.values())
+    if total == 0 or n <= 0:
+        return {key: 0 for key in counts}
+    if n >= total:
+        return dict(counts)
+
+    exact = {key: n * count / total for key, count in counts.items()}
+    quotas = {key: int(value) for key, value in exact.items()}
+    left = n - sum(quotas.values())
+    # Ülejäänud kohad suurima murdosaga kihtidele (võrdsuse korral nime järgi, et tulemus oleks korratav)
+    for key in sorted(exact, key=lambda k: (-(exact[k] - quotas[k]), k))[:left]:
+        quotas[key] += 1
+    return quotas
+
+
+class StratifiedReservoir:
+    def __init__(self, n: int, seed: int = 0, stratify_by_genre: bool = False):
+        """
+        Seeded reservoir sample over a stream of concordance lines
+
+        Each stratum keeps a reservoir of up to n lines, so memory is bounded
+        by n times the number of genres. Quotas are applied once the stream
+        has ended and the real stratum sizes are known.
+
+        Args:
+            n: Total sample size
+            seed: Random seed; the same seed and input give the same sample
+            stratify_by_genre: Keep doc.genre proportions of the full concordance
+        """
+        self.n = n
+        self.stratify_by_genre = stratify_by_genre
+        self.rng = random.Random(seed)
+        self.reservoirs: Dict[str, List[Dict]] = {}
+        self.seen: Dict[str, int] = {}
+
+    def _stratum(self, line: Dict) -> str:
+        if not self.stratify_by_genre:
+            return 'all'
+        return parse_refs(line)['genre'] or 'unknown'
+
+    def add(self, line: Dict):
+        key = self._stratum(line)
+        seen = self.seen.get(key, 0) + 1
+        self.seen[key] = seen
+        reservoir = self.reservoirs.setdefault(key, [])
+        if len(reservoir) < self.n:
+            reservoir.append(line)
+        else:
+            j = self.rng.randrange(seen)
+            if j < self.n:
+                reservoir[j] = line
+
+    def add_page(self, lines: Iterable[Dict]):
+        for line in lines:
+            self.add(line)
+
+    def result(self, quotas: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """
+        Return the sample ordered by corpus position
+
+        Args:
+            quotas: Quota per stratum (computed from the observed sizes if omitted)
+        """
+        if quotas is None:
+            quotas = allocate_quotas(self.seen, self.n)
+        sample = []
+        for key in sorted(self.reservoirs):
+            reservoir = self.reservoirs[key]
+            quota = min(quotas.get(key, 0), len(reservoir))
+            sample.extend(self.rng.sample(reservoir, quota))
+        sample.sort(key=lambda line: line.get('toknum', 0))
+        return sample
@@ -0,0 +1,214 @@
+#Veerupõhine konkordantside hoidla (Apache Arrow IPC), mis asendab sõnapõhised JSON/CSV/TXT failid.
+#Üks andmestik, mis on lemma järgi jagatud (concordance_store/lemma=<sõna>/part-0.arrow).
+#Arrow IPC faile saab lugeda mälukaardistatult ja kopeerimata, nii et ka 100 000 konteksti
+#laadimine ja veergude järgi filtreerimine ei vaja tekstifailide parsimist.
+#Vajab paketti pyarrow.
+
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+from concordance_export import concordance_texts, safe_filename
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # pyarrow on valikuline sõltuvus
+    pa = None
+    ds = None
+
+DEFAULT_STORE_ROOT = "concordance_store"
+PART_NAME = "part-0.arrow"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Konkordantside hoidla vajab paketti pyarrow (pip install pyarrow)")
+
+
+def store_schema():
+    _require_pyarrow()
+    return pa.schema([
+        ('hit_id', pa.int64()),
+        ('doc_id', pa.string()),
+        ('genre', pa.string()),
+        ('left', pa.string()),
+        ('kwic', pa.string()),
+        ('right', pa.string()),
+    ])
+
+
+def parse_refs(line: Dict) -> Dict[str, str]:
+    """
+    Read document metadata from the 'Refs' of a concordance line
+
+    The client asks for refs '=doc.id,=doc.genre', which Sketch Engine returns
+    either as bare values in that order or as 'doc.genre=blogs' strings.
+
+    Args:
+        line: Concordance line from the /view response
+
+    Returns:
+        Dictionary with 'doc_id' and 'genre' (empty strings when unknown)
+    """
+    refs = line.get('Refs', []) or []
+    meta = {'doc_id': '', 'genre': ''}
+    positional = ['doc_id', 'genre']
+    for i, ref in enumerate(refs):
+        ref = str(ref)
+        if '=' in ref:
+            name, value = ref.split('=', 1)
+            if name.endswith('doc.id'):
+                meta['doc_id'] = value
+            elif name.endswith('doc.genre'):
+                meta['genre'] = value
+        elif i < len(positional):
+            meta[positional[i]] = ref
+    return meta
+
+
+def hit_id(line: Dict, full_text: str) -> int:
+    """Stable hit id: the corpus position of the hit, or a text hash if it is missing"""
+    if 'toknum' in line:
+        return int(line['toknum'])
+    digest = hashlib.blake2b(full_text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def partition_path(root: str, lemma: str) -> str:
+    return os.path.join(root, f"lemma={safe_filename(lemma)}", PART_NAME)
+
+
+class ConcordanceStoreWriter:
+    def __init__(self, word: str, root: str = DEFAULT_STORE_ROOT,
+                 batch_size: int = 10000, sample_size: int = 3):
+        """
+        Write one lemma partition of the concordance store
+
+        Has the same write_page/close/count/sample interface as
+        concordance_export.ConcordanceSink, so it can be used in its place.
+
+        Args:
+            word: The lemma being stored (partition key)
+            root: Root directory of the store
+            batch_size: Rows buffered before a record batch is flushed
+            sample_size: How many lines to keep in memory for printing samples
+        """
+        _require_pyarrow()
+        self.word = word
+        self.path = partition_path(root, word)
+        self.batch_size = batch_size
+        self.count = 0
+        self.sample: List[Dict] = []
+        self.sample_size = sample_size
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._schema = store_schema()
+        self._file = pa.OSFile(self.path + '.part', 'wb')
+        self._writer = pa.ipc.new_file(self._file, self._schema)
+        self._buffer = {name: [] for name in self._schema.names}
+
+    def write_line(self, line: Dict):
+        left_text, kwic_text, right_text, full_text = concordance_texts(line)
+        meta = parse_refs(line)
+        self._buffer['hit_id'].append(hit_id(line, full_text))
+        self._buffer['doc_id'].append(meta['doc_id'])
+        self._buffer['genre'].append(meta['genre'])
+        self._buffer['left'].append(left_text)
+        self._buffer['kwic'].append(kwic_text)
+        self._buffer['right'].append(right_text)
+        self.count += 1
+
+        if len(self.sample) < self.sample_size:
+            self.sample.append(line)
+        if len(self._buffer['hit_id']) >= self.batch_size:
+            self._flush()
+
+    def write_page(self, lines: List[Dict]):
+        for line in lines:
+            self.write_line(line)
+
+    def _flush(self):
+        if not self._buffer['hit_id']:
+            return
+        batch = pa.RecordBatch.from_pydict(self._buffer, schema=self._schema)
+        self._writer.write_batch(batch)
+        self._buffer = {name: [] for name in self._schema.names}
+
+    def close(self, success: bool = True):
+        if success:
+            self._flush()
+        self._writer.close()
+        self._file.close()
+        if success:
+            os.replace(self.path + '.part', self.path)
+        else:
+            os.remove(self.path + '.part')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(success=exc_type is None)
+        return False
+
+
+def open_store(root: str = DEFAULT_STORE_ROOT):
+    """
+    Open the whole store as a pyarrow dataset partitioned by lemma
+
+    Example:
+        store = open_store()
+        table = store.to_table(columns=['lemma', 'kwic'], filter=ds.field('genre') == 'forums')
+
+    Raises:
+        FileNotFoundError: If the store has not been built (no finished lemma partitions under root)
+    """
+    _require_pyarrow()
+    not_built = (f"Konkordantside hoidlat pole ehitatud: {root} (käivita kogumine hoidla režiimis "
+                 f"või kasuta *_full_context_only.txt faile)")
+    if not os.path.isdir(root):
+        raise FileNotFoundError(not_built)
+    # Ainult lõpetatud partitsioonid; pooleli kirjutatavad *.part failid jäetakse välja
+    finished = sorted(
+        os.path.join(root, name, PART_NAME) for name in os.listdir(root)
+        if name.startswith('lemma=') and os.path.exists(os.path.join(root, name, PART_NAME))
+    )
+    if not finished:
+        raise FileNotFoundError(not_built)
+    return ds.dataset(finished, format='ipc', partitioning='hive', partition_base_dir=root,
+                      exclude_invalid_files=True)
+
+
+def load_lemma(lemma: str, root: str = DEFAULT_STORE_ROOT, columns: Optional[List[str]] = None):
+    """
+    Load one lemma partition as a memory-mapped, zero-copy pyarrow Table
+
+    Args:
+        lemma: The lemma to load
+        root: Root directory of the store
+        columns: Optional list of columns to select
+
+    Returns:
+        pyarrow.Table, or None if the lemma is not in the store
+    """
+    _require_pyarrow()
+    path = partition_path(root, lemma)
+    if not os.path.exists(path):
+        return None
+    source = pa.memory_map(path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def load_context_lines(lemma: str, root: str = DEFAULT_STORE_ROOT) -> Optional[List[str]]:
+    """Return the full contexts of a lemma, one per hit (like *_full_context_only.txt)"""
+    table = load_lemma(lemma, root, columns=['left', 'kwic', 'right'])
+    if table is None:
+        return None
+    columns = [table.column(name).to_pylist() for name in ('left', 'kwic', 'right')]
+    return [f"{l} {k} {r}".strip() for l, k, r in zip(*columns)]
+
+
+def has_lemma(lemma: str, root: str = DEFAULT_STORE_ROOT) -> bool:
+    return os.path.exists(partition_path(root, lemma))
@@ -0,0 +1,186 @@
+#Kattuvate KWIC-kontekstiakende ühendamine enne eksporti.
+#Kui sama dokumendi vasted on üksteise lähedal, kattuvad nende -3:s..3:s aknad suures osas ja samad
+#laused jõuaksid täiskontekstide faili (ja keelemudelile) mitu korda. Siin ühendatakse sama dokumendi
+#kattuvad või vahetult järgnevad aknad üheks lõiguks, kus on kirjas kõigi vastete asukohad.
+#/view rühmitab mitu sõne ühte 'str' tükki (tühikuga eraldatud), seega tükid jagatakse enne asukohtade
+#määramist sõnedeks. Kui kattuvas osas samale asukohale satuvad eri sõned, pole asukohad usaldusväärsed
+#ja rida jäetakse ühendamata.
+
+from typing import Dict, List, Optional
+
+from concordance_store import parse_refs
+
+
+def _split_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Split /view text chunks into one dictionary per token; structure tags are dropped"""
+    tokens = []
+    for chunk in chunks:
+        if 'str' not in chunk:
+            continue
+        for word in chunk['str'].split():
+            token = dict(chunk)
+            token['str'] = word
+            tokens.append(token)
+    return tokens
+
+
+def _positioned_tokens(line: Dict) -> Optional[Dict]:
+    """
+    Attach corpus positions to the word tokens of a concordance line
+
+    Sketch Engine groups consecutive tokens into one space-separated 'str'
+    chunk, so chunks are split into tokens first. Structure tags ('strc',
+    e.g. <s>) have no corpus position and are dropped.
+
+    Returns:
+        Dictionary with doc, start, end, kwic range and {position: token}, or
+        None if the line has no 'toknum' and cannot be positioned
+    """
+    if 'toknum' not in line:
+        return None
+    left = _split_chunks(line.get('Left', []))
+    kwic = _split_chunks(line.get('Kwic', []))
+    right = _split_chunks(line.get('Right', []))
+
+    kwic_start = int(line['toknum'])
+    start = kwic_start - len(left)
+    tokens = {}
+    for offset, token in enumerate(left + kwic + right):
+        tokens[start + offset] = token
+    return {
+        'doc_id': parse_refs(line)['doc_id'],
+        'start': start,
+        'end': start + len(tokens),
+        'kwic': (kwic_start, kwic_start + len(kwic)),
+        'tokens': tokens,
+    }
+
+
+class ContextMerger:
+    def __init__(self, kwic_marker: Optional[str] = None):
+        """
+        Merge overlapping context windows of hits from the same document
+
+        Lines are expected in corpus order (as Sketch Engine returns them);
+        only the currently open span is kept in memory. Merged spans are
+        emitted in the same shape as /view lines (Left/Kwic/Right), so they
+        can be written by ConcordanceSink or ConcordanceStoreWriter. The
+        first hit goes to 'Kwic', everything after it to 'Right', and all
+        hit positions are listed in 'KwicPositions'.
+
+        Args:
+            kwic_marker: Optional string put around every KWIC token in the
+                         text (e.g. '**'); positions are recorded either way
+        """
+        self.kwic_marker = kwic_marker
+        self._span: Optional[Dict] = None
+        self.hits_in = 0
+        self.spans_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.misaligned = 0
+
+    def _emit(self, span: Dict) -> Dict:
+        positions = sorted(span['tokens'])
+        kwic_positions = set()
+        for kwic_start, kwic_end in span['kwics']:
+            kwic_positions.update(range(kwic_start, kwic_end))
+
+        first_start, first_end = span['kwics'][0]
+        left, kwic, right = [], [], []
+        for pos in positions:
+            token = dict(span['tokens'][pos])
+            if self.kwic_marker and pos in kwic_positions:
+                token['str'] = f"{self.kwic_marker}{token['str']}{self.kwic_marker}"
+            if pos < first_start:
+                left.append(token)
+            elif pos < first_end:
+                kwic.append(token)
+            else:
+                right.append(token)
+
+        self.spans_out += 1
+        self.tokens_out += len(positions)
+        line = dict(span['first_line'])
+        line.update({
+            'Left': left,
+            'Kwic': kwic,
+            'Right': right,
+            'KwicPositions': [k[0] for k in span['kwics']],
+            'MergedHits': len(span['kwics']),
+            'Span': [span['start'], span['end']],
+        })
+        return line
+
+    def add_line(self, line: Dict) -> List[Dict]:
+        """Add a line; returns the spans that were closed by it"""
+        self.hits_in += 1
+        window = _positioned_tokens(line)
+        if window is None:
+            # Asukohata rida ei saa ühendada, see läheb edasi muutmata kujul
+            count = sum(len(_split_chunks(line.get(key, []))) for key in ('Left', 'Kwic', 'Right'))
+            self.tokens_in += count
+            self.tokens_out += count
+            self.spans_out += 1
+            return self.flush() + [line]
+        self.tokens_in += window['end'] - window['start']
+
+        span = self._span
+        if span and window['doc_id'] == span['doc_id'] and span['start'] <= window['start'] <= span['end']:
+            if not self._aligned(span, window):
+                # Kattuvas osas on samal asukohal eri sõned: asukohad on valed, ära ühenda
+                self.misaligned += 1
+                closed = self.flush()
+                self._open(window, line)
+                return closed
+            span['tokens'].update(window['tokens'])
+            span['end'] = max(span['end'], window['end'])
+            span['kwics'].append(window['kwic'])
+            return []
+
+        closed = self.flush()
+        self._open(window, line)
+        return closed
+
+    @staticmethod
+    def _aligned(span: Dict, window: Dict) -> bool:
+        """True if the span and the window agree on every token they share"""
+        tokens = span['tokens']
+        return all(tokens[pos]['str'] == token['str']
+                   for pos, token in window['tokens'].items() if pos in tokens)
+
+    def _open(self, window: Dict, line: Dict):
+        self._span = {
+            'doc_id': window['doc_id'],
+            'start': window['start'],
+            'end': window['end'],
+            'tokens': window['tokens'],
+            'kwics': [window['kwic']],
+            'first_line': line,
+        }
+
+    def add_page(self, lines: List[Dict]) -> List[Dict]:
+        merged = []
+        for line in lines:
+            merged.extend(self.add_line(line))
+        return merged
+
+    def flush(self) -> List[Dict]:
+        """Emit the span that is still open"""
+        if self._span is None:
+            return []
+        span, self._span = self._span, None
+        return [self._emit(span)]
+
+    def report(self) -> Dict:
+        """Hits, merged spans, corpus tokens before and after merging and hits left unmerged as misaligned"""
+        saved = self.tokens_in - self.tokens_out
+        return {
+            'hits': self.hits_in,
+            'spans': self.spans_out,
+            'tokens_before': self.tokens_in,
+            'tokens_after': self.tokens_out,
+            'tokens_saved': saved,
+            'misaligned': self.misaligned,
+            'saved_percent': round(100 * saved / self.tokens_in, 1) if self.tokens_in else 0.0,
+        }
@@ -0,0 +1,105 @@
+#Lisatav (append-only) logi sõnade kaupa konkordantside kogumiseks.
+#Iga lõpetatud sõna kohta kirjutatakse kohe üks JSON-rida; katkestuse järel jäetakse
+#uuel käivitusel vahele sõnad, mis on juba täielikult kogutud ja mille vastete arv klapib.
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_JOURNAL_PATH = "harvest_journal.jsonl"
+
+
+class HarvestJournal:
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        """
+        Open an append-only harvest journal, loading entries from earlier runs
+
+        Args:
+            path: JSON Lines file holding one entry per finished word
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Katkenud viimane rida (nt protsess tapeti kirjutamise ajal)
+                        continue
+                    # Sama sõna hilisem kirje kehtib
+                    self.entries[entry['word']] = entry
+
+    def record(self,
+               word: str,
+               status: str,
+               hits: int = 0,
+               expected: int = 0,
+               written: int = 0,
+               missing_pages: Optional[List[int]] = None,
+               error: Optional[str] = None,
+               fetched: Optional[int] = None,
+               reports: Optional[Dict] = None):
+        """
+        Append an entry for a word and flush it to disk immediately
+
+        Args:
+            word: The word
+            status: "done", "incomplete", "empty" or "failed"
+            hits: 'fullsize' reported by Sketch Engine
+            expected: Number of lines that should have been written
+            written: Number of lines actually written
+            missing_pages: Pages that could not be fetched
+            error: Error message for failed words
+            fetched: Number of lines received from the API, if it differs from
+                     written (e.g. when contexts were merged)
+            reports: Per-stage reports (e.g. {'merge': {...}})
+        """
+        entry = {
+            'word': word,
+            'status': status,
+            'hits': hits,
+            'expected': expected,
+            'written': written,
+            'fetched': written if fetched is None else fetched,
+            'missing_pages': missing_pages or [],
+            'reports': reports or {},
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        if error:
+            entry['error'] = error
+
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[word] = entry
+
+    def is_complete(self, word: str, count_output: Optional[Callable[[str], Optional[int]]] = None) -> bool:
+        """
+        Check whether a word was fully harvested in an earlier run
+
+        Args:
+            word: The word
+            count_output: Optional function returning the number of lines
+                          currently on disk for the word (None if missing)
+
+        Returns:
+            True if the journal says "done" and the hit count is verified
+        """
+        entry = self.entries.get(word)
+        if not entry or entry['status'] != 'done':
+            return False
+        if entry.get('fetched', entry['written']) != entry['expected'] or entry['missing_pages']:
+            return False
+        if count_output is not None and count_output(word) != entry['written']:
+            return False
+        return True
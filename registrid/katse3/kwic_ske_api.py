@@ -2,23 +2,74 @@
 #Sisendiks fail, iga sõna eraldi real
 #Autor: Eleri Aedmaa
 
-import requests
 import json
 import os
-from typing import Dict, List, Optional
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from concordance_export import ConcordanceSink, safe_filename
+from concordance_sampling import StratifiedReservoir, allocate_quotas
+from concordance_store import ConcordanceStoreWriter, load_lemma
+from concordance_dedup import NearDuplicateFilter
+from context_merge import ContextMerger
+from harvest_journal import HarvestJournal
+from local_corpus import LocalCorpusTransport
+from ske_cache import ResponseCache
+from ske_transport import SKE_BASE_URL, SkeRequestError, SkeTransport
+
+MAX_PAGES = 300  # turvalisus: kuni ~300 000 vastet sõna kohta
 
 class SketchEngineAPI:
-    def __init__(self, username: str, api_key: str):
+    def __init__(self, username: str, api_key: str, max_workers: int = 1,
+                 transport: Optional[SkeTransport] = None,
+                 sample_size: Optional[int] = None,
+                 sample_seed: int = 0,
+                 stratify_by_genre: bool = False,
+                 server_side_sampling: bool = True,
+                 merge_contexts: bool = False,
+                 kwic_marker: Optional[str] = None,
+                 dedup_threshold: Optional[float] = None):
         """
         Initialize Sketch Engine API client
         
         Args:
             username: Your Sketch Engine username
             api_key: Your Sketch Engine API key
+            max_workers: How many concordance pages to fetch concurrently
+            transport: Shared HTTP transport (a pooled one is created if omitted)
+            sample_size: If set, fetch a random sample of this many hits per word instead of all hits
+            sample_seed: Seed for client-side sampling
+            stratify_by_genre: Keep the doc.genre proportions of the full concordance in the sample
+            server_side_sampling: Let Sketch Engine draw the sample (only the sample is downloaded);
+                                  otherwise all hits are streamed and sampled locally with the seed
+            merge_contexts: Merge overlapping context windows of the same document before export
+            kwic_marker: Optional marker put around KWIC tokens in merged contexts (e.g. '**')
+            dedup_threshold: If set, drop near-duplicate lines (MinHash/LSH) above this Jaccard similarity
         """
         self.username = username
         self.api_key = api_key
-        self.base_url = "https://api.sketchengine.eu/bonito/run.cgi"
+        self.base_url = SKE_BASE_URL
+        self.max_workers = max_workers
+        self.transport = transport or SkeTransport(self.base_url, pool_size=max(10, max_workers))
+        self.sample_size = sample_size
+        self.sample_seed = sample_seed
+        self.stratify_by_genre = stratify_by_genre
+        self.server_side_sampling = server_side_sampling
+        self.merge_contexts = merge_contexts
+        self.kwic_marker = kwic_marker
+        self.dedup_threshold = dedup_threshold
+
+    @staticmethod
+    def _ui_simple_cql(query: str, genre: Optional[str] = None) -> str:
+        """CQL of the UI simple search, optionally restricted to one doc.genre"""
+        cql = f'q[word="{query}" | lemma="{query}" | lc="{query.lower()}" | lemma_lc="{query.lower()}"]'
+        if genre is not None:
+            escaped = genre.replace('"', '\\"')
+            cql += f' within <doc genre="{escaped}" />'
+        return cql
         
     def get_concordances_ui_simple(self, 
                                   corpus: str = "preloaded/estonian_nc23", #korpuse nimi vajadusel muuta
@@ -26,7 +77,9 @@ class SketchEngineAPI:
                                   pagesize: int = 1000,
                                   fromp: int = 1,
                                   leftctx: str = "3",
-                                  rightctx: str = "3") -> Dict:
+                                  rightctx: str = "3",
+                                  genre: Optional[str] = None,
+                                  sample: Optional[int] = None) -> Dict:
         """
         Get concordances using the UI simple method
         
@@ -37,170 +90,184 @@ class SketchEngineAPI:
             fromp: Starting page
             leftctx: Left context in sentences
             rightctx: Right context in sentences
+            genre: Restrict hits to documents of this doc.genre
+            sample: Ask Sketch Engine for a random sample of this many hits (the 'r' operation)
             
         Returns:
             Dictionary containing concordance results
         """
         # simple otsing
-        ui_simple_query = f'q[word="{query}" | lemma="{query}" | lc="{query.lower()}" | lemma_lc="{query.lower()}"]'
+        ui_simple_query = self._ui_simple_cql(query, genre)
         
         params = {
             'corpname': corpus,
-            'q': ui_simple_query,
+            'q': [ui_simple_query, f'r{sample}'] if sample else ui_simple_query,
             'pagesize': pagesize,
             'fromp': fromp,
             'format': 'json',
             'kwicleftctx': f'-{leftctx}:s',
             'kwicrightctx': f'{rightctx}:s',
+            'refs': '=doc.id,=doc.genre',  # dokumendi metaandmed iga rea juurde
             'username': self.username,
             'api_key': self.api_key,
             'async': '0'
         }
         
         try:
-            response = requests.get(self.base_url + "/view", params=params)
-            response.raise_for_status()
-            return response.json()
+            return self.transport.get_json("view", params)
                 
-        except requests.exceptions.RequestException as e:
+        except SkeRequestError as e:
             print(f"Error making API request: {e}")
             return {}
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response: {e}")
-            return {}
-    
 
-    
-    def _get_all_pages_ui_simple(self, corpus, query, leftctx, rightctx):
-        """Get all pages using the ui_simple method"""
-        all_concordances = []
-        page = 1
-        pagesize = 1000
-        
-        print(f"Fetching all pages for '{query}'...")
-        
-        while True:
-            print(f"Fetching page {page}... ({len(all_concordances)} collected so far)")
-            
-            result = self.get_concordances_ui_simple(
-                corpus=corpus,
-                query=query,
-                pagesize=pagesize,
-                fromp=page,
-                leftctx=leftctx,
-                rightctx=rightctx
-            )
-            
-            if not result or 'Lines' not in result:
-                break
-                
-            lines = result['Lines']
-            if not lines:  # No more results
-                break
-                
-            all_concordances.extend(lines)
-            
-            # Kontrolli, kas kõik vasted saadi kätte
-            total_hits = result.get('fullsize', 0)
-            if len(all_concordances) >= total_hits:
-                print(f"✅ Collected all {len(all_concordances)} concordances!")
-                break
-                
-            page += 1
-            
-            # Turvalisus
-            if page > 300:  # Max ~100,000 results
-                print(f"⚠️ Stopped at page {page} for safety")
-                break
-                
-        print(f"Total concordances retrieved: {len(all_concordances)}")
-        return all_concordances
-    
-    def save_concordances(self, 
-                         concordances, 
-                         filename: str):
+    def get_genre_distribution(self, corpus: str, query: str) -> Dict[str, int]:
         """
-        Save concordances to a JSON file
+        Get the number of hits per doc.genre for a query (the /freqs endpoint)
         
         Args:
-            concordances: Concordance data (Dict or List)
-            filename: Output filename
+            corpus: Corpus name
+            query: Search query
+            
+        Returns:
+            Dictionary mapping genre to absolute frequency
         """
+        params = {
+            'corpname': corpus,
+            'q': self._ui_simple_cql(query),
+            'fcrit': 'doc.genre 0',
+            'format': 'json',
+            'username': self.username,
+            'api_key': self.api_key
+        }
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(concordances, f, ensure_ascii=False, indent=2)
-            print(f"Concordances saved to {filename}")
-        except Exception as e:
-            print(f"Error saving file: {e}")
-    
-    def save_concordances_csv(self, 
-                            concordances: List[Dict], 
-                            filename: str):
-        """
-        Save concordances to a CSV file for easier analysis
+            result = self.transport.get_json("freqs", params)
+        except SkeRequestError as e:
+            print(f"Error making API request: {e}")
+            return {}
         
-        Args:
-            concordances: List of concordance data
-            filename: Output filename
-        """
-        try:
-            import csv
-            
-            with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['ID', 'Left_Context', 'Keyword', 'Right_Context', 'Full_Context'])
-                
-                for i, line in enumerate(concordances, 1):
-                    # eralda kontekstid
-                    left = line.get('Left', [])
-                    kwic = line.get('Kwic', [])
-                    right = line.get('Right', [])
-                    
-                    # Convert to text
-                    left_text = ' '.join([token.get('str', '') for token in left]).strip()
-                    kwic_text = ' '.join([token.get('str', '') for token in kwic]).strip()
-                    right_text = ' '.join([token.get('str', '') for token in right]).strip()
-                    full_text = f"{left_text} {kwic_text} {right_text}".strip()
-                    
-                    writer.writerow([i, left_text, kwic_text, right_text, full_text])
-            
-            print(f"Concordances saved to CSV: {filename}")
-        except Exception as e:
-            print(f"Error saving CSV file: {e}")
+        distribution = {}
+        for block in result.get('Blocks', []):
+            for item in block.get('Items', []):
+                words = item.get('Word', [])
+                genre = words[0].get('n', 'unknown') if words else 'unknown'
+                distribution[genre] = item.get('frq', 0)
+        return distribution
     
-    def save_full_context_only(self, 
-                              concordances: List[Dict], 
-                              filename: str):
+    def _fetch_page(self, corpus, query, page, pagesize, leftctx, rightctx, **query_opts) -> Dict:
+        """Fetch a single concordance page (used by the concurrent mode)"""
+        return self.get_concordances_ui_simple(
+            corpus=corpus,
+            query=query,
+            pagesize=pagesize,
+            fromp=page,
+            leftctx=leftctx,
+            rightctx=rightctx,
+            **query_opts
+        )
+
+    def _iter_pages_ui_simple(self,
+                              corpus: str,
+                              query: str,
+                              leftctx: str,
+                              rightctx: str,
+                              first_page: Optional[Dict] = None,
+                              max_workers: int = 1,
+                              pagesize: int = 1000,
+                              max_pages: int = MAX_PAGES,
+                              failed_pages: Optional[List[int]] = None,
+                              **query_opts) -> Iterator[List[Dict]]:
         """
-        Save only the full context (complete sentences) to a plain text file
-        One concordance per line, no additional formatting or metadata
-        
+        Yield concordance pages in order, fetching up to max_workers pages at once
+
+        The first /view response already contains 'fullsize', so the number of
+        pages is known up front. Pages 2..N are submitted to a thread pool with
+        at most max_workers requests in flight and yielded in page order, so
+        the caller never holds more than max_workers pages in memory.
+
         Args:
-            concordances: List of concordance data
-            filename: Output filename
+            corpus: Corpus name
+            query: Search query
+            leftctx: Left context in sentences
+            rightctx: Right context in sentences
+            first_page: Already fetched response for page 1 (optional)
+            max_workers: Concurrency cap; 1 keeps the old sequential behaviour
+            pagesize: Number of results per page
+            max_pages: Safety limit for the number of pages
+            failed_pages: List that collects the numbers of pages that could not be fetched
+            query_opts: Extra arguments for get_concordances_ui_simple (genre, sample)
+
+        Yields:
+            List of concordance lines for each page
         """
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                for line in concordances:
-                    # Extract all contexts
-                    left = line.get('Left', [])
-                    kwic = line.get('Kwic', [])
-                    right = line.get('Right', [])
-                    
-                    # Convert to text and combine
-                    left_text = ' '.join([token.get('str', '') for token in left]).strip()
-                    kwic_text = ' '.join([token.get('str', '') for token in kwic]).strip()
-                    right_text = ' '.join([token.get('str', '') for token in right]).strip()
-                    
-                    # Create full context
-                    full_text = f"{left_text} {kwic_text} {right_text}".strip()
-                    
-                    # Write only the full context, nothing else
-                    f.write(full_text + '\n')
-            
-            print(f"Full context saved to: {filename}")
-        except Exception as e:
-            print(f"Error saving full context file: {e}")
+        if failed_pages is None:
+            failed_pages = []
+        started = time.perf_counter()
+        fetched_pages = 0
+
+        if first_page is None:
+            first_page = self._fetch_page(corpus, query, 1, pagesize, leftctx, rightctx, **query_opts)
+            fetched_pages += 1
+
+        if not first_page or not first_page.get('Lines'):
+            return
+
+        total_hits = first_page.get('fullsize', 0)
+        if query_opts.get('sample'):
+            total_hits = min(total_hits, query_opts['sample'])
+        total_pages = min(math.ceil(total_hits / pagesize), max_pages)
+        if math.ceil(total_hits / pagesize) > max_pages:
+            print(f"⚠️ Limiting to {max_pages} pages for safety")
+
+        print(f"Fetching {total_pages} pages for '{query}' "
+              f"({max_workers} concurrent request{'s' if max_workers > 1 else ''})...")
+        yield first_page['Lines']
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            pending = deque()
+            next_page = 2
+
+            # Hoia korraga lennus kuni max_workers lehekülge
+            while next_page <= total_pages or pending:
+                while next_page <= total_pages and len(pending) < max_workers:
+                    future = executor.submit(self._fetch_page, corpus, query, next_page,
+                                             pagesize, leftctx, rightctx, **query_opts)
+                    pending.append((next_page, future))
+                    next_page += 1
+
+                page, future = pending.popleft()
+                result = future.result()
+                fetched_pages += 1
+
+                if not result or not result.get('Lines'):
+                    print(f"⚠️ Page {page} returned no lines")
+                    failed_pages.append(page)
+                    continue
+
+                print(f"Fetched page {page}/{total_pages}")
+                yield result['Lines']
+
+        elapsed = time.perf_counter() - started
+        if elapsed > 0:
+            print(f"⏱️ {fetched_pages} pages in {elapsed:.1f}s "
+                  f"({fetched_pages / elapsed:.2f} pages/sec)")
+        if failed_pages:
+            print(f"⚠️ Missing pages for '{query}': {failed_pages}")
+
+    def _get_all_pages_ui_simple(self, corpus, query, leftctx, rightctx,
+                                 first_page: Optional[Dict] = None,
+                                 max_workers: int = 1):
+        """Get all pages using the ui_simple method"""
+        all_concordances = []
+
+        print(f"Fetching all pages for '{query}'...")
+
+        for lines in self._iter_pages_ui_simple(corpus, query, leftctx, rightctx,
+                                                first_page=first_page,
+                                                max_workers=max_workers):
+            all_concordances.extend(lines)
+
+        print(f"Total concordances retrieved: {len(all_concordances)}")
+        return all_concordances
     
     def print_concordances(self, concordances, limit: int = 10):
         """
@@ -239,17 +306,24 @@ class SketchEngineAPI:
             print(f"Right: {right_text}")
             print("-" * 80)
 
-    def process_single_word(self, word: str, corpus: str) -> Optional[List[Dict]]:
+    def iter_word_pages(self, word: str, corpus: str,
+                        state: Optional[Dict] = None) -> Iterator[List[Dict]]:
         """
-        Process a single word and return all concordances using ui_simple method
-        
+        Yield all concordance pages for a word as they arrive
+
         Args:
             word: The word to search for
             corpus: Corpus name
-            
-        Returns:
-            List of all concordances for the word, or None if failed
+            state: Optional dictionary that is filled with 'status', 'total_hits',
+                   'expected' and 'failed_pages' (safe to use from several threads)
+
+        Yields:
+            List of concordance lines for each page
         """
+        if state is None:
+            state = {}
+        state.update({'status': 'failed', 'total_hits': 0, 'expected': 0, 'failed_pages': []})
+
         print(f"\n{'='*70}")
         print(f"🔍 Processing word: '{word}'")
         print(f"{'='*70}")
@@ -257,6 +331,13 @@ class SketchEngineAPI:
         # Kasuta ui_simple meetodit
         print(f"Using UI simple method for '{word}'...")
         
+        if self.sample_size:
+            yield from self._iter_sample_pages(word, corpus, state)
+        else:
+            yield from self._iter_all_word_pages(word, corpus, state)
+
+    def _iter_all_word_pages(self, word: str, corpus: str, state: Dict) -> Iterator[List[Dict]]:
+        """Yield every hit of a word page by page"""
         # Mitu vastet
         result = self.get_concordances_ui_simple(
             corpus=corpus,
@@ -269,30 +350,284 @@ class SketchEngineAPI:
             
         if not result:
             print(f"❌ No response for '{word}'")
-            return None
+            return
             
         total_hits = result.get('fullsize', 0)
+        state['total_hits'] = total_hits
+        state['expected'] = min(total_hits, MAX_PAGES * 1000)
+        state['status'] = 'done'
         
         if total_hits == 0:
+            state['status'] = 'empty'
             print(f"❌ No results found for '{word}'")
-            return None
+            return
         
         print(f"Found {total_hits:,} total hits for '{word}'")
         
         # Kõik leheküljed
         if total_hits > 1000:
             print(f"🔄 Retrieving ALL {total_hits:,} concordances...")
-            all_concordances = self._get_all_pages_ui_simple(
-                corpus, word, "3", "3"
+            yield from self._iter_pages_ui_simple(
+                corpus, word, "3", "3",
+                first_page=result,
+                max_workers=self.max_workers,
+                failed_pages=state['failed_pages']
             )
+            if state['failed_pages']:
+                state['status'] = 'incomplete'
         else:
             # Single page is enough
-            all_concordances = result.get('Lines', [])
-            print(f"Single page sufficient: {len(all_concordances)} concordances")
+            print(f"Single page sufficient: {len(result.get('Lines', []))} concordances")
+            yield result.get('Lines', [])
+
+    def _iter_sample_pages(self, word: str, corpus: str, state: Dict) -> Iterator[List[Dict]]:
+        """
+        Yield a random sample of sample_size hits for a word
+
+        Server-side sampling uses Sketch Engine's 'r' operation, so only the
+        sample is downloaded; with stratify_by_genre the sample is split
+        between genres in proportion to the /freqs distribution and drawn
+        genre by genre. Client-side sampling streams all hits through a
+        seeded reservoir (concordance_sampling.py) and yields one page.
+        """
+        n = self.sample_size
+        
+        if not self.server_side_sampling:
+            reservoir = StratifiedReservoir(n, self.sample_seed, self.stratify_by_genre)
+            for lines in self._iter_all_word_pages(word, corpus, state):
+                reservoir.add_page(lines)
+            if state['status'] == 'failed' or state['total_hits'] == 0:
+                return
+            sample = reservoir.result()
+            state['expected'] = len(sample)
+            print(f"🎲 Client-side sample: {len(sample)} of {state['total_hits']:,} hits (seed {self.sample_seed})")
+            yield sample
+            return
+        
+        if self.stratify_by_genre:
+            distribution = self.get_genre_distribution(corpus, word)
+            if not distribution:
+                print(f"❌ No genre distribution for '{word}'")
+                return
+            quotas = allocate_quotas(distribution, n)
+            strata = [(genre, quota) for genre, quota in sorted(quotas.items()) if quota > 0]
+            state['total_hits'] = sum(distribution.values())
+            print(f"🎲 Stratified sample of {sum(q for _, q in strata)} hits: "
+                  + ", ".join(f"{genre} {quota}" for genre, quota in strata))
+        else:
+            strata = [(None, n)]
+        
+        state['status'] = 'done'
+        for genre, quota in strata:
+            pagesize = min(1000, quota)
+            result = self.get_concordances_ui_simple(
+                corpus=corpus, query=word, pagesize=pagesize, fromp=1,
+                leftctx="3", rightctx="3", genre=genre, sample=quota
+            )
+            if not result:
+                print(f"❌ No response for '{word}'" + (f" in genre '{genre}'" if genre else ""))
+                state['status'] = 'incomplete' if state['expected'] else 'failed'
+                continue
+            
+            hits = result.get('fullsize', 0)
+            if genre is None:
+                state['total_hits'] = hits
+            state['expected'] += min(hits, quota)
+            yield from self._iter_pages_ui_simple(
+                corpus, word, "3", "3",
+                first_page=result,
+                max_workers=self.max_workers,
+                pagesize=pagesize,
+                failed_pages=state['failed_pages'],
+                genre=genre,
+                sample=quota
+            )
+        
+        if state['total_hits'] == 0 and state['status'] == 'done':
+            state['status'] = 'empty'
+            print(f"❌ No results found for '{word}'")
+        elif state['failed_pages']:
+            state['status'] = 'incomplete'
+
+    def process_single_word(self, word: str, corpus: str) -> Optional[List[Dict]]:
+        """
+        Process a single word and return all concordances using ui_simple method
+        
+        Args:
+            word: The word to search for
+            corpus: Corpus name
+            
+        Returns:
+            List of all concordances for the word, or None if failed
+        """
+        all_concordances = []
+        for lines in self.iter_word_pages(word, corpus):
+            all_concordances.extend(lines)
+        
+        if not all_concordances:
+            return None
         
         print(f"✅ Retrieved {len(all_concordances)} concordances for '{word}'")
         return all_concordances
 
+    def stream_single_word(self, word: str, corpus: str, output_dir: str = ".",
+                           store_root: Optional[str] = None,
+                           state: Optional[Dict] = None):
+        """
+        Fetch a word and write its JSONL, CSV and full-context TXT files in one pass
+
+        Pages are written as soon as they arrive, so memory use is bounded by
+        the number of pages in flight rather than by the number of hits.
+
+        Args:
+            word: The word to search for
+            corpus: Corpus name
+            output_dir: Directory for the output files
+            store_root: If given, write into the columnar concordance store
+                        (concordance_store.py) instead of the per-word files
+            state: Optional dictionary filled by iter_word_pages; also gets 'fetched'
+                   (lines received) and 'reports' (per-stage reports)
+
+        Returns:
+            The closed sink (with count and sample lines), or None if nothing was found
+        """
+        if state is None:
+            state = {}
+        deduper = NearDuplicateFilter(self.dedup_threshold) if self.dedup_threshold else None
+        merger = ContextMerger(self.kwic_marker) if self.merge_contexts else None
+        fetched = 0
+        sink = None
+        try:
+            for lines in self.iter_word_pages(word, corpus, state):
+                fetched += len(lines)
+                # Kõigepealt korduste eemaldamine, siis kattuvate akende ühendamine
+                if deduper is not None:
+                    lines = deduper.add_page(lines)
+                if merger is not None:
+                    lines = merger.add_page(lines)
+                if sink is None:
+                    if store_root:
+                        sink = ConcordanceStoreWriter(word, store_root)
+                    else:
+                        sink = ConcordanceSink(word, output_dir)
+                sink.write_page(lines)
+            if sink is not None and merger is not None:
+                sink.write_page(merger.flush())
+        except BaseException:
+            if sink is not None:
+                sink.close(success=False)
+            raise
+        
+        state['fetched'] = fetched
+        state['reports'] = {}
+        if sink is None:
+            return None
+        
+        sink.close()
+        if deduper is not None:
+            report = deduper.report()
+            # Hoidla puhul läheb klastrite fail lemma partitsiooni kausta, mitte output_dir-i
+            clusters_dir = os.path.dirname(sink.path) if store_root else output_dir
+            report['clusters_file'] = deduper.save_clusters(word, clusters_dir)
+            state['reports']['dedup'] = report
+            print(f"🧹 Removed {report['removed']:,} near-duplicates of {report['lines']:,} lines "
+                  f"({report['duplicate_clusters']:,} clusters, largest {report['largest_cluster']})")
+        if merger is not None:
+            report = merger.report()
+            state['reports']['merge'] = report
+            print(f"🧩 Merged {report['hits']:,} hits into {report['spans']:,} spans, "
+                  f"saved {report['tokens_saved']:,} tokens ({report['saved_percent']}%)")
+        print(f"✅ Wrote {sink.count} concordances for '{word}'")
+        return sink
+
+    def _harvest_word(self, word: str, corpus: str, journal: HarvestJournal,
+                      output_dir: str, store_root: Optional[str]) -> Dict:
+        """Harvest one word and record the outcome in the journal"""
+        state = {}
+        try:
+            sink = self.stream_single_word(word, corpus, output_dir, store_root, state)
+        except Exception as e:
+            print(f"❌ Error processing '{word}': {e}")
+            journal.record(word, 'failed', error=str(e))
+            return journal.entries[word]
+        
+        written = sink.count if sink else 0
+        fetched = state.get('fetched', 0)
+        status = state.get('status', 'failed')
+        if status == 'done' and fetched != state['expected']:
+            status = 'incomplete'
+        journal.record(word, status,
+                       hits=state.get('total_hits', 0),
+                       expected=state.get('expected', 0),
+                       written=written,
+                       missing_pages=state.get('failed_pages'),
+                       fetched=fetched,
+                       reports=state.get('reports'))
+        
+        if sink and sink.sample:
+            print(f"\n📄 Sample concordances for '{word}':")
+            self.print_concordances(sink.sample, limit=3)
+        return journal.entries[word]
+
+    def harvest_words(self,
+                      words: List[str],
+                      corpus: str,
+                      journal: HarvestJournal,
+                      max_concurrent_words: int = 2,
+                      output_dir: str = ".",
+                      store_root: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        Harvest many words concurrently, resuming from the journal
+
+        Words already recorded as complete (and whose output on disk still
+        has the recorded number of lines) are skipped. The total number of
+        HTTP requests in flight is limited by the transport's max_in_flight.
+
+        Args:
+            words: Words to harvest (repeated words are harvested once)
+            corpus: Corpus name
+            journal: Journal of finished words
+            max_concurrent_words: How many words are processed at the same time
+            output_dir: Directory for the per-word files
+            store_root: If given, write into the columnar concordance store
+
+        Returns:
+            Journal entry for every word, keyed by word
+        """
+        # Korduvad sõnad jäävad välja (järjekord säilib), muidu kirjutaksid kaks lõime sama faili
+        words = list(dict.fromkeys(words))
+        count_output = lambda w: count_output_lines(w, output_dir, store_root)
+        todo = [w for w in words if not journal.is_complete(w, count_output)]
+        skipped = len(words) - len(todo)
+        if skipped:
+            print(f"⏭️ Skipping {skipped} words already complete in {journal.path}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_words)) as executor:
+            futures = {executor.submit(self._harvest_word, word, corpus, journal,
+                                       output_dir, store_root): word for word in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                entry = future.result()
+                print(f"📌 [{i}/{len(todo)}] {entry['word']}: {entry['status']} "
+                      f"({entry['written']:,}/{entry['expected']:,} lines)")
+        
+        return {word: journal.entries[word] for word in words if word in journal.entries}
+
+def count_output_lines(word: str, output_dir: str = ".", store_root: Optional[str] = None) -> Optional[int]:
+    """
+    Count the concordance lines currently on disk for a word
+
+    Returns:
+        Number of lines, or None if the output is missing
+    """
+    if store_root:
+        table = load_lemma(word, store_root, columns=['hit_id'])
+        return table.num_rows if table is not None else None
+    path = os.path.join(output_dir, f"{safe_filename(word)}_full_context_only.txt")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
 def read_words_from_file(filename: str = "SkE_sisend.txt") -> List[str]:
     """
     Read words from input file, one word per line
@@ -326,9 +661,29 @@ def main():
     USERNAME = ""
     API_KEY = ""
     CORPUS = "preloaded/estonian_nc23"
+    MAX_WORKERS = 4  # mitu lehekülge korraga pärida
+    MAX_CONCURRENT_WORDS = 2  # mitu sõna korraga töödelda
+    MAX_IN_FLIGHT = 6  # ülemine piir samaaegsetele päringutele kokku
+    CACHE_PATH = "ske_cache.sqlite"  # korduval käivitusel ei pärita samu lehekülgi uuesti
+    STORE_ROOT = None  # nt "concordance_store", et kirjutada veerupõhisesse hoidlasse (vajab pyarrow)
+    JOURNAL_PATH = "harvest_journal.jsonl"  # lõpetatud sõnad; katkestuse järel jätkatakse siit
+    SAMPLE_SIZE = None  # nt 2000, et kõigi vastete asemel pärida juhuslik valim
+    STRATIFY_BY_GENRE = True  # valim jaotatakse žanrite (blogs/forums/periodicals) vahel nagu korpuses
+    MERGE_CONTEXTS = False  # sama dokumendi kattuvad kontekstiaknad ühendatakse üheks lõiguks
+    DEDUP_THRESHOLD = None  # nt 0.8, et jätta välja peaaegu korduvad read (vajab numpy)
+    LOCAL_CORPUS = None  # nt "estonian_nc23.idx" või .vrt fail, et pärida kohalikust korpusest ilma APIta
     
     # API klient
-    api = SketchEngineAPI(USERNAME, API_KEY)
+    if LOCAL_CORPUS:
+        transport = LocalCorpusTransport.from_file(LOCAL_CORPUS)
+    else:
+        transport = SkeTransport(cache=ResponseCache(CACHE_PATH),
+                                 pool_size=max(10, MAX_IN_FLIGHT),
+                                 max_in_flight=MAX_IN_FLIGHT)
+    api = SketchEngineAPI(USERNAME, API_KEY, max_workers=MAX_WORKERS, transport=transport,
+                          sample_size=SAMPLE_SIZE, stratify_by_genre=STRATIFY_BY_GENRE,
+                          merge_contexts=MERGE_CONTEXTS, dedup_threshold=DEDUP_THRESHOLD)
+    journal = HarvestJournal(JOURNAL_PATH)
     
     # Loe sõnad sisendfailist
     words = read_words_from_file("SkE_sisend.txt")
@@ -340,54 +695,18 @@ def main():
     print(f"\n🚀 Starting to process {len(words)} words from SkE_sisend.txt")
     print(f"Corpus: {CORPUS}")
     print(f"Context: 3 sentences before + 3 sentences after")
+    if SAMPLE_SIZE:
+        print(f"Sample: {SAMPLE_SIZE} hits per word" + (" (stratified by genre)" if STRATIFY_BY_GENRE else ""))
     
-    # Töötle iga sõna
-    all_results = {}
-    successful_words = []
-    failed_words = []
+    # Töötle sõnu (leheküljed kirjutatakse faili kohe, iga lõpetatud sõna märgitakse logisse)
+    results = api.harvest_words(words, CORPUS, journal,
+                                max_concurrent_words=MAX_CONCURRENT_WORDS,
+                                store_root=STORE_ROOT)
     
-    for i, word in enumerate(words, 1):
-        print(f"\n🔄 [{i}/{len(words)}] Processing '{word}'...")
-        
-        try:
-            concordances = api.process_single_word(word, CORPUS)
-            
-            if concordances and len(concordances) > 0:
-                all_results[word] = concordances
-                successful_words.append(word)
-                
-                # Eraldi failid igale sõnale
-                safe_word = word.replace('/', '_').replace('\\', '_')  # Safe filename
-                
-                # Salvesta JSON
-                api.save_concordances(
-                    concordances, 
-                    f"{safe_word}_concordances.json"
-                )
-                
-                # Salvesta CSV
-                api.save_concordances_csv(
-                    concordances, 
-                    f"{safe_word}_concordances.csv"
-                )
-                
-                # Salvesta täiskontekstid
-                api.save_full_context_only(
-                    concordances, 
-                    f"{safe_word}_full_context_only.txt"
-                )
-                
-                # Prindi mõned näited
-                print(f"\n📄 Sample concordances for '{word}':")
-                api.print_concordances(concordances, limit=3)
-                
-            else:
-                failed_words.append(word)
-                print(f"❌ No concordances found for '{word}'")
-                
-        except Exception as e:
-            failed_words.append(word)
-            print(f"❌ Error processing '{word}': {e}")
+    successful_words = [w for w in words if results.get(w, {}).get('status') in ('done', 'incomplete')]
+    failed_words = [w for w in words if w not in successful_words]
+    incomplete_words = {w: results[w]['missing_pages'] for w in successful_words
+                        if results[w]['status'] == 'incomplete'}
     
     # Kokkuvõte
     print(f"\n{'='*70}")
@@ -400,7 +719,7 @@ def main():
     if successful_words:
         print(f"\n✅ Successfully processed words:")
         for word in successful_words:
-            count = len(all_results[word])
+            count = results[word]['written']
             print(f"  - {word}: {count:,} concordances")
     
     if failed_words:
@@ -408,6 +727,29 @@ def main():
         for word in failed_words:
             print(f"  - {word}")
     
+    if incomplete_words:
+        print(f"\n⚠️ Words with missing pages (rerun to retry them):")
+        for word, pages in incomplete_words.items():
+            print(f"  - {word}: pages {pages}")
+    
+    dedup_report = {w: results[w]['reports']['dedup'] for w in successful_words
+                    if 'dedup' in results[w].get('reports', {})}
+    if dedup_report:
+        print(f"\n🧹 Near-duplicates removed:")
+        for word, report in dedup_report.items():
+            print(f"  - {word}: {report['removed']:,} of {report['lines']:,} lines "
+                  f"({report['duplicate_clusters']:,} clusters, largest {report['largest_cluster']})")
+    
+    merge_report = {w: results[w]['reports']['merge'] for w in successful_words
+                    if 'merge' in results[w].get('reports', {})}
+    if merge_report:
+        print(f"\n🧩 Tokens saved by merging overlapping contexts:")
+        for word, report in merge_report.items():
+            print(f"  - {word}: {report['tokens_saved']:,} of {report['tokens_before']:,} "
+                  f"({report['saved_percent']}%), {report['hits']:,} hits -> {report['spans']:,} spans")
+    
+    api.transport.stats.print_summary()
+    
     # Salvesta kokkuvõte
     summary = {
         'total_words': len(words),
@@ -415,7 +757,11 @@ def main():
         'failed_words': len(failed_words),
         'successful_list': successful_words,
         'failed_list': failed_words,
-        'results_summary': {word: len(concordances) for word, concordances in all_results.items()}
+        'incomplete_words': incomplete_words,
+        'results_summary': {word: results[word]['written'] for word in successful_words},
+        'dedup_report': dedup_report,
+        'merge_report': merge_report,
+        'transport': api.transport.stats.summary()
     }
     
     with open('processing_summary.json', 'w', encoding='utf-8') as f:
@@ -423,9 +769,13 @@ def main():
     
     print(f"\n📁 Files created:")
     print(f"  - processing_summary.json (overall summary)")
+    print(f"  - {JOURNAL_PATH} (per-word journal)")
+    if STORE_ROOT:
+        print(f"  - {STORE_ROOT}/ (lemma=<word>/{len(successful_words)} partitions)")
+        return
     for word in successful_words:
-        safe_word = word.replace('/', '_').replace('\\', '_')
-        print(f"  - {safe_word}_concordances.json")
+        safe_word = safe_filename(word)
+        print(f"  - {safe_word}_concordances.jsonl")
         print(f"  - {safe_word}_concordances.csv") 
         print(f"  - {safe_word}_full_context_only.txt")
 
@@ -0,0 +1,565 @@
+#Kohalik korpus Sketch Engine'i API asemel: vertikaalformaadis (VRT) korpuse lugemine,
+#sõnavormi ja lemma pöördindeks ning dokumentide metaandmed. LocalCorpusTransport vastab samadele
+#/view, /wordlist ja /freqs päringutele sama JSON-kujuga, nii et SketchEngineAPI ja katse2_sagedused.py
+#töötavad ilma võrguühenduseta.
+#Indeks on kaust lamedate numpy failidega (sõnede id-d, fikseeritud laiusega positsioonid iga atribuudi
+#kohta, lause- ja dokumendipiirid), mis avatakse mälukaardistatult alles esimesel kasutusel, nii et
+#ka mitme miljardi sõnega korpust ei loeta tervikuna mällu. Vajab paketti numpy.
+#
+#Indeksi ehitamine: python local_corpus.py korpus.vrt korpus.idx
+
+import json
+import os
+import random
+import re
+import sys
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ske_transport import SkeRequestError, TransportStats
+
+try:
+    import numpy as np
+except ImportError:  # numpy on valikuline sõltuvus
+    np = None
+
+INDEX_VERSION = 2
+ATTRS = ('word', 'lemma')
+NONE_VALUE = '===NONE==='  # Sketch Engine'i nimi puuduvale metaandmete väärtusele
+# Mitu väärtust kogutakse enne faili kirjutamist ja mitu positsiooni töödeldakse postituste ehitamisel korraga
+WRITE_BLOCK = 1 << 20
+POSTINGS_BLOCK = 1 << 24
+
+TAG_RE = re.compile(r'^<(/?)([\w.]+)((?:\s+[\w.]+="[^"]*")*)\s*/?>$')
+ATTR_RE = re.compile(r'([\w.]+)="([^"]*)"')
+CQL_RE = re.compile(r'^q?\[(?P<conds>.*)\]\s*(?:within\s*<(?P<struct>\w+)\s+(?P<attr>\w+)="(?P<value>(?:[^"\\]|\\.)*)"\s*/>)?$')
+COND_RE = re.compile(r'(\w+)\s*=\s*"((?:[^"\\]|\\.)*)"')
+CTX_RE = re.compile(r'^-?(\d+)(?::(\w+))?#?$')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Kohalik korpus vajab paketti numpy (pip install numpy)")
+
+
+def iter_vrt(path: str) -> Iterator[Tuple[str, object]]:
+    """
+    Read a vertical file
+
+    Yields:
+        ('token', [columns]), ('open', (name, attrs)) or ('close', name)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('<'):
+                match = TAG_RE.match(line)
+                if match:
+                    closing, name, attrs = match.groups()
+                    if closing:
+                        yield 'close', name
+                    elif not line.endswith('/>'):
+                        yield 'open', (name, dict(ATTR_RE.findall(attrs)))
+                    continue
+            yield 'token', line.split('\t')
+
+
+class _ColumnWriter:
+    def __init__(self, path: str, dtype):
+        """Raw numpy column file that is appended to in blocks"""
+        self._file = open(path, 'wb')
+        self._dtype = dtype
+        self._block: List[int] = []
+
+    def append(self, value: int):
+        self._block.append(value)
+        if len(self._block) >= WRITE_BLOCK:
+            self.flush()
+
+    def flush(self):
+        if self._block:
+            np.asarray(self._block, dtype=self._dtype).tofile(self._file)
+            self._block = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def _write_postings(path: str, tokens, vocab_size: int, dtype):
+    """
+    Write the positions of every vocabulary id, id by id, as one fixed-width column
+
+    A counting sort over blocks of the token column: the positions of id i
+    end up in postings[offsets[i]:offsets[i + 1]], in corpus order.
+
+    Returns:
+        offsets (int64 array of length vocab_size + 1)
+    """
+    size = len(tokens)
+    offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    for start in range(0, size, POSTINGS_BLOCK):
+        offsets[1:] += np.bincount(tokens[start:start + POSTINGS_BLOCK], minlength=vocab_size)
+    np.cumsum(offsets, out=offsets)
+    if size == 0:
+        open(path, 'wb').close()
+        return offsets
+
+    postings = np.memmap(path, dtype=dtype, mode='w+', shape=(size,))
+    fill = offsets[:-1].copy()
+    for start in range(0, size, POSTINGS_BLOCK):
+        block = np.asarray(tokens[start:start + POSTINGS_BLOCK])
+        order = np.argsort(block, kind='stable')
+        ids = block[order]
+        # Iga positsiooni järjekorranumber oma id rühmas
+        run_starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        run_lengths = np.diff(np.r_[run_starts, len(ids)])
+        rank = np.arange(len(ids)) - np.repeat(run_starts, run_lengths)
+        postings[fill[ids] + rank] = order + start
+        fill += np.bincount(block, minlength=vocab_size)
+    postings.flush()
+    del postings
+    return offsets
+
+
+class LocalCorpusIndex:
+    def __init__(self, path: str):
+        """
+        Open a corpus index directory
+
+        Token ids, postings and sentence and document boundaries are flat
+        numpy files that are memory-mapped on first use; the vocabulary and
+        the document metadata are read on first use as well.
+
+        Use LocalCorpusIndex.build() to create the directory from a VRT file.
+
+        Args:
+            path: Index directory written by build()
+        """
+        _require_numpy()
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}: {meta.get('version')}")
+        self.path = path
+        self.size: int = meta['size']
+        self.attrs: Tuple[str, ...] = tuple(meta['attrs'])
+        self._position_dtype = np.dtype(meta['position_dtype'])
+        self._arrays: Dict[str, object] = {}
+        self._vocab: Dict[str, List[str]] = {}
+        self._docs: Optional[List[Dict[str, str]]] = None
+        self._ids: Dict[str, Dict[str, int]] = {}
+        self._lc_ids: Dict[str, Dict[str, List[int]]] = {}
+
+    @classmethod
+    def build(cls, path: str, index_path: str,
+              word_column: int = 0, lemma_column: int = 1) -> 'LocalCorpusIndex':
+        """
+        Build the index directory from a VRT file (one token per line, tab-separated columns)
+
+        Only the vocabularies are kept in memory; token ids and boundaries
+        are streamed to disk and the postings are sorted block by block.
+
+        Args:
+            path: Vertical file with <doc ...> and <s> structures
+            index_path: Directory for the index files
+            word_column: Column of the word form
+            lemma_column: Column of the lemma (the word form is used if missing)
+        """
+        _require_numpy()
+        started = time.perf_counter()
+        os.makedirs(index_path, exist_ok=True)
+        meta_path = os.path.join(index_path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        ids: Dict[str, Dict[str, int]] = {attr: {} for attr in ATTRS}
+        tokens = {attr: _ColumnWriter(os.path.join(index_path, f'{attr}.tokens'), np.uint32) for attr in ATTRS}
+        sent_starts = _ColumnWriter(os.path.join(index_path, 'sent_starts'), np.int64)
+        doc_starts = _ColumnWriter(os.path.join(index_path, 'doc_starts'), np.int64)
+        size = docs = 0
+
+        with open(os.path.join(index_path, 'docs.jsonl'), 'w', encoding='utf-8') as doc_file:
+            for kind, value in iter_vrt(path):
+                if kind == 'token':
+                    columns = value
+                    word = columns[word_column]
+                    lemma = columns[lemma_column] if len(columns) > lemma_column else word
+                    for attr, string in (('word', word), ('lemma', lemma)):
+                        token_id = ids[attr].get(string)
+                        if token_id is None:
+                            token_id = ids[attr][string] = len(ids[attr])
+                        tokens[attr].append(token_id)
+                    size += 1
+                elif kind == 'open':
+                    name, attrs = value
+                    if name == 'doc':
+                        doc_starts.append(size)
+                        doc_file.write(json.dumps(attrs, ensure_ascii=False) + '\n')
+                        docs += 1
+                    elif name == 's':
+                        sent_starts.append(size)
+        for writer in (*tokens.values(), sent_starts, doc_starts):
+            writer.close()
+
+        position_dtype = np.uint32 if size < 2 ** 32 else np.uint64
+        for attr in ATTRS:
+            with open(os.path.join(index_path, f'{attr}.vocab'), 'w', encoding='utf-8', newline='\n') as f:
+                for string in ids[attr]:
+                    f.write(string + '\n')
+            token_path = os.path.join(index_path, f'{attr}.tokens')
+            column = np.memmap(token_path, dtype=np.uint32, mode='r') if size else np.zeros(0, dtype=np.uint32)
+            offsets = _write_postings(os.path.join(index_path, f'{attr}.postings'), column,
+                                      len(ids[attr]), position_dtype)
+            del column
+            offsets.tofile(os.path.join(index_path, f'{attr}.offsets'))
+
+        # meta.json kirjutatakse viimasena: pooleli ehitatud kausta ei saa avada
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'size': size, 'attrs': list(ATTRS),
+                       'position_dtype': np.dtype(position_dtype).name}, f)
+        print(f"📚 Indexed {size:,} tokens, {docs:,} documents, "
+              f"{len(ids['lemma']):,} lemmas in {time.perf_counter() - started:.1f}s")
+        return cls(index_path)
+
+    @classmethod
+    def load(cls, path: str) -> 'LocalCorpusIndex':
+        return cls(path)
+
+    def _array(self, name: str, dtype):
+        """Memory-mapped index file (opened on first use)"""
+        if name not in self._arrays:
+            file = os.path.join(self.path, name)
+            # Tühja faili ei saa mälukaardistada
+            if os.path.getsize(file) == 0:
+                self._arrays[name] = np.zeros(0, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(file, dtype=dtype, mode='r')
+        return self._arrays[name]
+
+    def _check_attr(self, attr: str):
+        if attr not in self.attrs:
+            raise SkeRequestError(f"Attribute '{attr}' is not indexed")
+
+    def vocab(self, attr: str) -> List[str]:
+        """Strings of an attribute, indexed by id"""
+        if attr not in self._vocab:
+            self._check_attr(attr)
+            with open(os.path.join(self.path, f'{attr}.vocab'), 'r', encoding='utf-8', newline='\n') as f:
+                self._vocab[attr] = f.read().split('\n')[:-1]
+        return self._vocab[attr]
+
+    def tokens(self, attr: str):
+        return self._array(f'{attr}.tokens', np.uint32)
+
+    def freqs(self, attr: str):
+        """Corpus frequency of every id of an attribute"""
+        return np.diff(self._array(f'{attr}.offsets', np.int64))
+
+    def postings(self, attr: str, token_id: int):
+        """Sorted corpus positions of one id"""
+        offsets = self._array(f'{attr}.offsets', np.int64)
+        return self._array(f'{attr}.postings', self._position_dtype)[offsets[token_id]:offsets[token_id + 1]]
+
+    @property
+    def sent_starts(self):
+        return self._array('sent_starts', np.int64)
+
+    @property
+    def doc_starts(self):
+        return self._array('doc_starts', np.int64)
+
+    @property
+    def docs(self) -> List[Dict[str, str]]:
+        if self._docs is None:
+            with open(os.path.join(self.path, 'docs.jsonl'), 'r', encoding='utf-8') as f:
+                self._docs = [json.loads(line) for line in f]
+        return self._docs
+
+    def _vocab_ids(self, attr: str) -> Dict[str, int]:
+        if attr not in self._ids:
+            self._ids[attr] = {string: i for i, string in enumerate(self.vocab(attr))}
+        return self._ids[attr]
+
+    def _lowercase_ids(self, attr: str) -> Dict[str, List[int]]:
+        if attr not in self._lc_ids:
+            lc_ids = {}
+            for i, string in enumerate(self.vocab(attr)):
+                lc_ids.setdefault(string.lower(), []).append(i)
+            self._lc_ids[attr] = lc_ids
+        return self._lc_ids[attr]
+
+    def matching_ids(self, attr: str, value: str) -> Tuple[str, List[int]]:
+        """
+        Resolve a CQL attribute condition to vocabulary ids
+
+        Values are regular expressions as in Sketch Engine; plain strings are
+        looked up directly. 'lc' and 'lemma_lc' match lowercased forms.
+
+        Returns:
+            (base attribute, list of ids)
+        """
+        lowercase = attr in ('lc', 'lemma_lc')
+        base = {'lc': 'word', 'lemma_lc': 'lemma'}.get(attr, attr)
+        self._check_attr(base)
+
+        if not any(c in value for c in '.*+?[](){}|^$\\'):
+            if lowercase:
+                return base, list(self._lowercase_ids(base).get(value.lower(), []))
+            token_id = self._vocab_ids(base).get(value)
+            return base, [] if token_id is None else [token_id]
+
+        pattern = re.compile(value, re.IGNORECASE if lowercase else 0)
+        return base, [i for i, string in enumerate(self.vocab(base)) if pattern.fullmatch(string)]
+
+    def positions(self, conditions: List[Tuple[str, str]]):
+        """Sorted corpus positions (numpy array) matching any of the (attribute, value) conditions"""
+        parts = []
+        for attr, value in conditions:
+            base, ids = self.matching_ids(attr, value)
+            parts.extend(self.postings(base, token_id) for token_id in ids)
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        if len(parts) == 1:
+            return np.asarray(parts[0], dtype=np.int64)
+        return np.unique(np.concatenate(parts).astype(np.int64))
+
+    def doc_of(self, positions):
+        """Document number of a position or an array of positions (-1 before the first document)"""
+        return np.searchsorted(self.doc_starts, positions, side='right').astype(np.int64) - 1
+
+    def doc_attr(self, position: int, attr: str) -> str:
+        doc = int(self.doc_of(position))
+        return self.docs[doc].get(attr, '') if doc >= 0 else ''
+
+    def doc_values(self, positions, attr: str) -> List[str]:
+        """Value of a doc attribute for every position"""
+        values = [doc.get(attr, '') for doc in self.docs] + ['']
+        # Enne esimest dokumenti olev positsioon (-1) saab tühja väärtuse
+        return [values[doc] for doc in self.doc_of(positions).tolist()]
+
+    def doc_sizes(self, attr: str) -> Dict[str, int]:
+        """Number of tokens per value of a doc attribute"""
+        starts = self.doc_starts
+        lengths = np.diff(np.r_[starts, self.size]).tolist()
+        sizes = {}
+        for doc, length in zip(self.docs, lengths):
+            value = doc.get(attr, '')
+            sizes[value] = sizes.get(value, 0) + length
+        return sizes
+
+    def context_bounds(self, start: int, end: int, leftctx: str, rightctx: str) -> Tuple[int, int]:
+        """
+        Resolve Sketch Engine context specifications such as '-3:s' or '40'
+
+        'N:s' covers the sentence of the hit and N-1 sentences further, as in
+        the Sketch Engine 'kwicleftctx=-1:s' = "to the start of the sentence".
+        """
+        left = self._context_edge(start, leftctx, direction=-1)
+        right = self._context_edge(end - 1, rightctx, direction=1)
+        return left, right
+
+    def _context_edge(self, position: int, spec: str, direction: int) -> int:
+        match = CTX_RE.match(str(spec).strip())
+        if not match:
+            raise SkeRequestError(f"Unsupported context specification: {spec}")
+        count, struct = int(match.group(1)), match.group(2)
+        sent_starts = self.sent_starts
+        if struct is None:
+            edge = position + direction * count
+        elif struct == 's' and len(sent_starts):
+            sentence = max(0, int(np.searchsorted(sent_starts, position, side='right')) - 1)
+            if direction < 0:
+                edge = int(sent_starts[max(0, sentence - max(0, count - 1))])
+            else:
+                last = sentence + max(0, count - 1)
+                edge = int(sent_starts[last + 1]) - 1 if last + 1 < len(sent_starts) else self.size - 1
+        elif struct == 's':
+            edge = 0 if direction < 0 else self.size - 1
+        else:
+            raise SkeRequestError(f"Unsupported context structure: {struct}")
+        return min(max(edge, 0), self.size - 1)
+
+    def token_dicts(self, start: int, end: int) -> List[Dict[str, str]]:
+        words = self.vocab('word')
+        return [{'str': words[token_id]} for token_id in self.tokens('word')[start:end].tolist()]
+
+
+def parse_cql(query: str) -> Tuple[List[Tuple[str, str]], Optional[Tuple[str, str]]]:
+    """
+    Parse the CQL subset used in this repository
+
+    Supports one token with '|'-separated attribute conditions, optionally
+    followed by 'within <doc attr="value" />'.
+
+    Returns:
+        (list of (attribute, value), (doc attribute, value) or None)
+    """
+    match = CQL_RE.match(query.strip())
+    if not match:
+        raise SkeRequestError(f"Unsupported query: {query}")
+    conds = match.group('conds')
+    if '&' in conds:
+        raise SkeRequestError(f"Unsupported query (only '|' is supported): {query}")
+    conditions = [(attr, value.replace('\\"', '"')) for attr, value in COND_RE.findall(conds)]
+    if not conditions:
+        raise SkeRequestError(f"Unsupported query: {query}")
+    within = None
+    if match.group('struct'):
+        if match.group('struct') != 'doc':
+            raise SkeRequestError(f"Only 'within <doc .../>' is supported: {query}")
+        within = (match.group('attr'), match.group('value').replace('\\"', '"'))
+    return conditions, within
+
+
+class LocalCorpusTransport:
+    def __init__(self, index: LocalCorpusIndex):
+        """
+        Answer Sketch Engine API requests from a LocalCorpusIndex
+
+        Has the same get_json/stats/close interface as SkeTransport, so it can
+        be passed to SketchEngineAPI(transport=...) in its place.
+
+        Args:
+            index: The local corpus index
+        """
+        self.index = index
+        self.stats = TransportStats()
+
+    @classmethod
+    def from_file(cls, path: str) -> 'LocalCorpusTransport':
+        """
+        Open an index directory (.idx), or a VRT file whose index is kept in <file>.idx
+
+        The index of a VRT file is built on first use and rebuilt when the
+        file is newer than the index.
+        """
+        if path.endswith(('.vrt', '.vert')):
+            index_path = path + '.idx'
+            meta_path = os.path.join(index_path, 'meta.json')
+            if os.path.exists(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(path):
+                return cls(LocalCorpusIndex.load(index_path))
+            return cls(LocalCorpusIndex.build(path, index_path))
+        return cls(LocalCorpusIndex.load(path))
+
+    def get_json(self, endpoint: str, params: Dict) -> Dict:
+        handlers = {'view': self._view, 'wordlist': self._wordlist, 'freqs': self._freqs}
+        if endpoint not in handlers:
+            self.stats.record_failure()
+            raise SkeRequestError(f"Endpoint '{endpoint}' is not supported by the local corpus")
+        started = time.perf_counter()
+        try:
+            return handlers[endpoint](params)
+        except (SkeRequestError, re.error) as e:
+            self.stats.record_failure()
+            raise SkeRequestError(str(e)) from e
+        finally:
+            self.stats.record(time.perf_counter() - started)
+
+    def _hits(self, q) -> Tuple[List[int], Optional[int]]:
+        """Hit positions of a query and the sample size of an 'rN' operation"""
+        operations = q if isinstance(q, list) else [q]
+        conditions, within = parse_cql(operations[0])
+        hits = self.index.positions(conditions)
+        if within:
+            attr, value = within
+            allowed = np.array([doc.get(attr, '') == value for doc in self.index.docs] + [False])
+            hits = hits[allowed[self.index.doc_of(hits)]]
+        hits = hits.tolist()
+
+        sample = None
+        for op in operations[1:]:
+            if re.fullmatch(r'r\d+', op):
+                sample = int(op[1:])
+            else:
+                raise SkeRequestError(f"Unsupported query operation: {op}")
+        if sample is not None and sample < len(hits):
+            # Sama päring annab alati sama valimi
+            rng = random.Random(zlib.crc32(repr(operations).encode('utf-8')))
+            hits = sorted(rng.sample(hits, sample))
+        return hits, sample
+
+    def _view(self, params: Dict) -> Dict:
+        index = self.index
+        hits, _ = self._hits(params['q'])
+        pagesize = int(params.get('pagesize', 20))
+        fromp = int(params.get('fromp', 1))
+        refs = [ref.lstrip('=') for ref in params.get('refs', '').split(',') if ref]
+
+        page = hits[(fromp - 1) * pagesize:fromp * pagesize]
+        doc_refs = {ref: index.doc_values(page, ref.split('.', 1)[1]) for ref in refs if ref.startswith('doc.')}
+
+        lines = []
+        for i, pos in enumerate(page):
+            left, right = index.context_bounds(pos, pos + 1,
+                                               params.get('kwicleftctx', '-5'),
+                                               params.get('kwicrightctx', '5'))
+            line = {
+                'toknum': pos,
+                'Left': index.token_dicts(left, pos),
+                'Kwic': index.token_dicts(pos, pos + 1),
+                'Right': index.token_dicts(pos + 1, right + 1),
+            }
+            if refs:
+                line['Refs'] = [doc_refs[ref][i] if ref in doc_refs else '' for ref in refs]
+            lines.append(line)
+        return {'Lines': lines, 'fullsize': len(hits), 'concsize': len(hits)}
+
+    def _wordlist(self, params: Dict) -> Dict:
+        index = self.index
+        attr = params.get('wlattr', 'word')
+        vocab = index.vocab(attr)
+        pattern = re.compile(params.get('wlpat', '.*'))
+        minfreq = int(params.get('wlminfreq', 1))
+        maxitems = int(params.get('wlmaxitems', 100))
+
+        freqs = index.freqs(attr)
+        candidates = np.flatnonzero(freqs >= minfreq).tolist()
+        items = [(int(freqs[i]), vocab[i]) for i in candidates if pattern.fullmatch(vocab[i])]
+        items.sort(key=lambda item: (-item[0], item[1]))
+        return {
+            'Items': [{'str': string, 'frq': frq, 'relfreq': round(frq / index.size * 1e6, 5)}
+                      for frq, string in items[:maxitems]],
+            'total': len(items),
+        }
+
+    def _freqs(self, params: Dict) -> Dict:
+        index = self.index
+        fcrit = params.get('fcrit', '')
+        match = re.fullmatch(r'doc\.(\w+)(?:\s+\d+)?', fcrit.strip())
+        if not match:
+            raise SkeRequestError(f"Only doc.* frequency criteria are supported: {fcrit}")
+        attr = match.group(1)
+        hits, _ = self._hits(params['q'])
+        if not hits:
+            return {'Blocks': [{'Items': []}]}
+
+        counts: Dict[str, int] = {}
+        for value in index.doc_values(hits, attr):
+            counts[value] = counts.get(value, 0) + 1
+        sizes = index.doc_sizes(attr)
+        overall = len(hits) / index.size
+
+        items = []
+        for value, frq in sorted(counts.items(), key=lambda item: -item[1]):
+            # 'rel' nagu Sketch Engine'is: suhteline sagedus selles tekstitüübis võrreldes kogu korpusega (%)
+            rel = 100 * (frq / sizes[value]) / overall if sizes.get(value) else 0
+            items.append({'Word': [{'n': value or NONE_VALUE}], 'frq': frq, 'rel': round(rel, 5)})
+        return {'Blocks': [{'Items': items, 'total': len(hits)}]}
+
+    def close(self):
+        pass
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Kasutus: python local_corpus.py korpus.vrt korpus.idx")
+        return
+    vrt_path, index_path = sys.argv[1:]
+    LocalCorpusIndex.build(vrt_path, index_path)
+    print(f"💾 Index saved to {index_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#Kohalik Sketch Engine'i API asendaja jõudluse mõõtmiseks ja kliendi muudatuste kontrollimiseks.
+#Vastab /view, /wordlist ja /freqs päringutele sama JSON-kujuga kui bonito run.cgi, aga andmed
+#genereeritakse: vastete arv (fullsize), latentsus, lehekülje suurus ja 429-vastused on seadistatavad.
+#/view lehekülgede JSON tehakse üks kord ja hoitakse baitidena vahemälus (prerender() teeb need enne mõõtmist
+#valmis), nii et jõudlustest mõõdab klienti, mitte serveri JSON-i kokkupanekut.
+#
+#Käivitamine eraldi: python mock_ske_server.py 8765  (klient: SkeTransport(base_url="http://127.0.0.1:8765/bonito/run.cgi"))
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+GENRES = ['blogs', 'forums', 'periodicals', '===NONE===']
+HITS_PER_DOC = 10
+TOKEN_GAP = 37  # vastete vahe korpuses (tokenites arv)
+CORPUS_SIZE = 3_800_000_000  # umbes nagu estonian_nc23
+
+WORD_RE = re.compile(r'(?:word|lemma)="((?:[^"\\]|\\.)*)"')
+WITHIN_RE = re.compile(r'within\s*<doc\s+genre="((?:[^"\\]|\\.)*)"')
+
+
+def _encode(body: Dict) -> bytes:
+    return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+class MockSkeServer:
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 fullsize: Union[int, Dict[str, int], Callable[[str], int]] = 5000,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 max_pagesize: Optional[int] = None,
+                 context_tokens: int = 20,
+                 rate_limit_every: int = 0,
+                 rate_limit_probability: float = 0.0,
+                 retry_after: Optional[float] = 0.0,
+                 seed: int = 0,
+                 body_cache_bytes: int = 512 * 1024 ** 2):
+        """
+        Threaded HTTP server that imitates the Sketch Engine bonito API
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            fullsize: Hits per word: one number, {word: hits} or a function of the word
+            latency: Seconds every response is delayed
+            jitter: Extra random delay of up to this many seconds
+            max_pagesize: Largest page the server returns, whatever the client asks for
+            context_tokens: Tokens in the left and right context of every line
+            rate_limit_every: Answer every N-th request with 429 (0 = never)
+            rate_limit_probability: Answer requests with 429 at this probability
+            retry_after: Value of the Retry-After header on 429 responses (None = no header)
+            seed: Seed for jitter and random 429 responses
+            body_cache_bytes: Size limit of the cached /view response bodies
+        """
+        self.fullsize = fullsize
+        self.latency = latency
+        self.jitter = jitter
+        self.max_pagesize = max_pagesize
+        self.context_tokens = context_tokens
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.body_cache_bytes = body_cache_bytes
+
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.rate_limited = 0
+        self._count = 0
+        self._hits: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        self._bodies: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+        self._body_bytes = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to pass to SkeTransport(base_url=...)"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/bonito/run.cgi"
+
+    def hits_for(self, word: str) -> int:
+        if callable(self.fullsize):
+            return self.fullsize(word)
+        if isinstance(self.fullsize, dict):
+            return self.fullsize.get(word, 0)
+        return self.fullsize
+
+    def _hit_numbers(self, word: str, genre: Optional[str]) -> List[int]:
+        key = (word, genre)
+        with self._lock:
+            hits = self._hits.get(key)
+        if hits is None:
+            total = self.hits_for(word)
+            if genre is None:
+                hits = list(range(total))
+            else:
+                hits = [i for i in range(total) if GENRES[(i // HITS_PER_DOC) % len(GENRES)] == genre]
+            with self._lock:
+                self._hits[key] = hits
+        return hits
+
+    def _line(self, word: str, i: int) -> Dict:
+        doc = i // HITS_PER_DOC
+        toknum = i * TOKEN_GAP
+        n = self.context_tokens
+        return {
+            'toknum': toknum,
+            'Left': [{'str': f"v{toknum - n + k}"} for k in range(n)],
+            'Kwic': [{'str': word}],
+            'Right': [{'str': f"p{toknum + 1 + k}"} for k in range(n)],
+            'Refs': [f"doc{doc}", GENRES[doc % len(GENRES)]],
+        }
+
+    @staticmethod
+    def _query_terms(params: Dict[str, List[str]]) -> Tuple[str, Optional[str], Tuple[str, ...]]:
+        """(word, genre, further operations) of the 'q' parameter"""
+        operations = params.get('q', [''])
+        match = WORD_RE.search(operations[0])
+        word = match.group(1).replace('\\"', '"') if match else ''
+        within = WITHIN_RE.search(operations[0])
+        genre = within.group(1).replace('\\"', '"') if within else None
+        return word, genre, tuple(operations[1:])
+
+    def _parse_query(self, params: Dict[str, List[str]]):
+        word, genre, operations = self._query_terms(params)
+        hits = self._hit_numbers(word, genre)
+        for op in operations:
+            if re.fullmatch(r'r\d+', op) and int(op[1:]) < len(hits):
+                sample = random.Random(f"{word}|{genre}|{op}").sample(hits, int(op[1:]))
+                hits = sorted(sample)
+        return word, hits
+
+    def view(self, params: Dict[str, List[str]]) -> Dict:
+        word, hits = self._parse_query(params)
+        pagesize = int(params.get('pagesize', ['20'])[0])
+        fromp = int(params.get('fromp', ['1'])[0])
+        start = (fromp - 1) * pagesize
+        returned = pagesize if self.max_pagesize is None else min(pagesize, self.max_pagesize)
+        lines = [self._line(word, i) for i in hits[start:start + returned]]
+        return {'Lines': lines, 'fullsize': len(hits), 'concsize': len(hits)}
+
+    def _view_key(self, params: Dict[str, List[str]]) -> Tuple:
+        """Everything a /view response depends on"""
+        pagesize = int(params.get('pagesize', ['20'])[0])
+        fromp = int(params.get('fromp', ['1'])[0])
+        return self._query_terms(params) + (pagesize, fromp)
+
+    def view_body(self, params: Dict[str, List[str]]) -> bytes:
+        """Encoded /view response, rendered once and then served from memory"""
+        key = self._view_key(params)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                return body
+        body = _encode(self.view(params))
+        with self._lock:
+            if key not in self._bodies and len(body) <= self.body_cache_bytes:
+                self._bodies[key] = body
+                self._body_bytes += len(body)
+                while self._body_bytes > self.body_cache_bytes:
+                    _, dropped = self._bodies.popitem(last=False)
+                    self._body_bytes -= len(dropped)
+        return body
+
+    def prerender(self, words: Iterable[str], pagesize: int = 1000, query: Optional[Callable[[str], str]] = None):
+        """
+        Render every /view page of the words before a measurement
+
+        Args:
+            words: Words the client will ask for
+            pagesize: Page size the client uses
+            query: CQL the client sends for a word (default: the UI simple search of kwic_ske_api)
+        """
+        if query is None:
+            query = lambda w: f'q[word="{w}" | lemma="{w}" | lc="{w.lower()}" | lemma_lc="{w.lower()}"]'
+        for word in words:
+            params = {'q': [query(word)], 'pagesize': [str(pagesize)]}
+            total = len(self._parse_query(params)[1])
+            for fromp in range(1, max(1, -(-total // pagesize)) + 1):
+                self.view_body(dict(params, fromp=[str(fromp)]))
+
+    def wordlist(self, params: Dict[str, List[str]]) -> Dict:
+        pattern = params.get('wlpat', [''])[0]
+        alternatives = pattern[1:-1] if pattern.startswith('(') and pattern.endswith(')') else pattern
+        items = []
+        for alternative in alternatives.split('|'):
+            word = re.sub(r'\\(.)', r'\1', alternative)
+            frq = self.hits_for(word)
+            if frq:
+                items.append({'str': word, 'frq': frq, 'relfreq': round(frq / CORPUS_SIZE * 1e6, 5)})
+        return {'Items': items, 'total': len(items)}
+
+    def freqs(self, params: Dict[str, List[str]]) -> Dict:
+        _, hits = self._parse_query(params)
+        counts: Dict[str, int] = {}
+        for i in hits:
+            genre = GENRES[(i // HITS_PER_DOC) % len(GENRES)]
+            counts[genre] = counts.get(genre, 0) + 1
+        items = [{'Word': [{'n': genre}], 'frq': frq, 'rel': 100.0} for genre, frq in counts.items()]
+        return {'Blocks': [{'Items': items, 'total': len(hits)}]}
+
+    def _should_rate_limit(self) -> bool:
+        with self._lock:
+            self._count += 1
+            limited = ((self.rate_limit_every and self._count % self.rate_limit_every == 0)
+                       or (self.rate_limit_probability and self.rng.random() < self.rate_limit_probability))
+            if limited:
+                self.rate_limited += 1
+            return bool(limited)
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency + (self.rng.random() * self.jitter if self.jitter else 0.0)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive nagu päris API
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+                handler = {'view': server.view_body, 'wordlist': server.wordlist, 'freqs': server.freqs}.get(endpoint)
+                with server._lock:
+                    server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+
+                delay = server._delay()
+                if delay:
+                    time.sleep(delay)
+
+                if handler is None:
+                    self._send(404, {'error': f"Unknown endpoint: {endpoint}"})
+                elif server._should_rate_limit():
+                    headers = {} if server.retry_after is None else {'Retry-After': str(server.retry_after)}
+                    self._send(429, {'error': 'Too Many Requests'}, headers)
+                else:
+                    self._send(200, handler(parse_qs(url.query)))
+
+            def _send(self, status: int, body: Union[Dict, bytes], headers: Optional[Dict[str, str]] = None):
+                data = body if isinstance(body, bytes) else _encode(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'MockSkeServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = MockSkeServer(port=port)
+    print(f"🧪 Mock Sketch Engine at {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#Vektoriseerimise taustade võrdlus: PyTorch (float32) vs ONNX Runtime (float32 ja int8).
+#Mõõdetakse läbilaskevõimet (rida/s) ja recall@150: kui suur osa PyTorchi vektoritega leitud
+#150 parimast lõigust leitakse ka teise taustaga. Päringud on sõnad, nagu process_word_analysis'es.
+#Tulemused: embedding_benchmark.json
+#
+#Käivitamine: python benchmark_embeddings.py  (kontekstifailid kaustas contexts/)
+
+import glob
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from embedding_service import EMBED_MODEL_NAME, get_embed_model, model_id
+from embedding_pipeline import EMBED_BATCH_SIZE
+
+DATA_FOLDER = "contexts"
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+MAX_WORDS = 5
+MAX_LINES = 5000  # ridu sõna kohta
+TOP_K = 150
+
+
+def encode(model: str, texts: List[str]) -> np.ndarray:
+    vectors = get_embed_model(model).encode(texts, batch_size=EMBED_BATCH_SIZE,
+                                            normalize_embeddings=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def top_k(query_vec: np.ndarray, passages: np.ndarray, k: int) -> np.ndarray:
+    scores = passages @ query_vec
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def read_words() -> Dict[str, List[str]]:
+    words = {}
+    for path in sorted(glob.glob(os.path.join(DATA_FOLDER, "*_full_context_only.txt"))):
+        word = os.path.basename(path)[:-len("_full_context_only.txt")]
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        if len(lines) > TOP_K:
+            words[word] = lines[:MAX_LINES]
+        if len(words) == MAX_WORDS:
+            break
+    return words
+
+
+def main():
+    words = read_words()
+    if not words:
+        print(f"⛔ Kaustas {DATA_FOLDER} pole piisavalt suuri kontekstifaile")
+        return
+    total_lines = sum(len(lines) for lines in words.values())
+    print(f"📚 {len(words)} sõna, {total_lines} rida")
+
+    results = {}
+    reference = {}
+    for backend in BACKENDS:
+        model = model_id(EMBED_MODEL_NAME, backend)
+        try:
+            get_embed_model(model)
+        except Exception as e:
+            print(f"⚠️ {backend}: ei saa laadida ({e})")
+            continue
+
+        encode(model, ["passage: soojendus"])  # esimene päring on aeglasem
+        seconds = 0.0
+        recalls = []
+        for word, lines in words.items():
+            started = time.perf_counter()
+            passages = encode(model, [f"passage: {line}" for line in lines])
+            seconds += time.perf_counter() - started
+            ranking = top_k(encode(model, [f"query: {word}"])[0], passages, TOP_K)
+
+            if backend == "torch":
+                reference[word] = set(ranking.tolist())
+            elif word in reference:
+                recalls.append(len(reference[word] & set(ranking.tolist())) / len(reference[word]))
+
+        results[backend] = {
+            'lines_per_sec': round(total_lines / seconds, 1),
+            'seconds': round(seconds, 2),
+            f'recall@{TOP_K}': round(float(np.mean(recalls)), 4) if recalls else None,
+        }
+        print(f"✅ {backend}: {results[backend]['lines_per_sec']} rida/s, "
+              f"recall@{TOP_K} {results[backend][f'recall@{TOP_K}']}")
+
+    if 'torch' in results:
+        for backend, result in results.items():
+            result['speedup'] = round(result['lines_per_sec'] / results['torch']['lines_per_sec'], 2)
+
+    with open("embedding_benchmark.json", "w", encoding="utf-8") as f:
+        json.dump({'model': EMBED_MODEL_NAME, 'words': list(words), 'lines': total_lines,
+                   'results': results}, f, ensure_ascii=False, indent=2)
+    print("📁 embedding_benchmark.json")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#Konteksti kokkupanek tokenieelarve järgi (ühine katse3 promptiskriptidele).
+#Kui kontekstifail ei mahu mudeli eelarvesse, võetakse vektorotsingu järjestuses lõike seni, kuni
+#eelarve täis saab (mitte kindlat arvu 150 lõiku). Valikuline MMR (maximal marginal relevance) eelistab
+#lõike, mis ei ole juba valitutega väga sarnased. Kasutatud tokenite arv kirjutatakse faili context_usage.jsonl.
+#Väga suurte failide korral tehakse enne vektorotsingut leksikaalne eelvalik (lexical_filter.py) ja
+#vektoriseeritakse ainult eelvaliku read, mitte kogu fail. Eelvalik tehakse ainult siis, kui päringus on ridu
+#eristavaid sõnu (p2 tähenduse seletus); ainult märksõnast koosneva päringu (p1) korral kasutatakse kogu faili.
+#Skriptide eelarve on FULL_CONTEXT_MAX_TOKENS, kuid mitte rohkem, kui mudeli kontekstiaknasse mahub
+#(context_budget: kontekstiaken miinus prompt, vastuse jaoks reserveeritud max_tokens ja varu). Sama eelarve
+#on nii täieliku konteksti ja lõiguvaliku lülituspunkt kui ka lõiguvaliku täitmise piir.
+
+import json
+import math
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_pipeline import embed_batches
+from embedding_store import get_store
+from lexical_filter import get_bm25_index, has_lexical_signal, lexical_prefilter
+from retrieval import embed_query, ensure_index_exists, search
+
+SEPARATOR = "\n---\n"
+CONTEXT_USAGE_LOG = "context_usage.jsonl"
+# Kandidaate võetakse eelarve täitmiseks vajalikust hinnangulisest arvust nii palju rohkem
+CANDIDATE_FACTOR = 1.5
+# Kui eelarvest on jäänud vähem, lõpetatakse (ükski rida ei mahu enam)
+MIN_REMAINING_TOKENS = 16
+# Leksikaalse eelvaliku kandidaate on eelarvesse mahtuvast ridade arvust nii mitu korda rohkem (vähemalt LEXICAL_MIN_CANDIDATES)
+LEXICAL_BUDGET_FACTOR = 4
+LEXICAL_MIN_CANDIDATES = 2000
+# Eelvalikut ei tehta, kui kandidaate oleks üle selle osa kõigist ridadest
+LEXICAL_MAX_SHARE = 0.5
+# Varu sõnumite vormingu tokenitele ja tokenite loendaja ebatäpsusele (nt Anthropicu hinnanguline loendus)
+CONTEXT_MARGIN_TOKENS = 2000
+
+
+def context_budget(context_window: int, prompt_tokens: int, max_output_tokens: int,
+                   margin: int = CONTEXT_MARGIN_TOKENS) -> int:
+    """
+    Tokens left for the context in one request
+
+    Args:
+        context_window: Context window of the model (input and output together)
+        prompt_tokens: Tokens of the prompt sent with the context
+        max_output_tokens: max_tokens reserved for the reply
+        margin: Safety margin
+
+    Returns:
+        Packing budget for the context (never negative)
+    """
+    return max(0, context_window - prompt_tokens - max_output_tokens - margin)
+
+
+def mmr_order(query_vec: np.ndarray, vectors: np.ndarray, mmr_lambda: float) -> Iterator[int]:
+    """
+    Yield candidate indices in maximal marginal relevance order
+
+    score = lambda * sim(query, d) - (1 - lambda) * max sim(d, already selected)
+
+    Args:
+        query_vec: Normalised query vector
+        vectors: Normalised candidate vectors (one row per candidate)
+        mmr_lambda: 1.0 = relevance only, smaller values favour diversity
+    """
+    relevance = vectors @ query_vec
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    for _ in range(len(vectors)):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        available[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        yield best
+
+
+def lines_in_budget(lines: List[str], budget: int, count_tokens: Callable[[str], int]) -> float:
+    """Estimate how many lines fit into the budget from the average line length (sample of up to 200 lines)"""
+    step = max(1, len(lines) // 200)
+    sample = lines[::step][:200]
+    avg_tokens = max(1.0, sum(count_tokens(line) for line in sample) / max(1, len(sample)))
+    return budget / avg_tokens
+
+
+def pack_lines(lines: List[str], budget: int, count_tokens: Callable[[str], int],
+               order: Optional[Iterator[int]] = None, separator: str = SEPARATOR) -> Tuple[List[str], int]:
+    """
+    Greedily take lines (in the given order) while they fit into the token budget
+
+    A line that does not fit is skipped and shorter lines after it may still
+    be taken.
+
+    Args:
+        lines: Candidate lines, best first
+        budget: Token budget for the joined context
+        count_tokens: Token counter of the target model
+        order: Optional order of line indices (e.g. from mmr_order)
+        separator: String between lines
+
+    Returns:
+        (selected lines, tokens used)
+    """
+    separator_tokens = count_tokens(separator)
+    selected: List[str] = []
+    used = 0
+    for i in (order if order is not None else range(len(lines))):
+        cost = count_tokens(lines[i]) + (separator_tokens if selected else 0)
+        if used + cost > budget:
+            if budget - used < MIN_REMAINING_TOKENS:
+                break
+            continue
+        selected.append(lines[i])
+        used += cost
+    return selected, used
+
+
+def pack_relevant_chunks(query: str, chunks: List[str], index, budget: int,
+                         count_tokens: Callable[[str], int],
+                         mmr_lambda: Optional[float] = None,
+                         separator: str = SEPARATOR) -> Tuple[List[str], int]:
+    """
+    Fill the token budget with the chunks most relevant to the query
+
+    Args:
+        query: Search query (word, or word and definition)
+        chunks: All lines of the context file
+        index: Their faiss index (retrieval.ensure_index_exists)
+        budget: Token budget of the target model
+        count_tokens: Token counter of the target model
+        mmr_lambda: If set, order candidates by MMR with this lambda (e.g. 0.7)
+        separator: String between chunks
+
+    Returns:
+        (selected chunks, tokens used)
+    """
+    k = min(len(chunks), int(math.ceil(CANDIDATE_FACTOR * lines_in_budget(chunks, budget, count_tokens))) + 50)
+
+    _, ids = search(query, index, k)
+    candidates = [chunks[i] for i in ids]
+    order = None
+    if mmr_lambda is not None and candidates:
+        vectors = get_store().get_or_embed(candidates, embed_batches)
+        order = mmr_order(embed_query(query)[0], vectors, mmr_lambda)
+    return pack_lines(candidates, budget, count_tokens, order=order, separator=separator)
+
+
+def pack_candidates(query: str, candidates: List[str], budget: int,
+                    count_tokens: Callable[[str], int],
+                    mmr_lambda: Optional[float] = None,
+                    separator: str = SEPARATOR) -> Tuple[List[str], int]:
+    """
+    Rank a few thousand candidate lines by similarity to the query and fill the budget
+
+    Only the candidates are embedded (through the embedding store), no
+    faiss index is built.
+    """
+    if not candidates:
+        return [], 0
+    vectors = get_store().get_or_embed(candidates, embed_batches)
+    query_vec = embed_query(query)[0]
+    ranking = np.argsort(-(vectors @ query_vec), kind='stable')
+    ranked = [candidates[i] for i in ranking]
+    order = mmr_order(query_vec, vectors[ranking], mmr_lambda) if mmr_lambda is not None else None
+    return pack_lines(ranked, budget, count_tokens, order=order, separator=separator)
+
+
+def lexical_candidate_count(lines: List[str], budget: int, count_tokens: Callable[[str], int]) -> Optional[int]:
+    """Number of lexical candidates to keep, or None if the file is too small for a prefilter to pay off"""
+    k = max(LEXICAL_MIN_CANDIDATES, int(math.ceil(LEXICAL_BUDGET_FACTOR * lines_in_budget(lines, budget, count_tokens))))
+    return k if k <= LEXICAL_MAX_SHARE * len(lines) else None
+
+
+def lexical_query_count(query: str, lines: List[str], budget: int,
+                        count_tokens: Callable[[str], int]) -> Optional[int]:
+    """
+    Number of lexical candidates for the query, or None to use the faiss index of the whole file
+
+    A query without discriminating terms (the headword alone, which is in
+    nearly every line) gives the prefilter nothing to rank, so it is skipped.
+    """
+    k = lexical_candidate_count(lines, budget, count_tokens)
+    if k is None or not has_lexical_signal(query, lines):
+        return None
+    return k
+
+
+def select_relevant_chunks(word: str, lines: List[str], budget: int,
+                           count_tokens: Callable[[str], int],
+                           query: Optional[str] = None,
+                           mmr_lambda: Optional[float] = None,
+                           separator: str = SEPARATOR) -> Tuple[List[str], int]:
+    """
+    Fill the token budget with the lines of a context file most relevant to the query
+
+    Very large files go through the lexical prefilter and only its
+    candidates are embedded, if the query has terms that discriminate
+    between lines; other files and queries use the cached faiss index of
+    the whole file.
+
+    Args:
+        word: The word (names the index cache)
+        lines: All lines of the context file
+        budget: Token budget of the target model
+        count_tokens: Token counter of the target model
+        query: Search query (default: the word)
+        mmr_lambda: If set, order candidates by MMR with this lambda (e.g. 0.7)
+        separator: String between chunks
+
+    Returns:
+        (selected chunks, tokens used)
+    """
+    query = query or word
+    k = lexical_query_count(query, lines, budget, count_tokens)
+    if k is None:
+        index, chunks = ensure_index_exists(word, lines)
+        return pack_relevant_chunks(query, chunks, index, budget, count_tokens,
+                                    mmr_lambda=mmr_lambda, separator=separator)
+    ids = lexical_prefilter(query, lines, k, headword=word)
+    print(f"🔎 Leksikaalne eelvalik: {len(ids)}/{len(lines)} rida")
+    return pack_candidates(query, [lines[i] for i in ids], budget, count_tokens,
+                           mmr_lambda=mmr_lambda, separator=separator)
+
+
+def prepare_relevant_chunks(word: str, lines: List[str], budget: int,
+                            count_tokens: Callable[[str], int],
+                            query: Optional[str] = None, query_per_item: bool = False) -> bool:
+    """
+    Do the expensive part of select_relevant_chunks ahead of time (for retrieval.prefetch_index)
+
+    Builds the faiss index, or embeds the lexical candidates of the query.
+
+    Args:
+        word: The word
+        lines: All lines of the context file
+        budget: Token budget of the target model
+        count_tokens: Token counter of the target model
+        query: Search query (default: the word)
+        query_per_item: True if the query is not known yet (it depends on the definition);
+                        then only the BM25 index is built for files that go through the prefilter
+    """
+    if query_per_item:
+        if lexical_candidate_count(lines, budget, count_tokens) is None:
+            ensure_index_exists(word, lines)
+        else:
+            get_bm25_index(lines)
+        return True
+    query = query or word
+    k = lexical_query_count(query, lines, budget, count_tokens)
+    if k is None:
+        ensure_index_exists(word, lines)
+    else:
+        get_store().get_or_embed([lines[i] for i in lexical_prefilter(query, lines, k, headword=word)],
+                                 embed_batches)
+    return True
+
+
+def record_usage(word: str, model: str, mode: str, lines: int, tokens: int, budget: int,
+                 path: str = CONTEXT_USAGE_LOG, **extra):
+    """Append one line about the context sent for a word to the usage log"""
+    entry = {
+        'word': word,
+        'model': model,
+        'mode': mode,
+        'lines': lines,
+        'tokens': tokens,
+        'budget': budget,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    entry.update(extra)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
@@ -0,0 +1,178 @@
+#Suurte kontekstifailide vektoriseerimine mitmes protsessis.
+#Read jagatakse partiideks, partiid kodeeritakse töötajaprotsesside kogumis (igaühel oma mudel ja
+#osa protsessorituumadest) ja iga valmis partii salvestatakse kohe hoidlasse; läbilaskevõime (rida/s)
+#trükitakse jooksvalt. Väikesed failid kodeeritakse samas protsessis.
+#Read loetakse partiide kaupa (embed_file loeb kontekstifaili otse kettalt), korraga on töös kuni
+#MAX_PENDING_PER_WORKER ülesannet töötaja kohta, nii et mällu ei kogune kogu fail.
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import get_context
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_service import EMBED_MODEL_ID, get_embed_model
+from embedding_store import get_store
+
+EMBED_BATCH_SIZE = 64
+# Ühe töötaja ülesanne (mitu EMBED_BATCH_SIZE partiid korraga, et protsessidevaheline suhtlus ei domineeriks)
+WORKER_CHUNK_LINES = 1024
+# Alates sellest ridade arvust kasutatakse töötajaprotsesse
+PARALLEL_MIN_LINES = 5000
+# Mitu ülesannet töötaja kohta on korraga järjekorras
+MAX_PENDING_PER_WORKER = 2
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", max(1, min(4, (os.cpu_count() or 2) // 2))))
+REPORT_EVERY_SECONDS = 10
+
+_pools: Dict[int, object] = {}
+_pools_lock = threading.Lock()
+
+
+def embed_passages(chunks: List[str], model_name: str = EMBED_MODEL_ID) -> np.ndarray:
+    passages = [f"passage: {chunk}" for chunk in chunks]
+    embeddings = get_embed_model(model_name).encode(passages, batch_size=EMBED_BATCH_SIZE,
+                                                    normalize_embeddings=True, show_progress_bar=False)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def _init_worker(model_name: str, threads: int):
+    import torch
+    torch.set_num_threads(threads)
+    get_embed_model(model_name)
+
+
+def _encode_chunk(args: Tuple[List[str], str]) -> np.ndarray:
+    chunks, model_name = args
+    # float16 poolitab protsesside vahel liigutatava andmemahu; hoidlas on vektorid niikuinii float16
+    return embed_passages(chunks, model_name).astype(np.float16)
+
+
+def _get_pool(model_name: str, workers: int):
+    """Process pool with the given number of workers (created once per size, thread-safe)"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            started = time.perf_counter()
+            pool = get_context('spawn').Pool(workers, initializer=_init_worker,
+                                             initargs=(model_name, threads))
+            if not _pools:
+                atexit.register(shutdown_pool)
+            _pools[workers] = pool
+            print(f"⚙️ Vektoriseerimise töötajad: {workers} × {threads} lõime "
+                  f"(käivitus {time.perf_counter() - started:.1f} s)")
+        return pool
+
+
+def shutdown_pool():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+
+def _line_batches(chunks: Iterable[str]) -> Iterator[List[str]]:
+    lines = iter(chunks)
+    while True:
+        batch = list(islice(lines, WORKER_CHUNK_LINES))
+        if not batch:
+            return
+        yield batch
+
+
+def embed_batches(chunks: Iterable[str], model_name: str = EMBED_MODEL_ID,
+                  workers: Optional[int] = None) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """
+    Embed passages in batches, in order, reporting throughput
+
+    The lines are consumed lazily, so a generator (e.g. iter_context_lines)
+    is never read into memory as a whole.
+
+    Args:
+        chunks: Lines to embed (a list or any iterable)
+        model_name: Embedding model
+        workers: Size of the process pool; 1 encodes in this process (default:
+                 EMBED_WORKERS, or 1 for lists shorter than PARALLEL_MIN_LINES)
+
+    Yields:
+        (batch of lines, their normalised vectors)
+    """
+    total = len(chunks) if hasattr(chunks, '__len__') else None
+    if workers is None:
+        workers = 1 if total is not None and total < PARALLEL_MIN_LINES else EMBED_WORKERS
+    workers = max(1, workers)
+
+    started = last_report = time.perf_counter()
+    done = 0
+    for batch, vectors in _encode_in_order(_line_batches(chunks), model_name, workers):
+        done += len(batch)
+        now = time.perf_counter()
+        if now - last_report >= REPORT_EVERY_SECONDS:
+            progress = f"{done}/{total}" if total is not None else f"{done}"
+            print(f"   🧮 {progress} rida, {done / (now - started):.0f} rida/s")
+            last_report = now
+        yield batch, vectors
+
+    elapsed = time.perf_counter() - started
+    if done and elapsed > 0:
+        print(f"🧮 Vektoriseeritud {done} rida {elapsed:.1f} s-ga "
+              f"({done / elapsed:.0f} rida/s, {workers} protsess{'i' if workers > 1 else ''})")
+
+
+def _encode_in_order(batches: Iterator[List[str]], model_name: str,
+                     workers: int) -> Iterator[Tuple[List[str], np.ndarray]]:
+    if workers == 1:
+        for batch in batches:
+            yield batch, embed_passages(batch, model_name)
+        return
+
+    pool = _get_pool(model_name, workers)
+    pending = deque()
+    for batch in batches:
+        pending.append((batch, pool.apply_async(_encode_chunk, ((batch, model_name),))))
+        # Hoia järjekorras kuni MAX_PENDING_PER_WORKER ülesannet töötaja kohta
+        if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+            batch, result = pending.popleft()
+            yield batch, result.get()
+    while pending:
+        batch, result = pending.popleft()
+        yield batch, result.get()
+
+
+def iter_context_lines(path: str) -> Iterator[str]:
+    """Non-empty lines of a context file, read from disk one at a time"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def embed_file(path: str, model_name: str = EMBED_MODEL_ID, workers: Optional[int] = None) -> int:
+    """
+    Stream a context file into the embedding store
+
+    Lines already in the store are skipped; the rest are embedded batch by
+    batch and appended as soon as each batch is ready.
+
+    Returns:
+        Number of lines embedded
+    """
+    store = get_store(model_name)
+    if workers is None:
+        # Ridade loendamine on vektoriseerimisega võrreldes odav ja ei vaja mälu
+        lines = sum(1 for _ in iter_context_lines(path))
+        workers = 1 if lines < PARALLEL_MIN_LINES else EMBED_WORKERS
+    missing = (line for line in iter_context_lines(path) if store.get([line])[0] is None)
+    embedded = 0
+    for batch, vectors in embed_batches(missing, model_name, workers):
+        store.append(batch, vectors)
+        embedded += len(batch)
+    return embedded
@@ -0,0 +1,95 @@
+#Ühine vektoriseerimismudel katse3 promptiskriptidele.
+#Mudel laaditakse alles esimesel kasutamisel (kui mõni kontekstifail on liiga suur ja on vaja
+#lõikuvalikut), mitte skripti importimisel. Sama protsessi kõik skriptid (p1 ja p2) kasutavad sama eksemplari.
+#Keskkonnamuutuja EMBED_BACKEND valib arvutuse: "torch" (vaikimisi), "onnx" või "onnx-int8"
+#(ONNX Runtime, dünaamiliselt int8-ks kvantiseeritud; vajab sentence-transformers[onnx]).
+
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+EMBED_MODEL_NAME = "intfloat/multilingual-e5-base"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+ONNX_CACHE = "onnx_models"
+# Kvantiseerimise profiil protsessori järgi: "avx2", "avx512" või "avx512_vnni"
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+
+_models: Dict[str, object] = {}
+_load_seconds: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def model_id(name: str = EMBED_MODEL_NAME, backend: str = EMBED_BACKEND) -> str:
+    """
+    Identifier of a model and backend, e.g. 'intfloat/multilingual-e5-base@onnx-int8'
+
+    Vectors of different backends are kept apart in the embedding store.
+    The default torch backend keeps the bare model name.
+    """
+    return name if backend == "torch" else f"{name}@{backend}"
+
+
+def parse_model_id(model: str) -> Tuple[str, str]:
+    name, _, backend = model.partition("@")
+    backend = backend or "torch"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+    return name, backend
+
+
+EMBED_MODEL_ID = model_id()
+
+
+def _load_onnx_int8(name: str):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    local_dir = os.path.join(ONNX_CACHE, name.replace("/", "__"))
+    file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+    if not os.path.exists(os.path.join(local_dir, file_name)):
+        # Üks kord: eksport ONNX-i ja kvantiseerimine, tulemus jääb kausta ONNX_CACHE
+        print(f"⚙️ Ekspordin {name} ONNX-i ja kvantiseerin int8-ks ({ONNX_QUANTIZATION})")
+        model = SentenceTransformer(name, backend="onnx")
+        model.save(local_dir)
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, local_dir)
+    return SentenceTransformer(local_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def get_embed_model(model: str = EMBED_MODEL_ID):
+    """
+    Return the SentenceTransformer model, loading it on first use
+
+    Args:
+        model: Model id (Hugging Face name, optionally with '@backend')
+
+    Returns:
+        The shared SentenceTransformer instance
+    """
+    loaded = _models.get(model)
+    if loaded is not None:
+        return loaded
+    with _lock:
+        if model not in _models:
+            name, backend = parse_model_id(model)
+            # sentence_transformers (ja torch) imporditakse samuti alles siin
+            from sentence_transformers import SentenceTransformer
+            started = time.perf_counter()
+            if backend == "onnx-int8":
+                _models[model] = _load_onnx_int8(name)
+            elif backend == "onnx":
+                _models[model] = SentenceTransformer(name, backend="onnx")
+            else:
+                _models[model] = SentenceTransformer(name)
+            _load_seconds[model] = time.perf_counter() - started
+            print(f"🧠 Vektoriseerimismudel {model} laaditud {_load_seconds[model]:.1f} s-ga")
+        return _models[model]
+
+
+def is_loaded(model: str = EMBED_MODEL_ID) -> bool:
+    return model in _models
+
+
+def load_seconds(model: str = EMBED_MODEL_ID) -> float:
+    """Seconds spent loading the model (0.0 if it was never needed)"""
+    return _load_seconds.get(model, 0.0)
@@ -0,0 +1,210 @@
+#Kõigi katse3 skriptide ühine vektorite hoidla: iga konkordantsirea vektor arvutatakse ainult üks kord.
+#Võti on rea teksti räsi (mitte sõna), nii et sama rida eri sõnade, skriptide (p1/p2) ja mudelite
+#(Claude/GPT/Gemini) vahel ei vaja uut arvutust. Vektorid on ühes float16 maatriksis, mida loetakse
+#mälukaardistatult; uued read lisatakse faili lõppu. Iga vektoriseerimismudeli jaoks on eraldi kaust.
+#Mitu samaaegset skripti võivad kasutada sama hoidlat: lisamine toimub faililuku (store.lock) all ja enne
+#lisamist loetakse teiste protsesside lisatud võtmed, nii et reanumbrid vastavad alati failis olevatele
+#vektoritele. Windowsis fcntl puudub ja hoidlat ei tohi korraga mitmest protsessist täiendada.
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: protsesside vaheline lukk puudub
+    fcntl = None
+
+from embedding_service import EMBED_MODEL_ID
+
+STORE_VERSION = 1
+DEFAULT_STORE_ROOT = os.path.join("vector_cache", "embeddings")
+KEY_BYTES = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+
+def model_tag(model_name: str) -> str:
+    return f"{re.sub(r'[^A-Za-z0-9._-]', '_', model_name)}-v{STORE_VERSION}"
+
+
+class EmbeddingStore:
+    def __init__(self, root: str = DEFAULT_STORE_ROOT, model_name: str = EMBED_MODEL_ID):
+        """
+        Open (or create) the embedding store of one embedding model
+
+        Files in root/<model tag>/:
+            vectors.f16  rows x dim float16 matrix, appended to
+            keys.bin     16-byte text hashes, one per row in the same order
+            meta.json    model name, store version and dimension
+            store.lock   lock file for appends from several processes
+
+        Args:
+            root: Root directory shared by all scripts
+            model_name: Embedding model; vectors of different models never mix
+        """
+        self.model_name = model_name
+        self.path = os.path.join(root, model_tag(model_name))
+        self.vectors_path = os.path.join(self.path, "vectors.f16")
+        self.keys_path = os.path.join(self.path, "keys.bin")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.lock_path = os.path.join(self.path, "store.lock")
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.rows: Dict[bytes, int] = {}
+        self._matrix = None
+        os.makedirs(self.path, exist_ok=True)
+
+        with self._file_lock():
+            self._load_meta()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """Lock the store files against other processes (no-op without fcntl)"""
+        with open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_meta(self):
+        """Read meta.json and all keys, if the store has been created (under the exclusive file lock)"""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('model') != self.model_name or meta.get('version') != STORE_VERSION:
+            raise ValueError(f"{self.path} belongs to {meta.get('model')} (v{meta.get('version')})")
+        self.dim = meta['dim']
+        self._load_keys()
+
+    def _refresh(self):
+        """Pick up rows appended by other processes since the keys were read (under the file lock)"""
+        if self.dim is None:
+            self._load_meta()
+            return
+        known = len(self.rows)
+        with open(self.keys_path, 'rb') as f:
+            f.seek(known * KEY_BYTES)
+            tail = f.read()
+        # Võtmed kirjutatakse pärast vektoreid, seega igal täielikul võtmel on vektor olemas
+        for i in range(len(tail) // KEY_BYTES):
+            self.rows.setdefault(tail[i * KEY_BYTES:(i + 1) * KEY_BYTES], known + i)
+
+    def _load_keys(self):
+        with open(self.keys_path, 'rb') as f:
+            keys = f.read()
+        row_bytes = self.dim * 2
+        # Katkestatud lisamise korral loetakse ainult read, millel on nii võti kui vektor
+        count = min(len(keys) // KEY_BYTES, os.path.getsize(self.vectors_path) // row_bytes)
+        for path, size in ((self.keys_path, count * KEY_BYTES), (self.vectors_path, count * row_bytes)):
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+        self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(count)}
+        self._matrix = None
+
+    def _vectors(self):
+        if self._matrix is None or self._matrix.shape[0] < len(self.rows):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float16, mode='r',
+                                     shape=(len(self.rows), self.dim)) if self.rows else None
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, texts: List[str]) -> List[Optional[int]]:
+        """Row numbers of the texts in the store (None for missing texts)"""
+        return [self.rows.get(text_key(t)) for t in texts]
+
+    def append(self, texts: List[str], embeddings: np.ndarray):
+        """Append vectors of new texts (texts already in the store are skipped)"""
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(embeddings.shape[1])
+                with open(self.meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'model': self.model_name, 'version': STORE_VERSION, 'dim': self.dim}, f)
+                open(self.keys_path, 'ab').close()
+                open(self.vectors_path, 'ab').close()
+
+            # Teise protsessi katkestatud lisamisest jäänud võtmeta vektorid eemaldatakse, et uued read
+            # algaksid failis täpselt reanumbrilt len(self.rows)
+            row_bytes = self.dim * 2
+            if os.path.getsize(self.vectors_path) > len(self.rows) * row_bytes:
+                os.truncate(self.vectors_path, len(self.rows) * row_bytes)
+
+            new_keys, new_rows = [], []
+            for text, vector in zip(texts, embeddings):
+                key = text_key(text)
+                if key in self.rows:
+                    continue
+                self.rows[key] = len(self.rows)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+            # Kõigepealt vektorid, siis võtmed: pooleli jäänud lisamine ei anna valet vektorit
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.stack(new_rows).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, 'ab') as f:
+                f.write(b''.join(new_keys))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get_or_embed(self, texts: List[str],
+                     embed_batches: Callable[[List[str]], Iterable[Tuple[List[str], np.ndarray]]]) -> np.ndarray:
+        """
+        Return float32 vectors for all texts, embedding only those not yet stored
+
+        Every embedded batch is appended right away, so an interrupted run
+        keeps the vectors computed so far.
+
+        Args:
+            texts: Passages (without the 'passage: ' prefix)
+            embed_batches: Function that yields (texts, vectors) batches for a list of texts
+
+        Returns:
+            len(texts) x dim float32 matrix in the order of texts
+        """
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+        rows = self.get(texts)
+        missing = list(dict.fromkeys(t for t, row in zip(texts, rows) if row is None))
+        if missing:
+            stored = sum(1 for row in rows if row is not None)
+            print(f"🧮 Vektoriseerin {len(missing)} uut rida ({stored} on hoidlas olemas)")
+            for batch, vectors in embed_batches(missing):
+                self.append(batch, vectors)
+            rows = self.get(texts)
+        else:
+            print(f"🧮 Kõik {len(texts)} rea vektorid on hoidlas olemas")
+        with self._lock:
+            matrix = self._vectors()
+        return np.asarray(matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model_name: str = EMBED_MODEL_ID, root: str = DEFAULT_STORE_ROOT) -> EmbeddingStore:
+    """Process-wide store per model"""
+    key = os.path.join(root, model_name)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = EmbeddingStore(root, model_name)
+        return _stores[key]
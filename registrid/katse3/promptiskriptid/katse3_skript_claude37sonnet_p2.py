@@ -5,20 +5,34 @@
 import os
 import csv
 import anthropic
-import pickle
-import faiss
-import tiktoken
 import pandas as pd
 import re
 import time
+from functools import lru_cache
 from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
+from embedding_service import is_loaded, load_seconds
+from context_packer import context_budget, prepare_relevant_chunks, record_usage, select_relevant_chunks
+from token_counter import TokenCounter
+from retrieval import prefetch_index
+from prompt_cache import CONTEXT_HEADER, CacheStats, cached_block, word_groups
+from structured_output import (anthropic_tool, definition_row, definition_schema,
+                               load_structured, message_text, structured_prompt)
+from response_cache import ResponseCache, SummaryCsv
 
 # --- Konfiguratsioon ---
 client = anthropic.Anthropic()
 MODEL = "claude-3-7-sonnet-20250219"
-EMBED_MODEL = SentenceTransformer("intfloat/multilingual-e5-base")
+TEMPERATURE = 0.1
+STRUCTURED_OUTPUT = False  # True: vastus JSON-skeemi järgi, skeemile mittevastava vastuse korral küsitakse parandust
 DATA_FOLDER = "contexts"
+CONTEXT_WINDOW = 200000  # mudeli kontekstiaken (sisend ja vastus kokku)
+MAX_OUTPUT_TOKENS = 16000
+FULL_CONTEXT_MAX_TOKENS = 120000  # suuremate kontekstide korral valitakse lõigud vektorotsinguga
+MMR_LAMBDA = None  # nt 0.7, et lõikude valikul eelistada mitmekesisemaid lõike
+# Vaikimisi valitakse suure faili lõigud iga tähenduse jaoks eraldi (päring: sõna ja tähendus).
+# True: sõna kõik tähendused saavad sama, ainult sõna järgi valitud konteksti, mida teenusepakkuja loeb
+# vahemälust (odavam, kuid muudab katset: lõikude valik ei sõltu enam tähendusest)
+SHARED_WORD_CONTEXT = False
 OUTPUT_FOLDER = "vastusede"
 FINAL_CSV = "vastused_koond.csv"
 
@@ -26,57 +40,58 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs("vector_cache", exist_ok=True)
 
 # --- Abi funktsioonid ---
-def tokenize_length(text: str):
-    enc = tiktoken.get_encoding("cl100k_base")
-    return len(enc.encode(text))
-
-
-def build_faiss_index(chunks: List[str]):
-    passages = [f"passage: {chunk}" for chunk in chunks]
-    embeddings = EMBED_MODEL.encode(passages, show_progress_bar=False)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-    return index, embeddings
-
-def save_index(index, chunks, path):
-    faiss.write_index(index, f"{path}.faiss")
-    with open(f"{path}_chunks.pkl", "wb") as f:
-        pickle.dump(chunks, f)
-
-def load_index(path):
-    index = faiss.read_index(f"{path}.faiss")
-    with open(f"{path}_chunks.pkl", "rb") as f:
-        chunks = pickle.load(f)
-    return index, chunks
-
-def ensure_index_exists(word: str, full_lines: List[str]):
-    index_path = os.path.join("vector_cache", word)
-    if os.path.exists(index_path + ".faiss") and os.path.exists(index_path + "_chunks.pkl"):
-        return load_index(index_path)
-    
-    index, _ = build_faiss_index(full_lines)
-    save_index(index, full_lines, index_path)
-    return index, full_lines
-
-def get_relevant_chunks_max(query: str, chunks: List[str], index, max_k=None):
-    query_vec = EMBED_MODEL.encode([f"query: {query}"], show_progress_bar=False)
-    D, I = index.search(query_vec, len(chunks))
-    sorted_chunks = [chunks[i] for i in I[0]]
-    if max_k:
-        return sorted_chunks[:max_k]
-    return sorted_chunks
+TOKEN_COUNTER = TokenCounter("anthropic", MODEL)
+CACHE_STATS = CacheStats()
 
-def get_completion(prompt: str, context: str) -> str:
-    response = client.messages.create(
+def tokenize_length(text: str) -> int:
+    return TOKEN_COUNTER.count(text)
+
+def context_budget_for(prompt: str) -> int:
+    """Konteksti eelarve: FULL_CONTEXT_MAX_TOKENS, kuid mitte rohkem, kui prompti ja vastuse kõrval aknasse mahub"""
+    return min(FULL_CONTEXT_MAX_TOKENS, context_budget(CONTEXT_WINDOW, tokenize_length(prompt), MAX_OUTPUT_TOKENS))
+
+def needs_retrieval(lines: List[str], context_path: str = None) -> bool:
+    return TOKEN_COUNTER.exceeds(lines, context_budget_for(analysis_prompt("", "")), context_path)
+
+def prepare_retrieval(word: str, lines: List[str]) -> bool:
+    # Tähendusepõhise päringu korral sõltub eelvalik tähendusest: ette tehakse ainult see, mis sellest ei sõltu
+    return prepare_relevant_chunks(word, lines, context_budget_for(analysis_prompt(word, "")), tokenize_length,
+                                   query_per_item=not SHARED_WORD_CONTEXT)
+
+def completion_request(prompt: str, context: str) -> Dict[str, Any]:
+    """
+    Päringu parameetrid (samad sünkroonsel päringul ja partiitöös)
+
+    SHARED_WORD_CONTEXT korral on sõna kontekst vahemällu salvestatav süsteemiplokk ja prompt kasutaja sõnum,
+    muidu on prompt süsteemiprompt ja kontekst kasutaja sõnum nagu varem.
+    """
+    if SHARED_WORD_CONTEXT:
+        system, user = [cached_block(CONTEXT_HEADER + context)], prompt
+    else:
+        system, user = prompt, context
+    request = dict(
         model=MODEL,
-        system=prompt,
+        system=system,
         messages=[
-            {"role": "user", "content": context}
+            {"role": "user", "content": user}
         ],
-        max_tokens=16000,
-        temperature=0.1
+        max_tokens=MAX_OUTPUT_TOKENS,
+        temperature=TEMPERATURE
     )
-    return response.content[0].text
+    if STRUCTURED_OUTPUT:
+        request.update(anthropic_tool(RESPONSE_SCHEMA))
+    return request
+
+def get_completion(prompt: str, context: str) -> str:
+    response = client.messages.create(**completion_request(prompt, context))
+    print(CACHE_STATS.add(response.usage))
+    return message_text(response.content)
+
+RESPONSE_CACHE = ResponseCache(MODEL, TEMPERATURE)
+
+def get_cached_completion(prompt: str, context: str) -> str:
+    """Vastus vastuste vahemälust või mudelilt (uus vastus salvestatakse vahemällu)"""
+    return RESPONSE_CACHE.complete(get_completion, prompt, context)
 
 def sanitize_filename(text):
     return re.sub(r'[<>:"/\\|?*]', '_', text)[:100]
@@ -213,8 +228,15 @@ def parse_definition_analysis_response(txt: str, word: str, definition: str) ->
     
     return result
 
+def analysis_prompt(word: str, definition: str) -> str:
+    prompt = create_definition_analysis_prompt(word, definition)
+    if STRUCTURED_OUTPUT:
+        prompt = structured_prompt(prompt)
+    return prompt
+
 # --- Sõna ja tähenduse töötlemise funktsioon ---
-def process_definition_analysis(word: str, definition: str):
+def load_context(word: str, query: str, budget: int):
+    """Sõna kontekst päringu järgi (None, kui kontekstifail puudub)"""
     context_path = os.path.join(DATA_FOLDER, f"{word}_full_context_only.txt")
     if not os.path.exists(context_path):
         print(f"⛔ Puudub kontekstifail: {context_path}")
@@ -224,52 +246,92 @@ def process_definition_analysis(word: str, definition: str):
         lines = [line.strip() for line in f if line.strip()]
 
     full_text = "\n".join(lines)
-    if tokenize_length(full_text) < 120000:
+    full_tokens = TOKEN_COUNTER.count_lines(lines, context_path, budget=budget)
+    if full_tokens < budget:
         context = full_text
         print(f"📄 Kasutan täielikku konteksti ({len(lines)} rida)")
+        record_usage(word, MODEL, "full", len(lines), full_tokens, budget)
     else:
         print(f"ℹ️ Fail on suur – kasutatakse embedding-põhist lõiguvalikut ({word})")
-        index, chunks = ensure_index_exists(word, lines)
-        # Otsime relevantset sisu nii sõna kui tähenduse põhjal
-        query = f"{word} {definition}"
-        relevant_chunks = get_relevant_chunks_max(query, chunks, index, max_k=150)
+        # Otsime relevantset sisu päringu (sõna või sõna ja tähenduse) põhjal
+        relevant_chunks, used_tokens = select_relevant_chunks(word, lines, budget, tokenize_length,
+                                                              query=query, mmr_lambda=MMR_LAMBDA)
         context = "\n---\n".join(relevant_chunks)
-        print(f"📄 Kasutan {len(relevant_chunks)} kõige relevantsemast lõiku")
+        print(f"📄 Kasutan {len(relevant_chunks)} kõige relevantsemast lõiku ({used_tokens}/{budget} tokenit)")
+        record_usage(word, MODEL, "retrieval", len(relevant_chunks), used_tokens, budget)
+    return context
+
+@lru_cache(maxsize=4)
+def load_shared_context(word: str, budget: int):
+    """Sõna ühine kontekst (SHARED_WORD_CONTEXT); sama sõna järjestikused tähendused kasutavad seda uuesti"""
+    return load_context(word, word, budget)
+
+def prepare_definition_analysis(word: str, definition: str):
+    """Päringu prompt ja sõna kontekst (None, kui pole midagi saata)"""
+    prompt = analysis_prompt(word, definition)
+    if SHARED_WORD_CONTEXT:
+        # Ühine kontekst peab sobima iga tähenduse kõrvale; tähenduse tokenid mahuvad varu sisse
+        context = load_shared_context(word, context_budget_for(analysis_prompt(word, "")))
+    else:
+        context = load_context(word, f"{word} {definition}", context_budget_for(prompt))
+    if context is None:
+        return None
+    return prompt, context
+
+def handle_definition_analysis(word: str, definition: str, reply: str):
+    """Salvestab mudeli vastuse faili ja parsib selle"""
+    data = None
+    if STRUCTURED_OUTPUT:
+        data, reply = load_structured(reply, RESPONSE_SCHEMA, get_cached_completion)
+
+    # Prindime mudeli toorvastuse
+    print("\n" + "="*80)
+    print(f"🤖 MUDELI VASTUS sõnale '{word}' tähenduses '{definition[:50]}{'...' if len(definition) > 50 else ''}':")
+    print("="*80)
+    print(reply)
+    print("="*80)
+    
+    # Salvesta toorvastus faili
+    safe_word = sanitize_filename(word)
+    safe_definition = sanitize_filename(definition)
+    out_path = os.path.join(OUTPUT_FOLDER, f"{safe_word}_{safe_definition}_analysis.txt")
+    with open(out_path, "w", encoding="utf-8") as out_f:
+        out_f.write(reply)
+    
+    # Parsime vastuse
+    parsed_result = definition_row(word, definition, data) if data else parse_definition_analysis_response(reply, word, definition)
+    
+    print(f"✅ {word} (tähendus: {definition[:30]}{'...' if len(definition) > 30 else ''}) — Analüüs lõpetatud\n")
+    
+    return parsed_result
 
-    prompt = create_definition_analysis_prompt(word, definition)
+def process_definition_analysis(word: str, definition: str):
+    request = prepare_definition_analysis(word, definition)
+    if request is None:
+        return None
 
     try:
-        reply = get_completion(prompt, context)
-        
-        # Prindime mudeli toorvastuse
-        print("\n" + "="*80)
-        print(f"🤖 MUDELI VASTUS sõnale '{word}' tähenduses '{definition[:50]}{'...' if len(definition) > 50 else ''}':")
-        print("="*80)
-        print(reply)
-        print("="*80)
-        
-        # Salvesta toorvastus faili
-        safe_word = sanitize_filename(word)
-        safe_definition = sanitize_filename(definition)
-        out_path = os.path.join(OUTPUT_FOLDER, f"{safe_word}_{safe_definition}_analysis.txt")
-        with open(out_path, "w", encoding="utf-8") as out_f:
-            out_f.write(reply)
-        
-        # Parsime vastuse
-        parsed_result = parse_definition_analysis_response(reply, word, definition)
-        
-        print(f"✅ {word} (tähendus: {definition[:30]}{'...' if len(definition) > 30 else ''}) — Analüüs lõpetatud\n")
-        
-        return parsed_result
+        reply = get_cached_completion(*request)
+        return handle_definition_analysis(word, definition, reply)
 
     except Exception as e:
         print(f"❌ Viga sõnaga {word}, tähendus {definition}: {e}")
         return None
 
-# --- Põhiprogramm ---
-def main():
-    all_rows = []
-    
+# --- Sisend ja väljund ---
+FIELDNAMES = [
+    "Sõna", "Tähendus", "Tekstiregister", "Registri põhjendus", 
+    "Treeningandmete põhjendus", "Tähenduste arv kokku", "Sagedus", 
+    "Näited", "Registrimärk", "Märgendi põhjendus"
+]
+
+# Vastuse JSON-skeem (STRUCTURED_OUTPUT)
+RESPONSE_SCHEMA = definition_schema(
+    frequencies=("sage", "keskmine", "harv"),
+    labels=("halvustav", "harv", "kõnekeelne", "lastekeelne", "luulekeelne", "murdekeelne", "rahvakeelne",
+            "stiilitundlik", "unarsõna", "vananenud", "vulgaarne"))
+
+def read_word_definitions():
     # Loeme sisendandmeid (eeldame, et fail sisaldab veerge: sõna, tähendus)
     input_file = "sisend.tsv"  # Muuda faili nime vastavalt vajadusele
     
@@ -279,7 +341,7 @@ def main():
         print("sõna<TAB>tähendus")
         print("kits<TAB>koduloom")
         print("kits<TAB>Hiina sodiaagimärk")
-        return
+        return None
     
     with open(input_file, newline="", encoding="utf-8") as csvfile:
         reader = csv.reader(csvfile, delimiter='\t')
@@ -288,48 +350,68 @@ def main():
         for row in reader:
             if len(row) >= 2 and row[0].strip() and row[1].strip():
                 word_definitions.append((row[0].strip(), row[1].strip()))
+    return word_definitions
+
+def empty_row(word: str, definition: str) -> Dict[str, Any]:
+    return {
+        "Sõna": word,
+        "Tähendus": definition,
+        "Tekstiregister": "ei määratletud",
+        "Registri põhjendus": "kontekstifail puudub",
+        "Treeningandmete põhjendus": "ei saadaval",
+        "Tähenduste arv kokku": 0,
+        "Sagedus": "ei määratletud",
+        "Näited": "ei saadaval",
+        "Registrimärk": "ei kohaldu",
+        "Märgendi põhjendus": "ei saadaval"
+    }
+
+# --- Põhiprogramm ---
+def main():
+    word_definitions = read_word_definitions()
+    if word_definitions is None:
+        return
     
-    for i, (word, definition) in enumerate(word_definitions, 1):
+    # Sõna tähendused järjest, et sõna konteksti saaks vahemälust lugeda; tulemused jäävad sisendi järjekorda
+    order = [i for group in word_groups(word_definitions) for i in group]
+    all_rows = [None] * len(word_definitions)
+    summary = SummaryCsv(FINAL_CSV, FIELDNAMES)
+    for n, i in enumerate(order, 1):
+        word, definition = word_definitions[i]
         print(f"\n{'='*60}")
-        print(f"📝 ANALÜÜSIN ({i}/{len(word_definitions)}): '{word}' - '{definition[:50]}{'...' if len(definition) > 50 else ''}'")
+        print(f"📝 ANALÜÜSIN ({n}/{len(word_definitions)}): '{word}' - '{definition[:50]}{'...' if len(definition) > 50 else ''}'")
         print(f"{'='*60}")
         
+        # Järgmise sõna vektorindeks valmib taustal selle sõna päringu ajal
+        next_word = next((word_definitions[j][0] for j in order[n:] if word_definitions[j][0] != word), None)
+        if next_word and (n == 1 or word_definitions[order[n - 2]][0] != word):
+            prefetch_index(next_word, os.path.join(DATA_FOLDER, f"{next_word}_full_context_only.txt"),
+                           needs_retrieval, prepare=prepare_retrieval)
+
+        requests_before = RESPONSE_CACHE.misses
         result = process_definition_analysis(word, definition)
         if result:
-            all_rows.append(result)
+            all_rows[i] = result
         else:
             # Lisa tühi rida järjekorra säilitamiseks
             print(f"⚠️ Lisame tühja rea järjekorra säilitamiseks")
-            all_rows.append({
-                "Sõna": word,
-                "Tähendus": definition,
-                "Tekstiregister": "ei määratletud",
-                "Registri põhjendus": "kontekstifail puudub",
-                "Treeningandmete põhjendus": "ei saadaval",
-                "Tähenduste arv kokku": 0,
-                "Sagedus": "ei määratletud",
-                "Näited": "ei saadaval",
-                "Registrimärk": "ei kohaldu",
-                "Märgendi põhjendus": "ei saadaval"
-            })
+            all_rows[i] = empty_row(word, definition)
+        summary.append([all_rows[i]])  # koondfaili kohe, katkestuse korral tehtud töö säilib
         
-        time.sleep(0.5)  # Väike paus
-
-    # Salvesta CSV
-    fieldnames = [
-        "Sõna", "Tähendus", "Tekstiregister", "Registri põhjendus", 
-        "Treeningandmete põhjendus", "Tähenduste arv kokku", "Sagedus", 
-        "Näited", "Registrimärk", "Märgendi põhjendus"
-    ]
+        if RESPONSE_CACHE.misses > requests_before:  # vahemälust loetud vastuse järel pole pausi vaja
+            time.sleep(0.5)
 
-    with open(FINAL_CSV, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
-        writer.writeheader()
-        for row in all_rows:
-            writer.writerow(row)
+    # Koondfail lõpuks sisendi järjekorras
+    summary.rewrite(all_rows)
+    summary.close()
 
     print(f"\n✅ Lõplik fail salvestatud: {FINAL_CSV}")
     print(f"📊 Kokku analüüsitud ridu: {len(all_rows)}")
+    print(f"♻️ {RESPONSE_CACHE.summary()}")
+    if CACHE_STATS.requests:
+        print(f"💾 {CACHE_STATS.summary()}")
+    if is_loaded():
+        print(f"🧠 Vektoriseerimismudeli laadimine: {load_seconds():.1f} s")
 
     # Statistika
     unikaalsed_sõnad = len(set(row["Sõna"] for row in all_rows))
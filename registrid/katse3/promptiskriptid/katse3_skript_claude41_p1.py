@@ -4,14 +4,17 @@
 
 import os
 import csv
-import pickle
-import faiss
-import tiktoken
 import pandas as pd
 import re
 import time
 from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
+from embedding_service import is_loaded, load_seconds
+from context_packer import context_budget, prepare_relevant_chunks, record_usage, select_relevant_chunks
+from token_counter import TokenCounter
+from retrieval import prefetch_index
+from structured_output import (anthropic_tool, load_structured, meaning_rows,
+                               meanings_schema, message_text, structured_prompt)
+from response_cache import ResponseCache, SummaryCsv
 from anthropic import Anthropic
 
 # --- Konfiguratsioon ---
@@ -23,8 +26,13 @@ if not api_key:
 client = Anthropic(api_key=api_key)
 
 MODEL = "claude-opus-4-1-20250805"  # Claude 4.1 Opus
-EMBED_MODEL = SentenceTransformer("intfloat/multilingual-e5-base")
+TEMPERATURE = 0.1
+STRUCTURED_OUTPUT = False  # True: vastus JSON-skeemi järgi, skeemile mittevastava vastuse korral küsitakse parandust
 DATA_FOLDER = "contexts"
+CONTEXT_WINDOW = 200000  # mudeli kontekstiaken (sisend ja vastus kokku)
+MAX_OUTPUT_TOKENS = 10000
+FULL_CONTEXT_MAX_TOKENS = 150000  # suuremate kontekstide korral valitakse lõigud vektorotsinguga
+MMR_LAMBDA = None  # nt 0.7, et lõikude valikul eelistada mitmekesisemaid lõike
 OUTPUT_FOLDER = "vastused"
 FINAL_CSV = "vastused_koond.csv"
 
@@ -32,66 +40,56 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs("vector_cache", exist_ok=True)
 
 # --- Abi funktsioonid ---
-def tokenize_length(text: str, model="gpt-4o"):  # Jätame tiktoken GPT mudeli jaoks
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(text))
-
-def build_faiss_index(chunks: List[str]):
-    passages = [f"passage: {chunk}" for chunk in chunks]
-    embeddings = EMBED_MODEL.encode(passages, show_progress_bar=False)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-    return index, embeddings
-
-def save_index(index, chunks, path):
-    faiss.write_index(index, f"{path}.faiss")
-    with open(f"{path}_chunks.pkl", "wb") as f:
-        pickle.dump(chunks, f)
-
-def load_index(path):
-    index = faiss.read_index(f"{path}.faiss")
-    with open(f"{path}_chunks.pkl", "rb") as f:
-        chunks = pickle.load(f)
-    return index, chunks
-
-def ensure_index_exists(word: str, full_lines: List[str]):
-    index_path = os.path.join("vector_cache", word)
-    if os.path.exists(index_path + ".faiss") and os.path.exists(index_path + "_chunks.pkl"):
-        return load_index(index_path)
-    index, _ = build_faiss_index(full_lines)
-    save_index(index, full_lines, index_path)
-    return index, full_lines
-
-def get_relevant_chunks_max(query: str, chunks: List[str], index, max_k=None):
-    query_vec = EMBED_MODEL.encode([f"query: {query}"], show_progress_bar=False)
-    D, I = index.search(query_vec, len(chunks))
-    sorted_chunks = [chunks[i] for i in I[0]]
-    if max_k:
-        return sorted_chunks[:max_k]
-    return sorted_chunks
+TOKEN_COUNTER = TokenCounter("anthropic", MODEL)
+
+def tokenize_length(text: str) -> int:
+    return TOKEN_COUNTER.count(text)
+
+def context_budget_for(prompt: str) -> int:
+    """Konteksti eelarve: FULL_CONTEXT_MAX_TOKENS, kuid mitte rohkem, kui prompti ja vastuse kõrval aknasse mahub"""
+    return min(FULL_CONTEXT_MAX_TOKENS, context_budget(CONTEXT_WINDOW, tokenize_length(prompt), MAX_OUTPUT_TOKENS))
+
+def needs_retrieval(lines: List[str], context_path: str = None) -> bool:
+    return TOKEN_COUNTER.exceeds(lines, context_budget_for(analysis_prompt("")), context_path)
+
+def prepare_retrieval(word: str, lines: List[str]) -> bool:
+    return prepare_relevant_chunks(word, lines, context_budget_for(analysis_prompt(word)), tokenize_length)
+
+def completion_request(prompt: str, context: str) -> Dict[str, Any]:
+    """Päringu parameetrid (samad sünkroonsel päringul ja partiitöös)"""
+    request = dict(
+        model=MODEL,
+        max_tokens=MAX_OUTPUT_TOKENS,
+        temperature=TEMPERATURE,
+        messages=[
+            {
+                "role": "user",
+                "content": f"{prompt}\n\nTekstimaterjal:\n{context}"
+            }
+        ]
+    )
+    if STRUCTURED_OUTPUT:
+        request.update(anthropic_tool(RESPONSE_SCHEMA))
+    return request
 
 def get_completion(prompt: str, context: str) -> str:
     """Küsib Claude 4.1 Opuselt vastuse."""
     try:
-        response = client.messages.create(
-            model=MODEL,
-            max_tokens=10000,
-            temperature=0.1,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": f"{prompt}\n\nTekstimaterjal:\n{context}"
-                }
-            ]
-        )
+        response = client.messages.create(**completion_request(prompt, context))
         
         # Claude API tagastab vastuse sõnumite kujul
-        return response.content[0].text if response.content else ""
+        return message_text(response.content)
         
     except Exception as e:
         print(f"Claude API päringu viga: {e}")
         return ""
 
+RESPONSE_CACHE = ResponseCache(MODEL, TEMPERATURE)
+
+def get_cached_completion(prompt: str, context: str) -> str:
+    """Vastus vastuste vahemälust või mudelilt (uus vastus salvestatakse vahemällu)"""
+    return RESPONSE_CACHE.complete(get_completion, prompt, context)
+
 def sanitize_filename(text):
     return re.sub(r'[<>:"/\\|?*]', '_', text)[:100]
 
@@ -304,8 +302,15 @@ def parse_analysis_response(txt: str, word: str) -> List[Dict[str, Any]]:
         })
     return results
 
+def analysis_prompt(word: str) -> str:
+    prompt = create_analysis_prompt(word)
+    if STRUCTURED_OUTPUT:
+        prompt = structured_prompt(prompt)
+    return prompt
+
 # --- Töötlemine ---
-def process_word_analysis(word: str):
+def prepare_word_analysis(word: str):
+    """Päringu süsteemiprompt ja kasutaja sõnum (None, kui pole midagi saata)"""
     context_path = os.path.join(DATA_FOLDER, f"{word}_full_context_only.txt")
     if not os.path.exists(context_path):
         print(f"⛔ Puudub kontekstifail: {context_path}")
@@ -314,54 +319,83 @@ def process_word_analysis(word: str):
     with open(context_path, "r", encoding="utf-8") as f:
         lines = [line.strip() for line in f if line.strip()]
 
+    prompt = analysis_prompt(word)
+    budget = context_budget_for(prompt)
+
     full_text = "\n".join(lines)
-    if tokenize_length(full_text) < 150000:
+    full_tokens = TOKEN_COUNTER.count_lines(lines, context_path, budget=budget)
+    if full_tokens < budget:
         context = full_text
         print(f"📄 Kasutan täielikku konteksti ({len(lines)} rida)")
+        record_usage(word, MODEL, "full", len(lines), full_tokens, budget)
     else:
         print(f"ℹ️ Fail on suur – kasutatakse embedding-põhist lõikuvalikut ({word})")
-        index, chunks = ensure_index_exists(word, lines)
-        relevant_chunks = get_relevant_chunks_max(word, chunks, index, max_k=150)
+        relevant_chunks, used_tokens = select_relevant_chunks(word, lines, budget, tokenize_length,
+                                                              mmr_lambda=MMR_LAMBDA)
         context = "\n---\n".join(relevant_chunks)
-        print(f"📄 Kasutan {len(relevant_chunks)} kõige relevantsemat lõiku")
+        print(f"📄 Kasutan {len(relevant_chunks)} kõige relevantsemat lõiku ({used_tokens}/{budget} tokenit)")
+        record_usage(word, MODEL, "retrieval", len(relevant_chunks), used_tokens, budget)
 
-    prompt = create_analysis_prompt(word)
+    return prompt, context
 
-    try:
-        reply = get_completion(prompt, context)
+def handle_word_analysis(word: str, reply: str):
+    """Salvestab mudeli vastuse faili ja parsib selle"""
+    data = None
+    if STRUCTURED_OUTPUT:
+        data, reply = load_structured(reply, RESPONSE_SCHEMA, get_cached_completion)
 
-        print("\n" + "="*80)
-        print(f"🤖 MUDELI VASTUS sõnale '{word}':")
-        print("="*80)
-        print(reply)
-        print("="*80)
+    print("\n" + "="*80)
+    print(f"🤖 MUDELI VASTUS sõnale '{word}':")
+    print("="*80)
+    print(reply)
+    print("="*80)
 
-        safe_word = sanitize_filename(word)
-        out_path = os.path.join(OUTPUT_FOLDER, f"{safe_word}_analysis.txt")
-        with open(out_path, "w", encoding="utf-8") as out_f:
-            out_f.write(reply)
+    safe_word = sanitize_filename(word)
+    out_path = os.path.join(OUTPUT_FOLDER, f"{safe_word}_analysis.txt")
+    with open(out_path, "w", encoding="utf-8") as out_f:
+        out_f.write(reply)
 
-        parsed_results = parse_analysis_response(reply, word)
+    parsed_results = meaning_rows(word, data, FIELDNAMES) if data else parse_analysis_response(reply, word)
 
-        print(f"\n📊 PARSITUD TULEMUS:")
-        print(f"   📝 Tähendusi kokku (read): {len(parsed_results)}")
-        for result in parsed_results:
-            print(f"   {result['Tähenduse nr']}. {result['Tähendus'][:50]}{'...' if len(result['Tähendus']) > 50 else ''}")
-            print(f"      📈 Sagedus: {result['Sagedus']}")
-            print(f"      📋 Register: {result['Tekstiregister']} ({result['Registri kindlus']})")
-            print(f"      🏷️ Märgend: {result['Registrimärk']}")
+    print(f"\n📊 PARSITUD TULEMUS:")
+    print(f"   📝 Tähendusi kokku (read): {len(parsed_results)}")
+    for result in parsed_results:
+        print(f"   {result['Tähenduse nr']}. {result['Tähendus'][:50]}{'...' if len(result['Tähendus']) > 50 else ''}")
+        print(f"      📈 Sagedus: {result['Sagedus']}")
+        print(f"      📋 Register: {result['Tekstiregister']} ({result['Registri kindlus']})")
+        print(f"      🏷️ Märgend: {result['Registrimärk']}")
 
-        print(f"✅ {word} – Analüüs lõpetatud\n")
-        return parsed_results
+    print(f"✅ {word} – Analüüs lõpetatud\n")
+    return parsed_results
+
+def process_word_analysis(word: str):
+    request = prepare_word_analysis(word)
+    if request is None:
+        return None
+
+    try:
+        reply = get_cached_completion(*request)
+        return handle_word_analysis(word, reply)
 
     except Exception as e:
         print(f"⌛ Viga sõnaga {word}: {e}")
         return None
 
-# --- Põhiprogramm ---
-def main():
-    all_rows = []
-
+# --- Sisend ja väljund ---
+FIELDNAMES = [
+    "Sõna", "Tähenduse nr", "Tähendus", "Tähenduste arv kokku",
+    "Sagedus", "Näited", "Tekstiregister", "Registri põhjendus",
+    "Registri kindlus", "Registrimärk", "Märgendi põhjendus"
+]
+
+# Vastuse JSON-skeem (STRUCTURED_OUTPUT)
+RESPONSE_SCHEMA = meanings_schema(
+    FIELDNAMES,
+    frequencies=("sage", "keskmine", "vähene"),
+    labels=("halvustav", "harv", "kõnekeelne", "lastekeelne", "luulekeelne", "murdekeelne", "rahvapärane",
+            "stiilitundlik", "vananenud", "vulgaarne"))
+
+def read_words():
     # Loeme sisendfaili
     with open("sisend.txt", newline="", encoding="utf-8") as csvfile:
         reader = csv.reader(csvfile, delimiter="\t")
@@ -376,47 +410,59 @@ def main():
             for row in reader:
                 if len(row) >= 1 and row[0].strip():
                     words.append(row[0].strip())
+    return words
+
+def empty_rows(word: str) -> List[Dict[str, Any]]:
+    return [{
+        "Sõna": word,
+        "Tähenduse nr": 1,
+        "Tähendus": "töötlemata",
+        "Tähenduste arv kokku": 0,
+        "Sagedus": "kontekstifail puudub",
+        "Näited": "ei saadaval",
+        "Tekstiregister": "ei määratletud",
+        "Registri põhjendus": "ei saadaval",
+        "Registri kindlus": "pigem ebakindel",
+        "Registrimärk": "ei kohaldu",
+        "Märgendi põhjendus": "ei saadaval"
+    }]
+
+# --- Põhiprogramm ---
+def main():
+    all_rows = []
+
+    words = read_words()
+    summary = SummaryCsv(FINAL_CSV, FIELDNAMES)
 
     for i, word in enumerate(words, 1):
         print(f"\n{'='*60}")
         print(f"🔍 ANALÜÜSIN ({i}/{len(words)}): '{word}'")
         print(f"{'='*60}")
 
+        # Järgmise sõna vektorindeks valmib taustal selle sõna päringu ajal
+        if i < len(words):
+            next_word = words[i]
+            prefetch_index(next_word, os.path.join(DATA_FOLDER, f"{next_word}_full_context_only.txt"),
+                           needs_retrieval, prepare=prepare_retrieval)
+
+        requests_before = RESPONSE_CACHE.misses
         result = process_word_analysis(word)
-        if result:
-            all_rows.extend(result)
-        else:
+        if not result:
             print(f"⚠️ Lisame tühja rea järjekorra säilitamiseks")
-            all_rows.append({
-                "Sõna": word,
-                "Tähenduse nr": 1,
-                "Tähendus": "töötlemata",
-                "Tähenduste arv kokku": 0,
-                "Sagedus": "kontekstifail puudub",
-                "Näited": "ei saadaval",
-                "Tekstiregister": "ei määratletud",
-                "Registri põhjendus": "ei saadaval",
-                "Registri kindlus": "pigem ebakindel",
-                "Registrimärk": "ei kohaldu",
-                "Märgendi põhjendus": "ei saadaval"
-            })
-
-        time.sleep(0.5)
-
-    fieldnames = [
-        "Sõna", "Tähenduse nr", "Tähendus", "Tähenduste arv kokku",
-        "Sagedus", "Näited", "Tekstiregister", "Registri põhjendus",
-        "Registri kindlus", "Registrimärk", "Märgendi põhjendus"
-    ]
-
-    with open(FINAL_CSV, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
-        writer.writeheader()
-        for row in all_rows:
-            writer.writerow(row)
+            result = empty_rows(word)
+        all_rows.extend(result)
+        summary.append(result)  # koondfaili kohe, katkestuse korral tehtud töö säilib
+
+        if RESPONSE_CACHE.misses > requests_before:  # vahemälust loetud vastuse järel pole pausi vaja
+            time.sleep(0.5)
+
+    summary.close()
 
     print(f"\n✅ Lõplik fail salvestatud: {FINAL_CSV}")
     print(f"📊 Kokku analüüsitud ridu: {len(all_rows)}")
+    print(f"♻️ {RESPONSE_CACHE.summary()}")
+    if is_loaded():
+        print(f"🧠 Vektoriseerimismudeli laadimine: {load_seconds():.1f} s")
 
     # Statistika
     unikaalsed_sõnad = len(set(row["Sõna"] for row in all_rows))
@@ -6,6 +6,9 @@ import re
 import time
 from typing import List, Dict, Any
 from anthropic import Anthropic
+from structured_output import (anthropic_tool, load_structured, meaning_rows,
+                               meanings_schema, message_text, structured_prompt)
+from response_cache import ResponseCache, SummaryCsv
 
 # --- Konfiguratsioon ---
 # API klient
@@ -15,34 +18,49 @@ if not api_key:
 
 client = Anthropic(api_key=api_key)
 MODEL = "claude-opus-4-1-20250805"  # Claude 4.1 Opus
+TEMPERATURE = 0.1
+STRUCTURED_OUTPUT = False  # True: vastus JSON-skeemi järgi, skeemile mittevastava vastuse korral küsitakse parandust
 OUTPUT_FOLDER = "vastused"
 FINAL_CSV = "vastused_koond.csv"
 
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 # --- Abifunktsioonid ---
+def completion_request(prompt: str, user_msg: str) -> Dict[str, Any]:
+    """Päringu parameetrid (samad sünkroonsel päringul ja partiitöös)"""
+    request = dict(
+        model=MODEL,
+        max_tokens=16000,
+        temperature=TEMPERATURE,
+        messages=[
+            {
+                "role": "user",
+                "content": f"{prompt}\n\n{user_msg}"
+            }
+        ]
+    )
+    if STRUCTURED_OUTPUT:
+        request.update(anthropic_tool(RESPONSE_SCHEMA))
+    return request
+
 def get_completion(prompt: str, user_msg: str) -> str:
     """Küsib Claude 4.1 Opuselt vastuse."""
     try:
-        response = client.messages.create(
-            model=MODEL,
-            max_tokens=16000,
-            temperature=0.1,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": f"{prompt}\n\n{user_msg}"
-                }
-            ]
-        )
+        response = client.messages.create(**completion_request(prompt, user_msg))
         
         # Claude API tagastab vastuse sõnumite kujul
-        return response.content[0].text if response.content else ""
+        return message_text(response.content)
         
     except Exception as e:
         print(f"Claude API päringu viga: {e}")
         return ""
 
+RESPONSE_CACHE = ResponseCache(MODEL, TEMPERATURE)
+
+def get_cached_completion(prompt: str, user_msg: str) -> str:
+    """Vastus vastuste vahemälust või mudelilt (uus vastus salvestatakse vahemällu)"""
+    return RESPONSE_CACHE.complete(get_completion, prompt, user_msg)
+
 def sanitize_filename(text: str) -> str:
     return re.sub(r'[<>:"/\\|?*]', '_', text)[:100]
 
@@ -240,45 +258,72 @@ def parse_analysis_response(txt: str, word: str) -> List[Dict[str, Any]]:
     return results
 
 # --- Töötlemine (ilma kontekstifailideta) ---
-def process_word_analysis(word: str):
+def prepare_word_analysis(word: str):
+    """Päringu süsteemiprompt ja kasutaja sõnum (None, kui pole midagi saata)"""
     prompt = create_analysis_prompt(word)
+    if STRUCTURED_OUTPUT:
+        prompt = structured_prompt(prompt)
     user_msg = f"Analüüsi sõna \"{word}\" ainult oma treeningandmete põhjal ja tagasta täpselt nõutud struktuur."
+    return prompt, user_msg
+
+def handle_word_analysis(word: str, reply: str):
+    """Salvestab mudeli vastuse faili ja parsib selle"""
+    data = None
+    if STRUCTURED_OUTPUT:
+        data, reply = load_structured(reply, RESPONSE_SCHEMA, get_cached_completion)
+
+    # logi ja salvesta toorvastus
+    print("\n" + "="*80)
+    print(f"MUDELI VASTUS sõnale '{word}':")
+    print("="*80)
+    print(reply)
+    print("="*80)
+
+    safe_word = sanitize_filename(word)
+    out_path = os.path.join(OUTPUT_FOLDER, f"{safe_word}_analysis.txt")
+    with open(out_path, "w", encoding="utf-8") as out_f:
+        out_f.write(reply)
+
+    parsed = meaning_rows(word, data, FIELDNAMES) if data else parse_analysis_response(reply, word)
+
+    # lühikokkuvõte
+    print(f"\nPARSITUD TULEMUS:")
+    print(f"   Ridu kokku: {len(parsed)}")
+    for r in parsed:
+        print(f"   {r['Tähenduse nr']}. {r['Tähendus'][:60]}{'...' if len(r['Tähendus']) > 60 else ''}")
+        print(f"      {r['Sagedus']} | {r['Tekstiregister']} ({r['Registri kindlus']}) | {r['Registrimärk']}")
+
+    print(f"{word} — Analüüs lõpetatud\n")
+    return parsed
 
-    try:
-        reply = get_completion(prompt, user_msg)
-
-        # logi ja salvesta toorvastus
-        print("\n" + "="*80)
-        print(f"MUDELI VASTUS sõnale '{word}':")
-        print("="*80)
-        print(reply)
-        print("="*80)
-
-        safe_word = sanitize_filename(word)
-        out_path = os.path.join(OUTPUT_FOLDER, f"{safe_word}_analysis.txt")
-        with open(out_path, "w", encoding="utf-8") as out_f:
-            out_f.write(reply)
-
-        parsed = parse_analysis_response(reply, word)
-
-        # lühikokkuvõte
-        print(f"\nPARSITUD TULEMUS:")
-        print(f"   Ridu kokku: {len(parsed)}")
-        for r in parsed:
-            print(f"   {r['Tähenduse nr']}. {r['Tähendus'][:60]}{'...' if len(r['Tähendus']) > 60 else ''}")
-            print(f"      {r['Sagedus']} | {r['Tekstiregister']} ({r['Registri kindlus']}) | {r['Registrimärk']}")
+def process_word_analysis(word: str):
+    request = prepare_word_analysis(word)
+    if request is None:
+        return None
 
-        print(f"{word} — Analüüs lõpetatud\n")
-        return parsed
+    try:
+        reply = get_cached_completion(*request)
+        return handle_word_analysis(word, reply)
 
     except Exception as e:
         print(f"Viga sõnaga {word}: {e}")
         return None
 
-# --- Põhiprogramm ---
-def main():
-    all_rows: List[Dict[str, Any]] = []
-
+# --- Sisend ja väljund ---
+FIELDNAMES = [
+    "Sõna", "Tähenduse nr", "Tähendus", "Tähenduste arv kokku",
+    "Sagedus", "Näited", "Tekstiregister", "Registri põhjendus",
+    "Registri kindlus", "Registrimärk", "Märgendi põhjendus"
+]
+
+# Vastuse JSON-skeem (STRUCTURED_OUTPUT)
+RESPONSE_SCHEMA = meanings_schema(
+    FIELDNAMES,
+    frequencies=("sage", "keskmine", "vähene"),
+    labels=("halvustav", "harv", "kõnekeelne", "lastekeelne", "luulekeelne", "murdekeelne", "rahvapärane",
+            "stiilitundlik", "vananenud", "vulgaarne"))
+
+def read_words():
     # Loeme sisendfaili (tab-eraldaja). Kui päis „Sõna", jäta vahele.
     with open("sisend.txt", newline="", encoding="utf-8") as csvfile:
         reader = csv.reader(csvfile, delimiter="\t")
@@ -292,47 +337,51 @@ def main():
             for row in reader:
                 if row and row[0].strip():
                     words.append(row[0].strip())
+    return words
+
+def empty_rows(word: str) -> List[Dict[str, Any]]:
+    return [{
+        "Sõna": word,
+        "Tähenduse nr": 1,
+        "Tähendus": "töötlemata",
+        "Tähenduste arv kokku": 0,
+        "Sagedus": "ei saadaval",
+        "Näited": "ei saadaval",
+        "Tekstiregister": "ei määratletud",
+        "Registri põhjendus": "ei saadaval",
+        "Registri kindlus": "pigem ebakindel",
+        "Registrimärk": "ei kohaldu",
+        "Märgendi põhjendus": "ei saadaval"
+    }]
+
+# --- Põhiprogramm ---
+def main():
+    all_rows: List[Dict[str, Any]] = []
+
+    words = read_words()
+    summary = SummaryCsv(FINAL_CSV, FIELDNAMES)
 
     for i, word in enumerate(words, 1):
         print(f"\n{'='*60}")
         print(f"ANALÜÜSIN ({i}/{len(words)}): '{word}'")
         print(f"{'='*60}")
 
+        requests_before = RESPONSE_CACHE.misses
         result = process_word_analysis(word)
-        if result:
-            all_rows.extend(result)
-        else:
+        if not result:
             print("Lisame tühja rea järjekorra säilitamiseks")
-            all_rows.append({
-                "Sõna": word,
-                "Tähenduse nr": 1,
-                "Tähendus": "töötlemata",
-                "Tähenduste arv kokku": 0,
-                "Sagedus": "ei saadaval",
-                "Näited": "ei saadaval",
-                "Tekstiregister": "ei määratletud",
-                "Registri põhjendus": "ei saadaval",
-                "Registri kindlus": "pigem ebakindel",
-                "Registrimärk": "ei kohaldu",
-                "Märgendi põhjendus": "ei saadaval"
-            })
-
-        time.sleep(0.5)
-
-    # CSV
-    fieldnames = [
-        "Sõna", "Tähenduse nr", "Tähendus", "Tähenduste arv kokku",
-        "Sagedus", "Näited", "Tekstiregister", "Registri põhjendus",
-        "Registri kindlus", "Registrimärk", "Märgendi põhjendus"
-    ]
-    with open(FINAL_CSV, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
-        writer.writeheader()
-        for row in all_rows:
-            writer.writerow(row)
+            result = empty_rows(word)
+        all_rows.extend(result)
+        summary.append(result)  # koondfaili kohe, katkestuse korral tehtud töö säilib
+
+        if RESPONSE_CACHE.misses > requests_before:  # vahemälust loetud vastuse järel pole pausi vaja
+            time.sleep(0.5)
+
+    summary.close()
 
     print(f"\nLõplik fail salvestatud: {FINAL_CSV}")
     print(f"Kokku analüüsitud ridu: {len(all_rows)}")
+    print(f"♻️ {RESPONSE_CACHE.summary()}")
 
     # Stat
     uniq = len(set(r["Sõna"] for r in all_rows))
@@ -0,0 +1,232 @@
+#Odav leksikaalne eelvalik enne vektorotsingut (ühine katse3 promptiskriptidele).
+#Väga suure kontekstifaili korral ei vektoriseerita kõiki ridu: BM25 järgi valitakse mõni tuhat kandidaati,
+#mida seejärel vektoritega järjestatakse. Päringusõnad, mis esinevad enam kui MAX_DF_SHARE osas ridadest
+#(eelkõige märksõna ise, mis on igas reas), jäetakse välja, sest need ridu ei erista. Skoori järgi
+#võetakse ainult read, kus mõni eristav päringusõna esineb (p2 puhul tähenduse seletuse sõnad); ülejäänud
+#kandidaadid võetakse failist ühtlaste vahedega.
+#
+#Piirang: kui päringus pole ühtki eristavat sõna (p1 päring on ainult märksõna, mis on oma failis peaaegu
+#igas reas), ei ole eelvalikul midagi järjestada ja see jäetakse vahele (has_lexical_signal): sellisel juhul
+#vektoriseeritakse kogu fail nagu väiksemate failide korral. Eelvalik toimib seega ainult p2 tähenduse
+#seletusega päringute korral.
+#
+#Valimi kallutatus: p2 päringu korral on valik kallutatud seletuse sõnastusega sarnaste ridade poole ja
+#teised tähendused on kandidaatides alaesindatud. Registrivihjete (hüüumärgid, emotikonid,
+#kõnekeelsed ja ametlikud sõnad, suurtähtsõnad, venitatud sõnad) kaal on vaikimisi 0: positiivse kaalu
+#korral eelistatakse vihjetega ridu, mis on enamasti mitteametlikud, ja see muudab mudelile näidatava
+#konteksti registrijaotust. Vihjeid loetakse märksõna sisaldavast lausest (KWIC-lause hinnang: esimene
+#märksõnaga algav sõne ja selle ümber lauselõpumärkideni), mitte kogu reast.
+#Sõnavormid normaliseeritakse ainult esimeste STEM_CHARS tähe järgi. See ei ole eesti keele
+#normaliseerimine: lühikeste tüvede vormid jäävad eri terminiteks ja erinevad pikad sõnad võivad kokku
+#langeda (eesti keele lemmatiseerijat siin ei kasutata).
+
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Sõnavormi normaliseerimine: esimesed STEM_CHARS tähte
+STEM_CHARS = 6
+# Kandidaatide osa, mis võetakse failist ühtlaste vahedega (mitte skoori järgi)
+SAMPLE_SHARE = 0.25
+# Registrivihje kaal BM25 skoori kõrval (0: vihjeid ei arvestata, vt päises valimi kallutatust)
+REGISTER_CUE_WEIGHT = 0.0
+# Päringusõnad, mis esinevad suuremas osas ridadest, ei erista ridu ja jäetakse skoorist välja
+MAX_DF_SHARE = 0.5
+MAX_CACHED_INDEXES = 4
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Registrivihjed: kirjavahemärgid ja emotikonid, venitatud sõnad, suurtähtsõnad, kõnekeelne ja ametlik sõnavara
+PUNCTUATION_CUE_RE = re.compile(r"[!?]{2,}|[:;]-?[)(DPp]|<3")
+ELONGATION_RE = re.compile(r"(\w)\1\1")
+SENTENCE_END_RE = re.compile(r"[.!?…]+(?=\s|$)")
+COLLOQUIAL_WORDS = frozenset("noh nojah mingi äge lahe kuule tsau tšau lol okei jee vau pekki kurat xd".split())
+FORMAL_WORDS = frozenset("vastavalt käesolev käesoleva sätestatud sätestab tulenevalt nimetatud".split())
+
+
+def normalise(token: str) -> str:
+    return token.lower()[:STEM_CHARS]
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalise(t) for t in TOKEN_RE.findall(text)]
+
+
+def kwic_sentence(line: str, headword: str) -> str:
+    """
+    The sentence of the line around the first form of the headword (the whole line if there is none)
+
+    Context lines carry no KWIC markup, so the hit is the first word starting
+    with the headword's normalised prefix and the sentence runs between the
+    nearest sentence-final punctuation marks around it.
+    """
+    prefix = normalise(headword)
+    hit = next((m for m in TOKEN_RE.finditer(line) if m.group().lower().startswith(prefix)), None)
+    if hit is None:
+        return line
+    start = 0
+    for end in SENTENCE_END_RE.finditer(line, 0, hit.start()):
+        start = end.end()
+    end = SENTENCE_END_RE.search(line, hit.end())
+    return line[start:end.end() if end else len(line)].strip()
+
+
+def register_cues(line: str, words: Optional[List[str]] = None) -> int:
+    """
+    Number of different register cues in a line
+
+    Args:
+        line: The line
+        words: Its words (TOKEN_RE matches), if already split
+    """
+    if words is None:
+        words = TOKEN_RE.findall(line)
+    lowered = {w.lower() for w in words}
+    return (bool(PUNCTUATION_CUE_RE.search(line))
+            + bool(lowered & COLLOQUIAL_WORDS)
+            + bool(lowered & FORMAL_WORDS or '§' in line)
+            + any(len(w) >= 4 and w.isupper() for w in words)
+            + any(ELONGATION_RE.search(w) for w in words if len(w) >= 3))
+
+
+class BM25Index:
+    def __init__(self, lines: List[str]):
+        """
+        Inverted index of the lines of one context file
+
+        Args:
+            lines: Lines of the context file
+        """
+        vocabulary: Dict[str, int] = {}
+        term_ids: List[int] = []
+        line_ids: List[int] = []
+        lengths = np.zeros(len(lines), dtype=np.float32)
+        for i, line in enumerate(lines):
+            tokens = tokenize(line)
+            lengths[i] = len(tokens)
+            term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+            line_ids.extend([i] * len(tokens))
+        self.size = len(lines)
+        self.lengths = lengths
+        self.avg_length = float(lengths.mean()) if len(lines) else 0.0
+        self._cues: Dict[str, np.ndarray] = {}
+
+        # (termin, rida) paaride sagedused; paarid on järjestatud termini ja rea järgi
+        pairs, tf = np.unique(np.asarray(term_ids, dtype=np.int64) * max(1, self.size)
+                              + np.asarray(line_ids, dtype=np.int64), return_counts=True)
+        terms = pairs // max(1, self.size)
+        bounds = np.searchsorted(terms, np.arange(len(vocabulary) + 1))
+        ids = pairs % max(1, self.size)
+        tf = tf.astype(np.float32)
+        self.postings = {
+            token: (ids[bounds[t]:bounds[t + 1]], tf[bounds[t]:bounds[t + 1]])
+            for token, t in vocabulary.items()
+        }
+
+    def discriminating_terms(self, query: str) -> List[str]:
+        """Normalised query terms that occur in the lines, but in at most MAX_DF_SHARE of them"""
+        return [token for token in dict.fromkeys(tokenize(query))
+                if token in self.postings and len(self.postings[token][0]) <= MAX_DF_SHARE * self.size]
+
+    def cues(self, lines: List[str], headword: str) -> np.ndarray:
+        """Register cues of the KWIC sentence of every line (computed once per headword)"""
+        key = normalise(headword)
+        if key not in self._cues:
+            self._cues[key] = np.array([register_cues(kwic_sentence(line, headword)) for line in lines],
+                                       dtype=np.float32)
+        return self._cues[key]
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every line for the query terms that discriminate between lines"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        if not self.size:
+            return scores
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(self.avg_length, 1.0))
+        for token in self.discriminating_terms(query):
+            ids, tf = self.postings[token]
+            idf = math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tf * (BM25_K1 + 1) / (tf + norm[ids])
+        return scores
+
+    def candidates(self, query: str, k: int, cues: Optional[np.ndarray] = None,
+                   cue_weight: float = REGISTER_CUE_WEIGHT,
+                   sample_share: float = SAMPLE_SHARE) -> np.ndarray:
+        """
+        Ids of up to k candidate lines, in file order
+
+        Lines are taken by score only where the score is positive; the rest of
+        the candidates are taken at even intervals from the other lines.
+
+        Args:
+            query: Search query (word, or word and definition)
+            k: Number of candidates
+            cues: Register cues of every line (see cues()), needed if cue_weight is not 0
+            cue_weight: Weight of a register cue relative to the BM25 score
+            sample_share: Minimum share of candidates taken at even intervals from the rest of the file
+        """
+        if k >= self.size:
+            return np.arange(self.size)
+        scores = self.scores(query)
+        if cue_weight and cues is not None:
+            scores = scores + cue_weight * cues
+        top_k = min(k - int(k * sample_share), int(np.count_nonzero(scores > 0)))
+        best = np.argpartition(-scores, top_k - 1)[:top_k] if top_k > 0 else np.empty(0, dtype=np.int64)
+        rest = np.setdiff1d(np.arange(self.size), best, assume_unique=True)
+        sampled = rest[np.linspace(0, len(rest) - 1, k - top_k).astype(np.int64)] if k > top_k else rest[:0]
+        return np.sort(np.concatenate([best, sampled]))
+
+
+_indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def lines_key(lines: List[str]) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for line in lines:
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def get_bm25_index(lines: List[str], key: Optional[str] = None) -> BM25Index:
+    """Index of the lines, kept in memory for the last few context files"""
+    key = key or lines_key(lines)
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+        index = BM25Index(lines)
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+        return index
+
+
+def has_lexical_signal(query: str, lines: List[str], cue_weight: float = REGISTER_CUE_WEIGHT) -> bool:
+    """True if the prefilter can rank the lines: the query has a discriminating term or register cues are used"""
+    return bool(cue_weight) or bool(get_bm25_index(lines).discriminating_terms(query))
+
+
+def lexical_prefilter(query: str, lines: List[str], k: int, headword: Optional[str] = None,
+                      cue_weight: float = REGISTER_CUE_WEIGHT) -> List[int]:
+    """
+    Ids (in file order) of the k lines to pass on to dense retrieval
+
+    Args:
+        query: Search query (word, or word and definition)
+        lines: Lines of the context file
+        k: Number of candidates
+        headword: The word whose KWIC sentence the register cues are read from (default: first query word)
+        cue_weight: Weight of a register cue relative to the BM25 score
+    """
+    index = get_bm25_index(lines)
+    cues = None
+    if cue_weight:
+        cues = index.cues(lines, headword or query.split()[0])
+    return index.candidates(query, k, cues=cues, cue_weight=cue_weight).tolist()
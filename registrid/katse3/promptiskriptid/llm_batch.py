@@ -0,0 +1,278 @@
+#Partiitööde režiim katse3 registrianalüüsile (Anthropic Message Batches, OpenAI Batch API).
+#Katse3 päringud ei ole kiired ega vaja kohest vastust: kõik skripti päringud (prompt + kontekst, samad mis
+#sünkroonsel käivitusel) saadetakse ühe või mitme partiitööna, tööde olekut kontrollitakse iga POLL_SECONDS
+#järel ja valmis vastused parsitakse skripti enda funktsioonidega. Partiitööd on umbes poole odavamad ja
+#ei jookse kiiruspiirangutesse. Tööde tunnused salvestatakse faili <väljundkaust>/batch_jobs.json kohe pärast
+#iga partiitöö saatmist, nii et katkestatud käivitus saadab ainult veel saatmata päringud ja jätkab ootamist,
+#mitte ei saada päringuid uuesti (uue käivituse jaoks kustuta fail).
+#Tähendusepõhistes skriptides (p2) on ühe sõna tähenduste päringud partiis järjest ja sama kontekstieesliitega,
+#vahemälust loetud tokenid näidatakse tulemuste juures.
+#Päringuid, mille vastus on juba vastuste vahemälus (response_cache.py), ei saadeta; uued vastused
+#salvestatakse vahemällu.
+#Gemini skriptid partiirežiimi ei toeta (neid saab käivitada llm_runner.py-ga).
+#
+#Käivitamine: python llm_batch.py "*_p1"
+#Kohalik asendaja: python mock_batch_server.py 8766 ja
+#  ANTHROPIC_BASE_URL=http://127.0.0.1:8766 OPENAI_BASE_URL=http://127.0.0.1:8766/v1 python llm_batch.py ...
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_runner import (OUTPUT_ROOT, SCRIPTS, empty_item_rows, is_definition_script, load_script,
+                        open_summary, read_items, select_scripts, work_units)
+from structured_output import message_text
+
+BATCH_STATE = "batch_jobs.json"
+POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", 60))
+# Ühe partiitöö piirid (Anthropic: 100 000 päringut / 256 MB, OpenAI: 50 000 päringut / 200 MB)
+MAX_BATCH_REQUESTS = 10000
+MAX_BATCH_BYTES = 150 * 1024 * 1024
+
+
+class AnthropicBatches:
+    name = 'anthropic'
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests: List[Tuple[str, Dict[str, Any]]]) -> str:
+        batch = self.client.messages.batches.create(
+            requests=[{"custom_id": custom_id, "params": params} for custom_id, params in requests])
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        return self.client.messages.batches.retrieve(batch_id).processing_status == "ended"
+
+    def results(self, batch_id: str, cache_stats=None) -> Dict[str, str]:
+        replies = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                content = entry.result.message.content
+                replies[entry.custom_id] = message_text(content)
+                if cache_stats is not None:
+                    cache_stats.add(entry.result.message.usage)
+            else:
+                print(f"⚠️ {entry.custom_id}: {entry.result.type}")
+        return replies
+
+
+class OpenAIBatches:
+    name = 'openai'
+    endpoint = "/v1/chat/completions"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests: List[Tuple[str, Dict[str, Any]]]) -> str:
+        lines = [json.dumps({"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": params},
+                            ensure_ascii=False) for custom_id, params in requests]
+        upload = self.client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = self.client.batches.create(input_file_id=upload.id, endpoint=self.endpoint,
+                                           completion_window="24h")
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        return self.client.batches.retrieve(batch_id).status in ("completed", "failed", "expired", "cancelled")
+
+    def results(self, batch_id: str, cache_stats=None) -> Dict[str, str]:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            print(f"⚠️ Partiitöö {batch_id}: {batch.status}")
+        replies = {}
+        if batch.output_file_id:
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    replies[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"] or ""
+                    if cache_stats is not None:
+                        cache_stats.add(response["body"].get("usage"))
+                else:
+                    print(f"⚠️ {entry['custom_id']}: {response.get('status_code')} {entry.get('error')}")
+        return replies
+
+
+BATCH_BACKENDS = {
+    'anthropic': AnthropicBatches,
+    'openai': OpenAIBatches,
+}
+
+
+def split_requests(requests: List[Tuple[str, Dict[str, Any]]]) -> List[List[Tuple[str, Dict[str, Any]]]]:
+    """Split requests into batches within the request count and size limits"""
+    batches, current, size = [], [], 0
+    for request in requests:
+        request_size = len(json.dumps(request[1], ensure_ascii=False).encode("utf-8"))
+        if current and (len(current) >= MAX_BATCH_REQUESTS or size + request_size > MAX_BATCH_BYTES):
+            batches.append(current)
+            current, size = [], 0
+        current.append(request)
+        size += request_size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def prepare_request(module, item) -> Optional[Tuple[str, str]]:
+    if is_definition_script(module):
+        return module.prepare_definition_analysis(*item)
+    return module.prepare_word_analysis(item)
+
+
+def handle_reply(module, item, reply: Optional[str]) -> List[Dict[str, Any]]:
+    """Rows parsed from a batch reply; the script's empty rows if there is none"""
+    if reply is None:
+        return empty_item_rows(module, item)
+    try:
+        if is_definition_script(module):
+            result = module.handle_definition_analysis(*item, reply)
+            return [result] if result else empty_item_rows(module, item)
+        return module.handle_word_analysis(item, reply) or empty_item_rows(module, item)
+    except Exception as e:
+        print(f"❌ Viga ({module.MODEL}, {item}): {e}")
+        return empty_item_rows(module, item)
+
+
+def load_state(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: Dict[str, Any]):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".part", path)
+
+
+def submit_script(name: str, module, backend, state: Dict[str, Any], state_path: str) -> Dict[str, Any]:
+    """
+    Build the requests of a script that are not in the response cache and submit them as batch jobs
+
+    The state is saved after every submitted batch, so an interrupted
+    submission resumes with the requests that were not sent yet.
+
+    Args:
+        name: Script name
+        module: The loaded script
+        backend: Batch backend of the script's provider
+        state: Batch state of all scripts (updated in place)
+        state_path: File the state is saved to
+
+    Returns:
+        The script's entry in the state
+    """
+    entry = state.get(name)
+    if entry is None:
+        entry = {'provider': backend.name, 'batches': [], 'items': read_items(module), 'keys': {},
+                 'submitted': [], 'complete': False}
+        state[name] = entry
+    else:
+        print(f"↩️ {name}: jätkan saatmist ({len(entry['batches'])} partiitööd juba saadetud)")
+    items = entry['items']
+    submitted = set(entry['submitted'])
+    requests, keys = [], {}
+    for i in (i for unit in work_units(module, items) for i in unit):
+        request = prepare_request(module, items[i])
+        if request is None:
+            continue
+        custom_id = f"{name}-{i:05d}"
+        keys[custom_id] = module.RESPONSE_CACHE.key(*request)
+        if custom_id not in submitted and module.RESPONSE_CACHE.get(keys[custom_id]) is None:
+            requests.append((custom_id, module.completion_request(*request)))
+    entry['keys'] = keys
+    for chunk in split_requests(requests):
+        entry['batches'].append(backend.submit(chunk))
+        entry['submitted'].extend(custom_id for custom_id, _ in chunk)
+        save_state(state_path, state)
+    entry['complete'] = True
+    save_state(state_path, state)
+    print(f"📤 {name}: {len(entry['submitted'])} päringut {len(entry['batches'])} partiitöös "
+          f"({', '.join(entry['batches'])}), {len(keys) - len(entry['submitted'])} vastust vahemälust")
+    return entry
+
+
+def run_batches(names: List[str], output_root: str = OUTPUT_ROOT,
+                poll_seconds: float = POLL_SECONDS) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Run the given scripts as provider batch jobs and write their summaries
+
+    Args:
+        names: Script names (keys of llm_runner.SCRIPTS)
+        output_root: Folder for the answers and the batch state file
+        poll_seconds: Seconds between status checks
+
+    Returns:
+        Rows of every script, in input order
+    """
+    os.makedirs(output_root, exist_ok=True)
+    state_path = os.path.join(output_root, BATCH_STATE)
+    state = load_state(state_path)
+
+    modules, backends = {}, {}
+    for name in names:
+        if SCRIPTS[name] not in BATCH_BACKENDS:
+            print(f"⚠️ {name}: {SCRIPTS[name]} partiitöid siin ei toetata, jätan vahele")
+            continue
+        modules[name] = load_script(name, output_root)
+        backends[name] = BATCH_BACKENDS[SCRIPTS[name]](modules[name].client)
+        # Vanemates olekufailides puudub 'complete': need salvestati alles pärast kõigi tööde saatmist
+        if name in state and state[name].get('complete', True):
+            print(f"⏩ {name}: partiitööd on juba saadetud ({', '.join(state[name]['batches'])})")
+        else:
+            submit_script(name, modules[name], backends[name], state, state_path)
+
+    pending = {(name, batch_id) for name in modules for batch_id in state[name]['batches']}
+    started = time.perf_counter()
+    while pending:
+        pending = {(name, batch_id) for name, batch_id in pending if not backends[name].is_done(batch_id)}
+        if pending:
+            print(f"⏳ Ootel {len(pending)} partiitööd ({(time.perf_counter() - started) / 60:.1f} min)")
+            time.sleep(poll_seconds)
+
+    results = {}
+    for name, module in modules.items():
+        replies = {}
+        cache_stats = getattr(module, 'CACHE_STATS', None)
+        for batch_id in state[name]['batches']:
+            replies.update(backends[name].results(batch_id, cache_stats))
+        items = [tuple(item) if isinstance(item, list) else item for item in state[name]['items']]
+        keys = state[name].get('keys', {})
+        summary = open_summary(module)
+        rows = []
+        for i, item in enumerate(items):
+            custom_id = f"{name}-{i:05d}"
+            reply = replies.get(custom_id)
+            if custom_id in keys:
+                if reply:
+                    module.RESPONSE_CACHE.put(keys[custom_id], reply)
+                elif reply is None:
+                    reply = module.RESPONSE_CACHE.get(keys[custom_id])
+            item_rows = handle_reply(module, item, reply)
+            summary.append(item_rows)
+            rows.extend(item_rows)
+        summary.close()
+        results[name] = rows
+        print(f"📁 {name}: {len(replies)}/{len(items)} uut vastust, {len(rows)} rida → {summary.path}")
+        if cache_stats is not None and cache_stats.requests:
+            print(f"💾 {name}: {cache_stats.summary()}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run katse3 prompt scripts as provider batch jobs")
+    parser.add_argument("scripts", nargs="*", help=f"Script names or patterns (default: all of {list(SCRIPTS)})")
+    parser.add_argument("--output", default=OUTPUT_ROOT, help="Output folder")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="Seconds between status checks")
+    args = parser.parse_args()
+    run_batches(select_scripts(args.scripts), args.output, args.poll)
+
+
+if __name__ == "__main__":
+    main()
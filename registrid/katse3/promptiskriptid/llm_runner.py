@@ -0,0 +1,294 @@
+#Ühine käivitaja katse3 promptiskriptidele: sõnad × mudelid ühe käivitusega.
+#Iga skript (katse3_skript_<mudel>_<p1|p2>.py) annab oma sisendi, prompti, konteksti ja parsimise; käivitaja
+#hoiab iga teenusepakkuja (Anthropic, OpenAI, Google) juures korraga kuni N päringut ootel, mitte üht
+#päringut ja pausi järjest. Kiiruspiirangu (429) ja ülekoormuse vastuste korral proovitakse uuesti.
+#Iga skripti vastused ja koondfail lähevad kausta <väljundkaust>/<skript>/.
+#Koondfaili read kirjutatakse iga sõna valmimisel (response_cache.SummaryCsv), nii et katkestatud käivituse
+#read jäävad alles.
+#Skript, mille importimine ebaõnnestub (puuduv SDK, API võti vms), jäetakse vahele ja teised jätkavad.
+#Tähendusepõhistes skriptides (p2) saadetakse ühe sõna tähendused järjest samas lõimes, et sõna konteksti
+#eesliide oleks järgmise tähenduse päringu ajaks teenusepakkuja vahemälus.
+#
+#Käivitamine: python llm_runner.py                      (kõik skriptid)
+#             python llm_runner.py "*_p1" gpt41_p2      (valik, lubatud on * ja ?)
+#Samaaegsete päringute arv: ANTHROPIC_MAX_IN_FLIGHT, OPENAI_MAX_IN_FLIGHT, GEMINI_MAX_IN_FLIGHT
+
+import argparse
+import fnmatch
+import functools
+import importlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from embedding_service import is_loaded, load_seconds
+from prompt_cache import word_groups
+from response_cache import SummaryCsv
+
+SCRIPTS = {
+    'claude37sonnet_p1': 'anthropic',
+    'claude37sonnet_p2': 'anthropic',
+    'claude41_p1': 'anthropic',
+    'claude41_p2': 'anthropic',
+    'gpt4o_p1': 'openai',
+    'gpt4o_p2': 'openai',
+    'gpt41_p1': 'openai',
+    'gpt41_p2': 'openai',
+    'gemini25pro_p1': 'gemini',
+    'gemini25pro_p2': 'gemini',
+}
+OUTPUT_ROOT = "vastused_koos"
+# HTTP olekukoodid, mille korral päringut korratakse
+RETRY_STATUS = {408, 429, 500, 502, 503, 504, 529}
+MAX_RETRIES = 6
+MAX_BACKOFF_SECONDS = 60
+
+
+class ProviderAdapter:
+    def __init__(self, name: str, max_in_flight: int):
+        """
+        Concurrency limit and retries of one API provider
+
+        Args:
+            name: Provider name
+            max_in_flight: Requests kept in flight at the same time
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.requests = 0
+        self.retries = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def status_code(error: Exception) -> Optional[int]:
+        """HTTP status of an SDK error (anthropic/openai: status_code, google-genai: code)"""
+        for attr in ('status_code', 'code'):
+            value = getattr(error, attr, None)
+            if isinstance(value, int):
+                return value
+        return None
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            return float(headers.get('retry-after'))
+        except (TypeError, ValueError):
+            return None
+
+    def wrap(self, get_completion: Callable[..., str]) -> Callable[..., str]:
+        """get_completion of a script with retries on rate limits and overload"""
+        @functools.wraps(get_completion)
+        def completion(*args, **kwargs):
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    reply = get_completion(*args, **kwargs)
+                    with self._lock:
+                        self.requests += 1
+                    return reply
+                except Exception as e:
+                    status = self.status_code(e)
+                    if attempt == MAX_RETRIES or status not in RETRY_STATUS:
+                        raise
+                    delay = self.retry_after(e) or min(MAX_BACKOFF_SECONDS, 2 ** attempt) + random.random()
+                    with self._lock:
+                        self.retries += 1
+                    print(f"⏳ {self.name}: {status}, uus katse {delay:.0f} s pärast")
+                    time.sleep(delay)
+        return completion
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix=self.name)
+        return self._executor.submit(fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+PROVIDERS = {
+    'anthropic': ProviderAdapter('anthropic', int(os.getenv("ANTHROPIC_MAX_IN_FLIGHT", 8))),
+    'openai': ProviderAdapter('openai', int(os.getenv("OPENAI_MAX_IN_FLIGHT", 8))),
+    'gemini': ProviderAdapter('gemini', int(os.getenv("GEMINI_MAX_IN_FLIGHT", 4))),
+}
+
+
+def select_scripts(patterns: List[str]) -> List[str]:
+    if not patterns:
+        return list(SCRIPTS)
+    selected = []
+    for pattern in patterns:
+        matches = [name for name in SCRIPTS if fnmatch.fnmatch(name, pattern)]
+        if not matches:
+            raise ValueError(f"No script matches '{pattern}', expected one of {list(SCRIPTS)}")
+        selected.extend(name for name in matches if name not in selected)
+    return selected
+
+
+def load_script(name: str, output_root: str = OUTPUT_ROOT):
+    """Import a script, send its answers to its own folder and route its requests through the provider"""
+    module = importlib.import_module(f"katse3_skript_{name}")
+    module.OUTPUT_FOLDER = os.path.join(output_root, name)
+    os.makedirs(module.OUTPUT_FOLDER, exist_ok=True)
+    module.get_completion = PROVIDERS[SCRIPTS[name]].wrap(module.get_completion)
+    return module
+
+
+def load_scripts(names: List[str], output_root: str = OUTPUT_ROOT) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Load the scripts one by one; a script whose SDK, client or API key fails is skipped
+
+    Returns:
+        (loaded modules by name, error message by skipped name)
+    """
+    modules, skipped = {}, {}
+    for name in names:
+        try:
+            modules[name] = load_script(name, output_root)
+        except Exception as e:
+            skipped[name] = f"{type(e).__name__}: {e}"
+            print(f"⚠️ {name} jäetakse vahele: {skipped[name]}")
+    return modules, skipped
+
+
+def read_items(module) -> List[Any]:
+    """Words, or (word, definition) pairs, from the script's own input file"""
+    if hasattr(module, 'read_word_definitions'):
+        return module.read_word_definitions() or []
+    return module.read_words()
+
+
+def is_definition_script(module) -> bool:
+    return hasattr(module, 'process_definition_analysis')
+
+
+def empty_item_rows(module, item) -> List[Dict[str, Any]]:
+    """The script's placeholder rows for an item that could not be processed"""
+    if is_definition_script(module):
+        return [module.empty_row(*item)]
+    return module.empty_rows(item)
+
+
+def process_item(module, item) -> List[Dict[str, Any]]:
+    """Rows of one word (or word and definition); the script's empty rows if it failed"""
+    try:
+        if is_definition_script(module):
+            result = module.process_definition_analysis(*item)
+        else:
+            result = module.process_word_analysis(item)
+    except Exception as e:
+        print(f"❌ Viga ({module.MODEL}, {item}): {e}")
+        result = None
+    if not result:
+        return empty_item_rows(module, item)
+    return [result] if is_definition_script(module) else result
+
+
+def process_items(module, items: List[Any]) -> List[List[Dict[str, Any]]]:
+    """Rows of each item, processed one after another"""
+    return [process_item(module, item) for item in items]
+
+
+def work_units(module, items: List[Any]) -> List[List[int]]:
+    """Item indices run together: all definitions of a word back-to-back, otherwise one item each"""
+    if is_definition_script(module):
+        return word_groups(items)
+    return [[i] for i in range(len(items))]
+
+
+def open_summary(module) -> SummaryCsv:
+    """The script's summary CSV, appended to as items complete (replaced on close)"""
+    return SummaryCsv(os.path.join(module.OUTPUT_FOLDER, module.FINAL_CSV), module.FIELDNAMES)
+
+
+def process_unit(module, items: List[Any], summary: SummaryCsv) -> List[List[Dict[str, Any]]]:
+    """Rows of each item of a work unit, written to the summary as soon as the unit is done"""
+    item_rows = process_items(module, items)
+    summary.append([row for unit_rows in item_rows for row in unit_rows])
+    return item_rows
+
+
+def run(names: List[str], output_root: str = OUTPUT_ROOT) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Run the word x model matrix of the given scripts
+
+    Items are submitted word by word across all scripts, so every provider
+    has work from the start; each provider runs up to max_in_flight of them
+    at a time. The definitions of a word run in order in one task, so their
+    shared context prefix is read from the provider's prompt cache.
+
+    Scripts that cannot be loaded are skipped and reported at the end.
+
+    Args:
+        names: Script names (keys of SCRIPTS)
+        output_root: Folder for the answers of all scripts
+
+    Returns:
+        Rows of every script that ran, in input order
+    """
+    started = time.perf_counter()
+    modules, skipped = load_scripts(names, output_root)
+    names = [name for name in names if name in modules]
+    items = {name: read_items(module) for name, module in modules.items()}
+    total = sum(len(v) for v in items.values())
+    print(f"🚀 {len(names)} skripti, {total} päringut "
+          f"({', '.join(f'{p.name} × {p.max_in_flight}' for p in PROVIDERS.values() if p.name in {SCRIPTS[n] for n in names})})")
+
+    units = {name: work_units(modules[name], items[name]) for name in names}
+    # Read lisatakse koondfaili kohe, katkestuse korral jäävad tehtud read .part faili
+    summaries = {name: open_summary(modules[name]) for name in names}
+    futures: Dict[str, List[Tuple[List[int], Future]]] = {name: [] for name in names}
+    for i in range(max((len(v) for v in units.values()), default=0)):
+        for name in names:
+            if i < len(units[name]):
+                unit = units[name][i]
+                future = PROVIDERS[SCRIPTS[name]].submit(process_unit, modules[name],
+                                                         [items[name][j] for j in unit], summaries[name])
+                futures[name].append((unit, future))
+
+    results = {}
+    for name in names:
+        item_rows: List[List[Dict[str, Any]]] = [[] for _ in items[name]]
+        for unit, future in futures[name]:
+            for j, unit_rows in zip(unit, future.result()):
+                item_rows[j] = unit_rows
+        rows = [row for unit_rows in item_rows for row in unit_rows]
+        results[name] = rows
+        # Koondfail lõpuks sisendi järjekorras
+        summaries[name].rewrite(rows)
+        summaries[name].close()
+        print(f"📁 {name}: {len(rows)} rida → {summaries[name].path}")
+        cache_stats = getattr(modules[name], 'CACHE_STATS', None)
+        if cache_stats is not None and cache_stats.requests:
+            print(f"💾 {name}: {cache_stats.summary()}")
+        print(f"♻️ {name}: {modules[name].RESPONSE_CACHE.summary()}")
+
+    for provider in PROVIDERS.values():
+        provider.shutdown()
+        if provider.requests or provider.retries:
+            print(f"📊 {provider.name}: {provider.requests} päringut, {provider.retries} kordust")
+    for name, error in skipped.items():
+        print(f"⏭️ {name}: vahele jäetud ({error})")
+    if is_loaded():
+        print(f"🧠 Vektoriseerimismudeli laadimine: {load_seconds():.1f} s")
+    elapsed = time.perf_counter() - started
+    print(f"✅ Valmis {elapsed / 60:.1f} min-ga ({total} päringut)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run katse3 prompt scripts concurrently (words x models)")
+    parser.add_argument("scripts", nargs="*", help=f"Script names or patterns (default: all of {list(SCRIPTS)})")
+    parser.add_argument("--output", default=OUTPUT_ROOT, help="Output folder")
+    args = parser.parse_args()
+    run(select_scripts(args.scripts), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#Kohalik Anthropic Message Batches ja OpenAI Batch API asendaja partiirežiimi (llm_batch.py) kontrollimiseks.
+#Vastab samadele teedele sama JSON-kujuga kui päris API (partii loomine, olek, tulemused, failide üles- ja
+#allalaadimine), aga vastused genereeritakse kohapeal. Partii valmimise aeg ja vigased päringud on seadistatavad.
+#
+#Käivitamine eraldi: python mock_batch_server.py 8766
+#Skriptid kasutavad asendajat keskkonnamuutujatega:
+#  ANTHROPIC_BASE_URL=http://127.0.0.1:8766  OPENAI_BASE_URL=http://127.0.0.1:8766/v1
+
+import json
+import sys
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+
+def default_responder(params: Dict) -> str:
+    """Reply text of a mock completion: names the model and the size of the prompt"""
+    size = sum(len(str(message.get('content', ''))) for message in params.get('messages', []))
+    size += len(str(params.get('system', '')))
+    return f"Mock-vastus mudelilt {params.get('model')} ({size} märki sisendit)"
+
+
+class MockBatchServer:
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 complete_after: float = 0.0,
+                 fail_every: int = 0,
+                 responder: Callable[[Dict], str] = default_responder):
+        """
+        Threaded HTTP server that imitates the Anthropic and OpenAI batch APIs
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            complete_after: Seconds after creation when a batch is reported finished
+            fail_every: Make every N-th request of a batch fail (0 = never)
+            responder: Function from request params to the reply text
+        """
+        self.complete_after = complete_after
+        self.fail_every = fail_every
+        self.responder = responder
+
+        self._lock = threading.RLock()
+        self.files: Dict[str, bytes] = {}
+        self.anthropic_batches: Dict[str, Dict] = {}
+        self.openai_batches: Dict[str, Dict] = {}
+        self.requests: Dict[str, int] = {}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL for ANTHROPIC_BASE_URL (add /v1 for OPENAI_BASE_URL)"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _finished(self, batch: Dict) -> bool:
+        return time.time() >= batch['_created'] + self.complete_after
+
+    def _fails(self, i: int) -> bool:
+        return bool(self.fail_every) and (i + 1) % self.fail_every == 0
+
+    # --- Anthropic ---
+    def _anthropic_view(self, batch: Dict) -> Dict:
+        ended = self._finished(batch)
+        total = len(batch['_requests'])
+        failed = sum(1 for i in range(total) if self._fails(i))
+        return {
+            'id': batch['id'],
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else total,
+                'succeeded': total - failed if ended else 0,
+                'errored': failed if ended else 0,
+                'canceled': 0,
+                'expired': 0,
+            },
+            'created_at': batch['created_at'],
+            'ended_at': batch['created_at'] if ended else None,
+            'expires_at': batch['created_at'],
+            'archived_at': None,
+            'cancel_initiated_at': None,
+            'results_url': f"{self.url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def create_anthropic_batch(self, body: Dict) -> Dict:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        batch = {'id': batch_id, '_requests': body['requests'], '_created': time.time(),
+                 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        with self._lock:
+            self.anthropic_batches[batch_id] = batch
+        return self._anthropic_view(batch)
+
+    def anthropic_results(self, batch: Dict) -> bytes:
+        lines = []
+        for i, request in enumerate(batch['_requests']):
+            params = request['params']
+            if self._fails(i):
+                result = {'type': 'errored', 'error': {'type': 'error',
+                                                       'error': {'type': 'api_error', 'message': 'mock failure'}}}
+            else:
+                result = {'type': 'succeeded', 'message': {
+                    'id': f"msg_{i}",
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': params.get('model'),
+                    'content': [{'type': 'text', 'text': self.responder(params)}],
+                    'stop_reason': 'end_turn',
+                    'stop_sequence': None,
+                    'usage': {'input_tokens': 0, 'output_tokens': 0},
+                }}
+            lines.append(json.dumps({'custom_id': request['custom_id'], 'result': result}, ensure_ascii=False))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    # --- OpenAI ---
+    def create_file(self, data: bytes, filename: str, purpose: str) -> Dict:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self._lock:
+            self.files[file_id] = data
+        return {'id': file_id, 'object': 'file', 'bytes': len(data), 'created_at': int(time.time()),
+                'filename': filename, 'purpose': purpose, 'status': 'processed'}
+
+    def _openai_view(self, batch: Dict) -> Dict:
+        with self._lock:
+            if self._finished(batch) and batch['status'] != 'completed':
+                self._complete_openai_batch(batch)
+        return {key: value for key, value in batch.items() if not key.startswith('_')}
+
+    def _complete_openai_batch(self, batch: Dict):
+        requests = [json.loads(line) for line in self.files[batch['input_file_id']].decode('utf-8').splitlines()
+                    if line.strip()]
+        lines = []
+        for i, request in enumerate(requests):
+            if self._fails(i):
+                response = {'status_code': 500, 'request_id': f"req_{i}",
+                            'body': {'error': {'message': 'mock failure', 'type': 'server_error'}}}
+            else:
+                params = request['body']
+                response = {'status_code': 200, 'request_id': f"req_{i}", 'body': {
+                    'id': f"chatcmpl-{i}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': params.get('model'),
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': self.responder(params)}}],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                }}
+            lines.append(json.dumps({'id': f"batch_req_{i}", 'custom_id': request['custom_id'],
+                                     'response': response, 'error': None}, ensure_ascii=False))
+        output = self.create_file(('\n'.join(lines) + '\n').encode('utf-8'), 'output.jsonl', 'batch_output')
+        failed = sum(1 for i in range(len(requests)) if self._fails(i))
+        batch.update({'status': 'completed', 'output_file_id': output['id'], 'completed_at': int(time.time()),
+                      'request_counts': {'total': len(requests), 'completed': len(requests) - failed,
+                                         'failed': failed}})
+
+    def create_openai_batch(self, body: Dict) -> Dict:
+        if body.get('input_file_id') not in self.files:
+            raise KeyError(body.get('input_file_id'))
+        batch = {
+            'id': f"batch_{uuid.uuid4().hex[:24]}",
+            'object': 'batch',
+            'endpoint': body.get('endpoint'),
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': int(time.time()),
+            'completed_at': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            '_created': time.time(),
+        }
+        with self._lock:
+            self.openai_batches[batch['id']] = batch
+        return self._openai_view(batch)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _count(self, method: str, path: str):
+                with server._lock:
+                    key = f"{method} {path}"
+                    server.requests[key] = server.requests.get(key, 0) + 1
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def do_GET(self):
+                parts = urlparse(self.path).path.strip('/').split('/')
+                self._count('GET', '/' + '/'.join(parts[:3]))
+                if parts[:3] == ['v1', 'messages', 'batches'] and len(parts) >= 4:
+                    batch = server.anthropic_batches.get(parts[3])
+                    if batch is None:
+                        return self._send(404, {'error': {'type': 'not_found_error', 'message': parts[3]}})
+                    if len(parts) == 5 and parts[4] == 'results':
+                        if not server._finished(batch):
+                            return self._send(409, {'error': {'type': 'invalid_request_error',
+                                                              'message': 'batch still processing'}})
+                        return self._send_raw(200, server.anthropic_results(batch), 'application/binary')
+                    return self._send(200, server._anthropic_view(batch))
+                if parts[:2] == ['v1', 'batches'] and len(parts) == 3:
+                    batch = server.openai_batches.get(parts[2])
+                    if batch is None:
+                        return self._send(404, {'error': {'message': parts[2]}})
+                    return self._send(200, server._openai_view(batch))
+                if parts[:2] == ['v1', 'files'] and len(parts) == 4 and parts[3] == 'content':
+                    data = server.files.get(parts[2])
+                    if data is None:
+                        return self._send(404, {'error': {'message': parts[2]}})
+                    return self._send_raw(200, data, 'application/octet-stream')
+                self._send(404, {'error': {'message': f"Unknown path: {self.path}"}})
+
+            def do_POST(self):
+                path = urlparse(self.path).path.rstrip('/')
+                self._count('POST', path)
+                body = self._body()
+                try:
+                    if path == '/v1/messages/batches':
+                        return self._send(200, server.create_anthropic_batch(json.loads(body)))
+                    if path == '/v1/batches':
+                        return self._send(200, server.create_openai_batch(json.loads(body)))
+                    if path == '/v1/files':
+                        fields = self._multipart(body)
+                        data, filename = fields.get('file', (b'', 'upload'))
+                        purpose = fields.get('purpose', (b'', None))[0].decode('utf-8')
+                        return self._send(200, server.create_file(data, filename, purpose))
+                except (KeyError, ValueError) as e:
+                    return self._send(400, {'error': {'type': 'invalid_request_error', 'message': str(e)}})
+                self._send(404, {'error': {'message': f"Unknown path: {self.path}"}})
+
+            def _multipart(self, body: bytes) -> Dict[str, tuple]:
+                header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+                message = BytesParser(policy=HTTP).parsebytes(header + body)
+                fields = {}
+                for part in message.iter_parts():
+                    name = part.get_param('name', header='content-disposition')
+                    fields[name] = (part.get_payload(decode=True) or b'', part.get_filename())
+                return fields
+
+            def _send(self, status: int, body: Dict):
+                self._send_raw(status, json.dumps(body, ensure_ascii=False).encode('utf-8'),
+                               'application/json; charset=utf-8')
+
+            def _send_raw(self, status: int, data: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'MockBatchServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8766
+    server = MockBatchServer(port=port)
+    print(f"🧪 Mock batch API at {server.url} (ANTHROPIC_BASE_URL={server.url}, "
+          f"OPENAI_BASE_URL={server.url}/v1; Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#Sõna konteksti eesliite vahemälu katse3 p2 skriptidele.
+#p2 skriptides saadetakse iga (sõna, tähendus) paar eraldi päringuna, aga sõna kontekst (sageli 100k+ tokenit)
+#on kõigil tema tähendustel sama. Kontekst pannakse päringu algusesse (Anthropic: süsteemiplokk märgendiga
+#cache_control, OpenAI: automaatne eesliite vahemälu), tähendusepõhine prompt selle järele ja sõna tähendused
+#saadetakse järjest, nii et teenusepakkuja loeb korduva eesliite vahemälust. Vahemälust loetud tokenid
+#loetakse kokku ja näidatakse päringute kaupa ning käivituse lõpus.
+
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+CACHE_CONTROL = {"type": "ephemeral"}
+CONTEXT_HEADER = "Etteantud tekstimaterjal:\n\n"
+
+
+def cached_block(text: str) -> Dict[str, Any]:
+    """Anthropic text block that ends a cacheable prompt prefix"""
+    return {"type": "text", "text": text, "cache_control": dict(CACHE_CONTROL)}
+
+
+def word_groups(items: Sequence[Tuple[str, str]]) -> List[List[int]]:
+    """
+    Indices of (word, definition) items grouped by word
+
+    Words keep the order of their first appearance and the definitions of a
+    word keep their input order, so each word's requests can run back-to-back.
+
+    Args:
+        items: (word, definition) pairs in input order
+
+    Returns:
+        One list of item indices per word
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, (word, _) in enumerate(items):
+        groups.setdefault(word, []).append(i)
+    return list(groups.values())
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def usage_tokens(usage: Any) -> Tuple[int, int, int]:
+    """
+    Input tokens of a response usage object or dict
+
+    Anthropic reports uncached, cache read and cache write tokens separately;
+    OpenAI reports all prompt tokens with the cached part in prompt_tokens_details.
+
+    Returns:
+        (all input tokens, tokens read from cache, tokens written to cache)
+    """
+    if _field(usage, 'prompt_tokens') is not None:
+        cached = _field(_field(usage, 'prompt_tokens_details'), 'cached_tokens') or 0
+        return _field(usage, 'prompt_tokens') or 0, cached, 0
+    read = _field(usage, 'cache_read_input_tokens') or 0
+    written = _field(usage, 'cache_creation_input_tokens') or 0
+    return (_field(usage, 'input_tokens') or 0) + read + written, read, written
+
+
+class CacheStats:
+    def __init__(self):
+        """Input and cache hit token totals of one script"""
+        self.requests = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.written_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage: Any) -> str:
+        """Add the usage of one response; returns a line describing it"""
+        total, cached, written = usage_tokens(usage)
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += total
+            self.cached_tokens += cached
+            self.written_tokens += written
+        line = f"💾 Vahemälust {cached}/{total} sisendtokenit"
+        return line + (f", vahemällu kirjutatud {written}" if written else "")
+
+    def summary(self) -> str:
+        share = self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+        return (f"{self.requests} päringut, vahemälust {self.cached_tokens}/{self.input_tokens} "
+                f"sisendtokenit ({share:.0%}), vahemällu kirjutatud {self.written_tokens}")
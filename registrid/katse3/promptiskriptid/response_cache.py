@@ -0,0 +1,143 @@
+#Vastuste vahemälu ja jätkamine katse3 skriptidele.
+#Iga mudeli toorvastus salvestatakse kausta response_cache/ võtmega (mudel, temperatuur, prompti räsi,
+#konteksti räsi). Uuel käivitusel küsitakse API-lt ainult puuduvaid või muutunud päringuid, vahemälus olevad
+#vastused parsitakse kohapeal uuesti. Koondfaili read kirjutatakse kohe pärast iga sõna töötlemist ajutisse
+#faili (vastused_koond.csv.part), mis asendab koondfaili alles käivituse lõpus. Uus käivitus ei kustuta seega
+#eelmise käivituse koondfaili ja katkenud käivituse tulemused jäävad .part faili alles.
+
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+CACHE_FOLDER = "response_cache"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, model: str, temperature: float, folder: str = CACHE_FOLDER):
+        """
+        Durable cache of raw model replies
+
+        Args:
+            model: Model name (part of the key)
+            temperature: Sampling temperature (part of the key)
+            folder: Folder of the reply files
+        """
+        self.model = model
+        self.temperature = temperature
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, prompt: str, context: str) -> str:
+        """Cache key of a request: hash of (model, temperature, prompt hash, context hash)"""
+        parts = [self.model, repr(self.temperature), text_hash(prompt), text_hash(context)]
+        return text_hash("\n".join(parts))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached reply, or None if there is none"""
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)["reply"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, reply: str, prompt: Optional[str] = None, context: Optional[str] = None):
+        """Store a reply (written to a temporary file first, so a crash never leaves half a file)"""
+        entry = {
+            'model': self.model,
+            'temperature': self.temperature,
+            'prompt_hash': text_hash(prompt) if prompt is not None else None,
+            'context_hash': text_hash(context) if context is not None else None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'reply': reply,
+        }
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def complete(self, get_completion: Callable[[str, str], str], prompt: str, context: str) -> str:
+        """
+        Reply from the cache, or from the model if the request is new
+
+        Empty replies (failed requests) are not stored, so they are asked
+        again on the next run. misses counts the requests sent to the model,
+        including those that raised.
+        """
+        key = self.key(prompt, context)
+        reply = self.get(key)
+        if reply is not None:
+            with self._lock:
+                self.hits += 1
+            print("♻️ Vastus vastuste vahemälust")
+            return reply
+        with self._lock:
+            self.misses += 1
+        reply = get_completion(prompt, context)
+        if reply:
+            self.put(key, reply, prompt, context)
+        return reply
+
+    def summary(self) -> str:
+        return f"{self.hits} vastust vahemälust, {self.misses} uut päringut"
+
+
+class SummaryCsv:
+    def __init__(self, path: str, fieldnames: List[str]):
+        """
+        Summary CSV that is appended to as rows become ready
+
+        Rows go to a temporary '.part' file that replaces the CSV on close,
+        so the previous run's CSV stays intact until this run has finished.
+
+        Args:
+            path: CSV file (replaced on close)
+            fieldnames: Columns
+        """
+        self.path = path
+        self.tmp_path = path + ".part"
+        self._lock = threading.Lock()
+        self.fieldnames = fieldnames
+        self._file = None
+        self._writer = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.tmp_path, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
+        self._writer.writeheader()
+        self._file.flush()
+
+    def append(self, rows: List[Dict[str, Any]]):
+        with self._lock:
+            for row in rows:
+                self._writer.writerow(row)
+            self._file.flush()
+
+    def rewrite(self, rows: List[Dict[str, Any]]):
+        """Replace the file contents with the given rows (e.g. to restore input order)"""
+        with self._lock:
+            self._file.close()
+            self._open()
+        self.append(rows)
+
+    def close(self):
+        """Finish the file: the written rows replace the CSV"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.replace(self.tmp_path, self.path)
@@ -0,0 +1,156 @@
+#Lõikude valik suurtest kontekstifailidest (ühine katse3 promptiskriptidele).
+#e5 vektorid normaliseeritakse ja neid võrreldakse skalaarkorrutisega (= koosinussarnasus), nagu
+#mudelit on mõeldud kasutama. Väiksemate failide jaoks on täpne indeks, väga suurte jaoks HNSW.
+#Otsing küsib indeksilt ainult k parimat lõiku, mitte kõigi ridade järjestust.
+#Vektorid tulevad ühisest hoidlast (embedding_store.py); indeksi vahemälu võti on ridade ja mudeli räsi.
+#prefetch_index ehitab järgmise sõna indeksi taustal, samal ajal kui käimas on keelemudeli päring.
+
+import hashlib
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from embedding_pipeline import embed_batches, embed_file, iter_context_lines
+from embedding_service import EMBED_MODEL_ID, get_embed_model
+from embedding_store import get_store, model_tag
+
+VECTOR_CACHE = "vector_cache"
+# Alates sellest ridade arvust kasutatakse ligikaudset HNSW indeksit
+HNSW_MIN_LINES = 20000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 256
+
+_index_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_index_locks_lock = threading.Lock()
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
+
+
+def embed_query(query: str) -> np.ndarray:
+    query_vec = get_embed_model().encode([f"query: {query}"], normalize_embeddings=True,
+                                         show_progress_bar=False)
+    return np.ascontiguousarray(query_vec, dtype=np.float32)
+
+
+def new_index(dim: int, size: int):
+    """Exact inner-product index for small files, HNSW for very large ones"""
+    if size < HNSW_MIN_LINES:
+        return faiss.IndexFlatIP(dim)
+    index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return index
+
+
+def build_faiss_index(chunks: List[str]):
+    embeddings = get_store().get_or_embed(chunks, embed_batches)
+    index = new_index(embeddings.shape[1], len(chunks))
+    index.add(embeddings)
+    return index, embeddings
+
+
+def index_key(chunks: List[str], model_name: str = EMBED_MODEL_ID) -> str:
+    """Hash of the model and the lines, so a changed context file or model gets a new index"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(model_tag(model_name).encode('utf-8'))
+    for chunk in chunks:
+        digest.update(chunk.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def ensure_index_exists(word: str, full_lines: List[str], cache_dir: str = VECTOR_CACHE):
+    """
+    Load the cached index of a word or build it from the embedding store
+
+    If the same index is being built in the background (prefetch_index),
+    waits for it instead of building it twice.
+
+    Returns:
+        (index, chunks) where chunks are full_lines
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, f"{word}_{index_key(full_lines)}.faiss")
+    with _index_locks_lock:
+        lock = _index_locks[index_path]
+    with lock:
+        if os.path.exists(index_path):
+            return faiss.read_index(index_path), full_lines
+
+        index, _ = build_faiss_index(full_lines)
+        faiss.write_index(index, index_path)
+        return index, full_lines
+
+
+def _prefetch(word: str, context_path: str, needs_retrieval: Callable[..., bool],
+              prepare: Optional[Callable[[str, List[str]], object]]) -> bool:
+    if not os.path.exists(context_path):
+        return False
+    lines = list(iter_context_lines(context_path))
+    if not needs_retrieval(lines, context_path):
+        return False
+    print(f"⏩ Ehitan taustal vektorindeksi ({word})")
+    if prepare is None:
+        # Vektorid arvutatakse otse failist voogedastatud ridadest, indeks loeb need siis hoidlast
+        del lines
+        embed_file(context_path)
+        lines = list(iter_context_lines(context_path))
+    (prepare or ensure_index_exists)(word, lines)
+    return True
+
+
+def prefetch_index(word: str, context_path: str, needs_retrieval: Callable[..., bool],
+                   prepare: Optional[Callable[[str, List[str]], object]] = None) -> Future:
+    """
+    Build the index of a word in a background thread
+
+    Call it for the next word before the LLM request of the current one, so
+    embedding overlaps with waiting for the API.
+
+    Args:
+        word: The word
+        context_path: Its *_full_context_only.txt file
+        needs_retrieval: Function telling whether the lines are too long for full context
+        prepare: Function (word, lines) doing the work ahead of time (default: ensure_index_exists)
+
+    Returns:
+        Future that is True if an index was built or loaded
+    """
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        _prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+    future = _prefetch_executor.submit(_prefetch, word, context_path, needs_retrieval, prepare)
+
+    def report_error(done: Future):
+        if done.exception() is not None:
+            print(f"⚠️ Taustal indekseerimine ebaõnnestus ({word}): {done.exception()}")
+
+    future.add_done_callback(report_error)
+    return future
+
+
+def search(query: str, index, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the scores and ids of the k passages most similar to the query
+
+    Returns:
+        (scores, ids), best first; HNSW may return fewer than k ids
+    """
+    k = min(k, index.ntotal)
+    if k <= 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    if isinstance(index, faiss.IndexHNSWFlat):
+        index.hnsw.efSearch = max(HNSW_EF_SEARCH, 2 * k)
+    scores, ids = index.search(embed_query(query), k)
+    found = ids[0] >= 0
+    return scores[0][found], ids[0][found]
+
+
+def get_relevant_chunks_max(query: str, chunks: List[str], index, max_k: Optional[int] = None) -> List[str]:
+    """Return the max_k chunks most similar to the query (all chunks, ranked, if max_k is None)"""
+    _, ids = search(query, index, max_k or len(chunks))
+    return [chunks[i] for i in ids]
@@ -0,0 +1,255 @@
+#Struktureeritud vastuse režiim katse3 registrianalüüsile (STRUCTURED_OUTPUT = True skriptis).
+#Vaba teksti ja §§§/-/| eraldajatega vastuse asemel küsitakse teenusepakkujalt JSON-skeemile vastavat vastust
+#(OpenAI: response_format json_schema, Anthropic: kohustuslik tööriistakutse, Gemini: response_schema).
+#Vastus kontrollitakse skeemi järgi ühe läbimisega; kui see ei vasta skeemile (katkenud JSON, puuduv väli,
+#lubamatu väärtus), küsitakse mudelilt vigade loeteluga parandatud vastust (kuni REPAIR_RETRIES korda),
+#mitte ei jäeta ridu "parsimise viga" märkega käsitsi uuesti käivitamiseks.
+
+import copy
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+REGISTERS = ("informaalsetes", "neutraalsetes-formaalsetes", "ei-kohaldu")
+CONFIDENCE_LEVELS = ("väga kindel", "pigem kindel", "pigem ebakindel", "väga ebakindel")
+REPAIR_RETRIES = 2
+TOOL_NAME = "salvesta_analuus"
+SCHEMA_NAME = "registrianaluus"
+
+JSON_INSTRUCTION = ("OLULINE: Pärast küsimustele vastamist anna kõik vastused ühe JSON-objektina, mis vastab "
+                    "etteantud skeemile. Mitme tähenduse korral käivad iga tähenduse andmed (sagedus, näited, register, "
+                    "põhjendused, märgendid) selle tähenduse objekti sisse. Kui märgendit pole, jäta märgendite loend "
+                    "tühjaks ja märgendi põhjenduseks kirjuta „ei-kohaldu“.")
+REPAIR_PROMPT = ("Oled JSON-vastuste parandaja. Paranda etteantud vastus nii, et see vastaks skeemile: säilita "
+                 "sisu, lisa puuduvad väljad ja asenda lubamatud väärtused lähimate lubatutega. Ära lisa uusi "
+                 "tähendusi ega näiteid.")
+
+
+def _text(description: str) -> Dict[str, Any]:
+    return {"type": "string", "description": description}
+
+
+def _enum(values: Sequence[str], description: str) -> Dict[str, Any]:
+    return {"type": "string", "enum": list(values), "description": description}
+
+
+def _object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "object", "properties": properties, "required": list(properties),
+            "additionalProperties": False}
+
+
+def _label_fields(labels: Sequence[str]) -> Dict[str, Any]:
+    return {
+        "margendid": {"type": "array", "items": _enum(labels, "registrimärgend"),
+                      "description": "Registrimärgendid (tühi loend, kui ei kohaldu)"},
+        "margendi_pohjendus": _text("5-10 lauseline põhjendus iga märgendi kohta või ei-kohaldu"),
+    }
+
+
+def meanings_schema(fieldnames: Sequence[str], frequencies: Sequence[str],
+                    labels: Sequence[str]) -> Dict[str, Any]:
+    """
+    JSON schema of a whole-word analysis (one object per meaning)
+
+    Args:
+        fieldnames: Summary CSV columns of the script; adds the register
+            confidence and training data fields when the script has them
+        frequencies: Frequency groups named in the prompt
+        labels: Register labels named in the prompt
+
+    Returns:
+        Schema usable by all providers (strict: every field required)
+    """
+    meaning = {
+        "tahendus": _text("Tähenduse lühikirjeldus"),
+        "sagedus": _enum(frequencies, "Sagedusrühm võrreldes sõna teiste tähendustega"),
+        "naited": {"type": "array", "items": {"type": "string"}, "description": "Näitelaused"},
+        "register": _enum(REGISTERS, "Tekstiregister"),
+        "registri_pohjendus": _text("5-10 lauseline põhjendus"),
+    }
+    if "Registri kindlus" in fieldnames:
+        meaning["registri_kindlus"] = _enum(CONFIDENCE_LEVELS, "Kindlus registri valikus")
+    if "Treeningandmete põhjendus" in fieldnames:
+        meaning["treeningandmete_pohjendus"] = _text("Treeningandmete põhjal otsustamise põhjendus või ei-kohaldu")
+    meaning.update(_label_fields(labels))
+    return _object({
+        "tahendused": {"type": "array", "items": _object(meaning), "minItems": 1},
+        "tahenduste_arv": {"type": "integer", "description": "Erinevate tähenduste arv"},
+    })
+
+
+def definition_schema(frequencies: Sequence[str], labels: Sequence[str]) -> Dict[str, Any]:
+    """JSON schema of the analysis of one given meaning"""
+    properties = {
+        "register": _enum(REGISTERS, "Tekstiregister"),
+        "registri_pohjendus": _text("5-10 lauseline põhjendus"),
+        "treeningandmete_pohjendus": _text("5-10 lauseline põhjendus või ei-kohaldu"),
+        "tahenduste_arv": {"type": "integer", "description": "Sõna erinevate tähenduste arv"},
+        "sagedus": _enum(frequencies, "Sagedusrühm võrreldes sõna teiste tähendustega"),
+        "naited": {"type": "array", "items": {"type": "string"}, "description": "Näited etteantud materjalist"},
+    }
+    properties.update(_label_fields(labels))
+    return _object(properties)
+
+
+def structured_prompt(prompt: str) -> str:
+    """The script's prompt with its free-text answer format replaced by the JSON instruction"""
+    return prompt.split("OLULINE: Pärast küsimustele vastamist")[0] + JSON_INSTRUCTION
+
+
+# --- Teenusepakkujate päringuparameetrid ---
+def openai_response_format(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"response_format": {"type": "json_schema",
+                                "json_schema": {"name": SCHEMA_NAME, "schema": schema, "strict": True}}}
+
+
+def anthropic_tool(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "tools": [{"name": TOOL_NAME, "description": "Salvestab registrianalüüsi tulemuse", "input_schema": schema}],
+        "tool_choice": {"type": "tool", "name": TOOL_NAME},
+    }
+
+
+def gemini_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Schema without additionalProperties, which Gemini's response_schema does not accept"""
+    schema = copy.deepcopy(schema)
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            node.pop("additionalProperties", None)
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return schema
+
+
+def message_text(content: Sequence[Any]) -> str:
+    """Reply text of an Anthropic message; the tool input as JSON in structured mode"""
+    for block in content or []:
+        if getattr(block, "type", None) == "tool_use":
+            return json.dumps(block.input, ensure_ascii=False)
+    for block in content or []:
+        if getattr(block, "type", "text") == "text":
+            return block.text
+    return ""
+
+
+# --- Kontroll ja parandamine ---
+_TYPES = {"object": dict, "array": list, "string": str, "integer": int}
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "") -> List[str]:
+    """
+    Check a value against the schema subset used here
+
+    Returns:
+        Error messages (empty if the value matches)
+    """
+    where = path or "vastus"
+    expected = _TYPES[schema["type"]]
+    if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+        return [f"{where}: oodati tüüpi {schema['type']}"]
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{where}: „{value}“ pole lubatud ({', '.join(schema['enum'])})")
+    if expected is dict:
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{where}: puudub väli {key}")
+        for key, item in value.items():
+            if key in schema["properties"]:
+                errors.extend(validate(item, schema["properties"][key], f"{path}.{key}" if path else key))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{where}: lubamatu väli {key}")
+    elif expected is list:
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{where}: vähemalt {schema['minItems']} elementi")
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{where}[{i}]"))
+    return errors
+
+
+def parse_structured(reply: str, schema: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """JSON object of a reply (a ```json block is accepted) and its schema errors"""
+    text = reply.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    elif "{" in text:
+        text = text[text.index("{"):]
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text)
+    except ValueError as e:
+        return None, [f"vigane JSON: {e}"]
+    errors = validate(data, schema)
+    return (None if errors else data), errors
+
+
+def load_structured(reply: str, schema: Dict[str, Any], complete: Callable[[str, str], str],
+                    retries: int = REPAIR_RETRIES) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Validated data of a reply, asking the model to repair it when needed
+
+    Args:
+        reply: Model reply
+        schema: Expected JSON schema
+        complete: get_completion of the script (same provider and schema constraint)
+        retries: Repair requests at most
+
+    Returns:
+        (data, or None if the reply could not be repaired; the last reply)
+    """
+    data, errors = parse_structured(reply, schema)
+    for _ in range(retries):
+        if not errors or not reply.strip():
+            break
+        print(f"   🔧 Vastus ei vasta skeemile ({'; '.join(errors[:3])}), küsin parandatud vastust")
+        message = "Vead:\n" + "\n".join(errors[:20]) + f"\n\nVastus:\n{reply}"
+        reply = complete(REPAIR_PROMPT, message)
+        data, errors = parse_structured(reply, schema)
+    if errors:
+        print(f"   ⚠️ Vastus ei vasta skeemile: {'; '.join(errors[:3])}")
+    return data, reply
+
+
+# --- Read koondfaili ---
+def meaning_rows(word: str, data: Dict[str, Any], fieldnames: Sequence[str]) -> List[Dict[str, Any]]:
+    """Summary rows of a validated whole-word analysis, one per meaning and label"""
+    rows = []
+    for i, meaning in enumerate(data["tahendused"], 1):
+        row = {
+            "Sõna": word,
+            "Tähenduse nr": i,
+            "Tähendus": meaning["tahendus"],
+            "Tähenduste arv kokku": data["tahenduste_arv"],
+            "Sagedus": meaning["sagedus"],
+            "Näited": " | ".join(meaning["naited"]) or "ei leitud",
+            "Tekstiregister": meaning["register"],
+            "Registri põhjendus": meaning["registri_pohjendus"],
+            "Registri kindlus": meaning.get("registri_kindlus"),
+            "Treeningandmete põhjendus": meaning.get("treeningandmete_pohjendus", "ei-kohaldu"),
+        }
+        for label in meaning["margendid"] or [None]:
+            row.update({
+                "Registrimärk": label or "ei-kohaldu",
+                "Märgendi põhjendus": meaning["margendi_pohjendus"] if label else "ei-kohaldu",
+            })
+            rows.append({key: row[key] for key in fieldnames})
+    return rows
+
+
+def definition_row(word: str, definition: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary row of a validated analysis of one meaning"""
+    return {
+        "Sõna": word,
+        "Tähendus": definition,
+        "Tekstiregister": data["register"],
+        "Registri põhjendus": data["registri_pohjendus"],
+        "Treeningandmete põhjendus": data["treeningandmete_pohjendus"],
+        "Tähenduste arv kokku": data["tahenduste_arv"],
+        "Sagedus": data["sagedus"],
+        "Näited": " | ".join(data["naited"]) or "ei leitud",
+        "Registrimärk": ",".join(data["margendid"]) or "ei-kohaldu",
+        "Märgendi põhjendus": data["margendi_pohjendus"] if data["margendid"] else "ei-kohaldu",
+    }
@@ -0,0 +1,200 @@
+#Ühine tokenite loendaja katse3 promptiskriptidele.
+#Kodeerijad laaditakse üks kord, iga kontekstifaili ridade tokenite arv loetakse üks kord ja salvestatakse
+#faili kõrvale (<kontekstifail>.tokens.json), nii et eelarve kontroll järgmistel käivitustel ei kodeeri
+#megabaite teksti uuesti. Eelarve ületamise kontroll lõpetab loendamise kohe, kui piir on ületatud, ja
+#salvestab samasse faili alampiiri (faili tokenite arv on vähemalt see), nii et sama või väiksema eelarvega
+#kontroll järgmisel käivitusel faili uuesti ei loe.
+#OpenAI mudelite jaoks on loendus täpne (tiktoken); Claude'i ja Gemini tokeniseerijaid kohapeal pole,
+#nende jaoks kasutatakse cl100k_base loendust koos teguriga (hinnang).
+
+import json
+import math
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # ilma tiktokenita hinnatakse ~4 märki tokeni kohta
+    tiktoken = None
+
+# Hinnangulised tegurid cl100k_base loenduse suhtes
+APPROX_FACTORS = {
+    'openai': 1.0,
+    'anthropic': 1.1,
+    'gemini': 1.0,
+}
+DEFAULT_ENCODING = "cl100k_base"
+LINE_CACHE_SIZE = 500_000
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding: str):
+    """Cached tiktoken encoding (None if tiktoken is not installed)"""
+    if tiktoken is None:
+        return None
+    return tiktoken.get_encoding(encoding)
+
+
+def encoding_for(provider: str, model: Optional[str] = None) -> str:
+    if provider == 'openai' and model and tiktoken is not None:
+        try:
+            return tiktoken.encoding_for_model(model).name
+        except KeyError:
+            return "o200k_base"
+    return DEFAULT_ENCODING
+
+
+class TokenCounter:
+    def __init__(self, provider: str = 'openai', model: Optional[str] = None):
+        """
+        Token counter for one provider/model
+
+        Args:
+            provider: 'openai', 'anthropic' or 'gemini'
+            model: Model name (used to pick the OpenAI encoding)
+        """
+        if provider not in APPROX_FACTORS:
+            raise ValueError(f"Unknown provider '{provider}', expected one of {list(APPROX_FACTORS)}")
+        self.provider = provider
+        self.encoding = encoding_for(provider, model)
+        self.factor = APPROX_FACTORS[provider]
+        self._lock = threading.Lock()
+        self._memo: Dict[str, int] = {}
+
+    @property
+    def key(self) -> str:
+        """Name under which per-line counts are stored"""
+        return self.encoding if tiktoken is not None else "chars/4"
+
+    def _raw_count(self, text: str) -> int:
+        n = self._memo.get(text)
+        if n is None:
+            encoder = get_encoder(self.encoding)
+            if encoder is None:
+                n = max(1, len(text) // 4)
+            else:
+                n = len(encoder.encode(text, disallowed_special=()))
+            if len(self._memo) >= LINE_CACHE_SIZE:
+                self._memo.clear()
+            self._memo[text] = n
+        return n
+
+    def _scale(self, raw: int) -> int:
+        return raw if self.factor == 1.0 else int(math.ceil(raw * self.factor))
+
+    def count(self, text: str) -> int:
+        """Tokens in a text (cached, so repeated lines are encoded once)"""
+        return self._scale(self._raw_count(text))
+
+    @staticmethod
+    def _read_saved(context_path: str) -> Optional[Dict]:
+        """Saved counts of the context file (None if missing or the file has changed since)"""
+        path = context_path + ".tokens.json"
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        stat = os.stat(context_path)
+        if saved.get('size') != stat.st_size or saved.get('mtime_ns') != stat.st_mtime_ns:
+            return None
+        return saved
+
+    def _load_line_counts(self, context_path: str, lines: List[str]) -> Optional[List[int]]:
+        saved = self._read_saved(context_path)
+        if saved is None:
+            return None
+        counts = saved.get('counts', {}).get(self.key)
+        if counts is None or len(counts) != len(lines):
+            return None
+        # Salvestatud loendused ka mällu, et lõikude valik ridu uuesti ei kodeeriks
+        if len(self._memo) + len(lines) <= LINE_CACHE_SIZE:
+            self._memo.update(zip(lines, counts))
+        return counts
+
+    def _load_lower_bound(self, context_path: str) -> int:
+        """Raw token count the whole file is known to reach (0 if unknown)"""
+        saved = self._read_saved(context_path)
+        if saved is None:
+            return 0
+        return saved.get('at_least', {}).get(self.key, 0)
+
+    def _save(self, context_path: str, section: str, value):
+        path = context_path + ".tokens.json"
+        stat = os.stat(context_path)
+        with self._lock:
+            saved = self._read_saved(context_path) or {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            saved.setdefault(section, {})[self.key] = value
+            with open(path + '.part', 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(path + '.part', path)
+
+    def _save_line_counts(self, context_path: str, counts: List[int]):
+        self._save(context_path, 'counts', counts)
+
+    def _save_lower_bound(self, context_path: str, raw_total: int):
+        if raw_total > self._load_lower_bound(context_path):
+            self._save(context_path, 'at_least', raw_total)
+
+    def line_counts(self, lines: List[str], context_path: Optional[str] = None) -> List[int]:
+        """
+        Raw token count of every line, read from / saved next to the context file
+
+        Args:
+            lines: Lines of the context file
+            context_path: The context file (counts are not persisted if None)
+        """
+        if context_path:
+            counts = self._load_line_counts(context_path, lines)
+            if counts is not None:
+                return counts
+        counts = [self._raw_count(line) for line in lines]
+        if context_path:
+            self._save_line_counts(context_path, counts)
+        return counts
+
+    def count_lines(self, lines: List[str], context_path: Optional[str] = None,
+                    separator: str = "\n", budget: Optional[int] = None) -> int:
+        """
+        Tokens of the lines joined with the separator
+
+        The joined count is the sum of per-line counts plus the separators,
+        which is a close upper estimate of encoding the joined text.
+
+        Args:
+            lines: Lines of the context file
+            context_path: The context file, for persisted per-line counts
+            separator: String between lines
+            budget: If given and no saved counts exist, stop counting as soon as
+                    the total reaches the budget (the returned total is then >= budget).
+                    The partial total is saved as a lower bound for the file, so a later
+                    check against the same or a smaller budget does not count again.
+        """
+        separator_tokens = self._raw_count(separator) if lines else 0
+        saved = self._load_line_counts(context_path, lines) if context_path else None
+        if saved is None and budget is not None:
+            if context_path:
+                bound = self._load_lower_bound(context_path)
+                if self._scale(bound) >= budget:
+                    return self._scale(bound)
+            total = 0
+            for i, line in enumerate(lines):
+                total += self._raw_count(line) + (separator_tokens if i else 0)
+                if self._scale(total) >= budget:
+                    if context_path:
+                        self._save_lower_bound(context_path, total)
+                    return self._scale(total)
+            # Kogu fail loeti niikuinii läbi: salvesta ridade loendused
+            if context_path:
+                self._save_line_counts(context_path, [self._raw_count(line) for line in lines])
+            return self._scale(total)
+        counts = saved if saved is not None else self.line_counts(lines, context_path)
+        return self._scale(sum(counts) + separator_tokens * max(0, len(lines) - 1))
+
+    def exceeds(self, lines: List[str], budget: int, context_path: Optional[str] = None) -> bool:
+        """True if the joined lines need at least budget tokens (stops counting early)"""
+        return self.count_lines(lines, context_path, budget=budget) >= budget
@@ -0,0 +1,152 @@
+#Kohalik vahemälu Sketch Engine'i API vastuste jaoks.
+#Võti on päringu sisu räsi (otspunkt, korpus, CQL-päring, lehekülg, konteksti seaded jm parameetrid),
+#kirjed aeguvad TTL-i järel ja kui vahemälu kasvab üle lubatud suuruse, eemaldatakse kõige kauem kasutamata kirjed.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.getenv("SKE_CACHE", "ske_cache.sqlite")
+
+# Neid parameetreid võtmesse ei panda (isikuandmed, vastust ei mõjuta)
+IGNORED_PARAMS = {'username', 'api_key'}
+
+
+def make_cache_key(endpoint: str, params: Dict) -> str:
+    """
+    Build a content-addressed key for a Sketch Engine request
+
+    Args:
+        endpoint: Endpoint name, e.g. "view"
+        params: Query parameters (credentials are ignored)
+
+    Returns:
+        SHA-256 hex digest of the canonical request
+    """
+    relevant = {k: str(v) for k, v in params.items() if k not in IGNORED_PARAMS}
+    canonical = json.dumps([endpoint.strip('/'), relevant], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self,
+                 path: str = DEFAULT_CACHE_PATH,
+                 ttl: float = 30 * 24 * 3600,
+                 max_bytes: int = 2 * 1024 ** 3):
+        """
+        Open (or create) an on-disk response cache
+
+        Args:
+            path: SQLite file holding the cache
+            ttl: Time to live of an entry in seconds
+            max_bytes: Size limit for stored (compressed) responses
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY,'
+            ' endpoint TEXT,'
+            ' body BLOB,'
+            ' size INTEGER,'
+            ' created REAL,'
+            ' accessed REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_created ON responses(created)')
+        # Kirjete kogumaht hoitakse üherealises tabelis, et iga kirjutus ei peaks kogu tabelit summeerima
+        self._conn.execute('CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)')
+        self._conn.execute(
+            'INSERT OR IGNORE INTO stats (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM responses'
+        )
+        self._conn.commit()
+
+    def _add_total(self, delta: int):
+        if delta:
+            self._conn.execute('UPDATE stats SET total = total + ? WHERE id = 0', (delta,))
+
+    def _total(self) -> int:
+        return self._conn.execute('SELECT total FROM stats WHERE id = 0').fetchone()[0]
+
+    def get(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """Return the cached response or None if missing or expired"""
+        key = make_cache_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            body, created = row
+            if now - created > self.ttl:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._add_total(-len(body))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(body).decode('utf-8'))
+
+    def put(self, endpoint: str, params: Dict, response: Dict):
+        """Store a response and evict least recently used entries if needed"""
+        key = make_cache_key(endpoint, params)
+        body = zlib.compress(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, endpoint, body, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, endpoint.strip('/'), body, len(body), now, now)
+            )
+            self._add_total(len(body) - (old[0] if old else 0))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones over max_bytes"""
+        cutoff = time.time() - self.ttl
+        expired = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses WHERE created < ?', (cutoff,)
+        ).fetchone()[0]
+        if expired:
+            self._conn.execute('DELETE FROM responses WHERE created < ?', (cutoff,))
+            self._add_total(-expired)
+        total = self._total()
+        if total <= self.max_bytes:
+            return
+        to_free = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            doomed.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', doomed)
+        self._add_total(-freed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            size = self._total()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
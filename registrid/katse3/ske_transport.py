@@ -0,0 +1,211 @@
+#Ühine HTTP-kiht kõigi Sketch Engine'i API päringute jaoks (kwic_ske_api.py, katse2_sagedused.py).
+#Püsiv keep-alive ühenduste kogum, päringu aegumine, korduskatsed eksponentsiaalse ootega
+#(arvestab 429 ja Retry-After päist) ning loendurid korduskatsete ja latentsuse kohta.
+#Valikuliselt kasutatakse ske_cache.ResponseCache vahemälu, et korduvaid päringuid mitte saata.
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ske_cache import ResponseCache
+
+SKE_BASE_URL = "https://api.sketchengine.eu/bonito/run.cgi"
+
+# Staatused, mille korral tasub päringut korrata
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SkeRequestError(Exception):
+    """Raised when a Sketch Engine request still fails after all retries"""
+
+
+class TransportStats:
+    """Thread-safe counters for requests, retries and latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.cache_hits = 0
+        self.latencies: List[float] = []
+
+    def record(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+
+    def record_retry(self, status: Optional[int] = None):
+        with self._lock:
+            self.retries += 1
+            if status == 429:
+                self.rate_limited += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def summary(self) -> Dict:
+        """Return counters and latency percentiles (seconds) as a dictionary"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            summary = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'failures': self.failures,
+                'cache_hits': self.cache_hits,
+            }
+        if latencies:
+            summary['latency_mean'] = round(sum(latencies) / len(latencies), 3)
+            summary['latency_p50'] = round(latencies[len(latencies) // 2], 3)
+            summary['latency_p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+            summary['latency_max'] = round(latencies[-1], 3)
+        return summary
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"🌐 Requests: {s['requests']}, retries: {s['retries']} "
+              f"(429: {s['rate_limited']}), failures: {s['failures']}, cache hits: {s['cache_hits']}")
+        if 'latency_mean' in s:
+            print(f"   Latency mean {s['latency_mean']}s, p50 {s['latency_p50']}s, "
+                  f"p95 {s['latency_p95']}s, max {s['latency_max']}s")
+
+
+class SkeTransport:
+    def __init__(self,
+                 base_url: str = SKE_BASE_URL,
+                 auth: Optional[Tuple[str, str]] = None,
+                 timeout: Tuple[float, float] = (10, 120),
+                 max_retries: int = 5,
+                 backoff_factor: float = 1.0,
+                 max_backoff: float = 60.0,
+                 pool_size: int = 16,
+                 cache: Optional[ResponseCache] = None,
+                 max_in_flight: Optional[int] = None):
+        """
+        Initialize a pooled, retrying HTTP transport for Sketch Engine
+
+        Args:
+            base_url: Sketch Engine bonito endpoint
+            auth: Optional (username, api_key) tuple for HTTP basic auth
+            timeout: (connect, read) timeout in seconds for every request
+            max_retries: How many times a failed request is retried
+            backoff_factor: Base wait in seconds, doubled after every attempt
+            max_backoff: Upper limit for a single wait in seconds
+            pool_size: Number of keep-alive connections kept in the pool
+            cache: Optional on-disk response cache
+            max_in_flight: Global cap on concurrent HTTP requests across all threads
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.stats = TransportStats()
+        self.cache = cache
+        self._budget = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+        self.session = requests.Session()
+        if auth:
+            self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _retry_wait(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before the next attempt, honouring Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.max_backoff)
+                except ValueError:
+                    try:
+                        delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                        return min(max(delay, 0.0), self.max_backoff)
+                    except (TypeError, ValueError):
+                        pass
+        delay = self.backoff_factor * (2 ** attempt)
+        # Juhuslik nihe, et paralleelsed lõimed ei kordaks samal hetkel
+        return min(delay * (0.5 + random.random() / 2), self.max_backoff)
+
+    def _send(self, url: str, params: Dict) -> requests.Response:
+        """Send one GET, waiting for a free slot in the request budget if one is set"""
+        if self._budget is None:
+            return self.session.get(url, params=params, timeout=self.timeout)
+        with self._budget:
+            return self.session.get(url, params=params, timeout=self.timeout)
+
+    def get_json(self, endpoint: str, params: Dict) -> Dict:
+        """
+        GET a Sketch Engine endpoint and return the decoded JSON response
+
+        Args:
+            endpoint: Endpoint name, e.g. "view", "wordlist" or "freqs"
+            params: Query parameters
+
+        Returns:
+            Decoded JSON response
+
+        Raises:
+            SkeRequestError: If the request keeps failing after all retries
+        """
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, params)
+            if cached is not None:
+                self.stats.record_cache_hit()
+                return cached
+
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            started = time.perf_counter()
+            try:
+                response = self._send(url, params)
+                self.stats.record(time.perf_counter() - started)
+
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    result = response.json()
+                    # Veateateid vahemällu ei salvestata
+                    if self.cache is not None and 'error' not in result:
+                        self.cache.put(endpoint, params, result)
+                    return result
+                last_error = f"HTTP {response.status_code}"
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.stats.record(time.perf_counter() - started)
+                last_error = str(e)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # 4xx vead ja vigane JSON: kordamine ei aita
+                self.stats.record_failure()
+                raise SkeRequestError(f"{endpoint}: {e}") from e
+
+            if attempt == self.max_retries:
+                break
+
+            wait = self._retry_wait(attempt, response)
+            self.stats.record_retry(response.status_code if response is not None else None)
+            print(f"⚠️ {endpoint} failed ({last_error}), retry {attempt + 1}/{self.max_retries} in {wait:.1f}s")
+            time.sleep(wait)
+
+        self.stats.record_failure()
+        raise SkeRequestError(f"{endpoint}: giving up after {self.max_retries} retries ({last_error})")
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
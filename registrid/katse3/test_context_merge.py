@@ -0,0 +1,49 @@
+#Kontekstiakende ühendamise test Sketch Engine'i /view vastuse kujul ridadega.
+#/view rühmitab järjestikused sõned tühikuga eraldatud 'str' tükkideks ja lausepiirid on eraldi 'strc' tükid.
+
+from concordance_export import concordance_texts
+from context_merge import ContextMerger
+
+# Dokument doc1, korpuse asukohad 104..123:
+# 104 Seal oli palju seeni . | 109 Üks seen oli väga huulekas . | 115 Teine oli ka huulekas . | 120 Korjasime korvi täis .
+FIRST_HIT = {
+    'toknum': 113,
+    'Refs': ['doc1', 'blogs'],
+    'Left': [{'strc': '<s>'}, {'str': 'Seal oli palju seeni . '}, {'strc': '</s><s>'}, {'str': 'Üks seen oli väga '}],
+    'Kwic': [{'str': 'huulekas'}],
+    'Right': [{'str': ' . '}, {'strc': '</s><s>'}, {'str': 'Teine oli ka huulekas . '}, {'strc': '</s>'}],
+}
+SECOND_HIT = {
+    'toknum': 118,
+    'Refs': ['doc1', 'blogs'],
+    'Left': [{'strc': '<s>'}, {'str': 'Üks seen oli väga huulekas . '}, {'strc': '</s><s>'}, {'str': 'Teine oli ka '}],
+    'Kwic': [{'str': 'huulekas'}],
+    'Right': [{'str': ' . '}, {'strc': '</s><s>'}, {'str': 'Korjasime korvi täis . '}, {'strc': '</s>'}],
+}
+
+
+def test_chunked_view_lines_are_merged_by_token_position():
+    merger = ContextMerger()
+    lines = merger.add_page([FIRST_HIT, SECOND_HIT]) + merger.flush()
+
+    assert len(lines) == 1
+    merged = lines[0]
+    assert merged['Span'] == [104, 124]
+    assert merged['KwicPositions'] == [113, 118]
+    assert concordance_texts(merged)[3] == ("Seal oli palju seeni . Üks seen oli väga huulekas . "
+                                            "Teine oli ka huulekas . Korjasime korvi täis .")
+    report = merger.report()
+    assert report['tokens_before'] == 31
+    assert report['tokens_after'] == 20
+    assert report['misaligned'] == 0
+
+
+def test_lines_with_inconsistent_positions_are_not_merged():
+    shifted = dict(SECOND_HIT, toknum=116)
+    merger = ContextMerger()
+    lines = merger.add_page([FIRST_HIT, shifted]) + merger.flush()
+
+    assert len(lines) == 2
+    assert [line['MergedHits'] for line in lines] == [1, 1]
+    assert concordance_texts(lines[1])[3] == ' '.join(concordance_texts(SECOND_HIT)[3].split())
+    assert merger.report()['misaligned'] == 1